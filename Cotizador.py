@@ -4,19 +4,2784 @@ import numpy as np
 from datetime import datetime, timedelta
 import re
 import os
+import hashlib
+import threading
+import time
+import copy
+import csv
+import json
+import shutil
+import sqlite3
+import sys
+import unicodedata
+try:
+    import fcntl
+except ImportError:
+    # Windows: el registro de auditoría se escribe sin bloqueo entre procesos
+    fcntl = None
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from io import BytesIO
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch, mm
-from reportlab.pdfgen import canvas
-from reportlab.graphics.shapes import Drawing, Rect
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from xml.sax.saxutils import escape
+
+# ReportLab se importa en el primer PDF (cargar_reportlab), no al arrancar la aplicación
+_reportlab_cargado = False
+_reportlab_lock = threading.Lock()
+
+def cargar_reportlab():
+    """Importar ReportLab y dejar sus nombres como globales del módulo (solo la primera vez)"""
+    global _reportlab_cargado, colors, A4, inch, mm, TA_CENTER, TA_LEFT
+    global SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer, Image
+    global getSampleStyleSheet, ParagraphStyle, simpleSplit
+    if _reportlab_cargado:
+        return
+    with _reportlab_lock:
+        if _reportlab_cargado:
+            return
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer, Image
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import inch, mm
+        from reportlab.lib.enums import TA_CENTER, TA_LEFT
+        from reportlab.lib.utils import simpleSplit
+        _reportlab_cargado = True
+
+ARCHIVO_CATALOGO = "GUION PARA IA LISTADO.xlsx"
+
+COLUMNAS_PRECIO = [
+    'PRECIO CALDAS',
+    'PRECIO CALDAS CON IVA',
+    'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL',
+    'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL IVA INCLUIDO'
+]
+
+def limpiar_precio(precio):
+    """Limpiar y convertir precio a número"""
+    if pd.isna(precio):
+        return 0
+    
+    # Convertir a string y limpiar
+    precio_str = str(precio)
+    # Remover caracteres no numéricos excepto punto y coma
+    precio_limpio = re.sub(r'[^\d.,]', '', precio_str)
+    # Remover comas (separadores de miles)
+    precio_limpio = precio_limpio.replace(',', '')
+    
+    try:
+        return float(precio_limpio)
+    except ValueError:
+        return 0
+
+def formatear_pesos(valor):
+    """Formatear un valor como moneda colombiana"""
+    if pd.isna(valor) or valor == 0:
+        return "$ 0"
+    return f"$ {valor:,.0f}".replace(',', '.')
+
+def limpiar_columna_precio(serie):
+    """Limpiar una columna completa de precios de forma vectorizada.
+    
+    Produce los mismos valores que aplicar ``limpiar_precio`` celda por celda
+    y devuelve además la máscara de filas con contenido que no se pudo
+    interpretar (que, como antes, quedan en 0).
+    """
+    serie = pd.Series(serie)
+    valores = np.zeros(len(serie), dtype='float64')
+    fallidas = np.zeros(len(serie), dtype=bool)
+    
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        numeros = serie.to_numpy(dtype='float64', na_value=np.nan)
+        absolutos = np.abs(numeros)
+        # str() de estos valores usa notación científica: se limpian por la ruta de texto
+        como_texto = np.isinf(numeros) | (absolutos >= 1e16) | ((absolutos > 0) & (absolutos < 1e-4))
+        directos = ~np.isnan(numeros) & ~como_texto
+        # El limpiador por celda descarta el signo junto con los demás caracteres
+        valores[directos] = absolutos[directos]
+    else:
+        como_texto = serie.notna().to_numpy()
+    
+    if como_texto.any():
+        texto = serie[como_texto].astype(str)
+        limpio = (
+            texto.str.replace(r'[^\d.,]', '', regex=True)
+            .str.replace(',', '', regex=False)
+        )
+        numeros = pd.to_numeric(limpio, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        validos = ~np.isnan(numeros)
+        posiciones = np.flatnonzero(como_texto)
+        valores[posiciones[validos]] = numeros[validos]
+        # Las celdas en blanco no cuentan como error, solo el contenido no interpretable
+        en_blanco = (texto.str.strip() == '').to_numpy()
+        fallidas[posiciones[~validos & ~en_blanco]] = True
+    
+    return pd.Series(valores, index=serie.index, name=serie.name), fallidas
+
+def leer_catalogo_excel(file_path):
+    """Leer y limpiar el listado de precios desde Excel.
+    
+    Devuelve el DataFrame y la lista de precios que no se pudieron interpretar.
+    """
+    df = pd.read_excel(file_path, engine='openpyxl')
+    
+    # Limpiar nombres de columnas
+    df.columns = df.columns.str.strip()
+    return limpiar_catalogo(df)
+
+def limpiar_catalogo(df):
+    """Filtrar filas sin referencia o descripción y limpiar textos y precios"""
+    # Filtrar filas con referencia y descripción válidas
+    df = df.dropna(subset=['Referencia', 'DESCRIPCION'])
+    df = df[df['Referencia'].str.strip() != '']
+    df = df[df['DESCRIPCION'].str.strip() != '']
+    
+    # Normalizar columnas de texto (el listado trae referencias con espacios de relleno)
+    for col in df.columns:
+        if col not in COLUMNAS_PRECIO and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].str.strip()
+    
+    df = df.reset_index(drop=True)
+    
+    # Limpiar precios (convertir a numérico)
+    precios_invalidos = []
+    for col in COLUMNAS_PRECIO:
+        if col in df.columns:
+            limpio, fallidas = limpiar_columna_precio(df[col])
+            for fila in np.flatnonzero(fallidas):
+                precios_invalidos.append({
+                    'fila': int(fila),
+                    'referencia': df['Referencia'].iat[fila],
+                    'columna': col,
+                    'valor': str(df[col].iat[fila])
+                })
+            df[col] = limpio
+    
+    return df, precios_invalidos
+
+# IVA general, para las fuentes que solo traen precios sin IVA
+TASA_IVA = 0.19
+
+# Pares (sin IVA, con IVA) por sede: los dos precios de una sede vienen siempre de la misma fuente
+GRUPOS_PRECIO = [
+    ('PRECIO CALDAS', 'PRECIO CALDAS CON IVA'),
+    ('PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL', 'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL IVA INCLUIDO')
+]
+
+def clave_columna(nombre):
+    """Nombre de columna comparable: sin tildes, en minúsculas y con espacios simples"""
+    return ' '.join(plegar_texto(nombre).split())
+
+class FuenteCatalogo:
+    """Archivo de precios que aporta productos al catálogo.
+    
+    Cada fuente sabe leer su formato y entrega las columnas con los nombres del
+    catálogo (COLUMNAS: nombre plegado en el archivo -> columna del catálogo).
+    Sin COLUMNAS se conservan los nombres del archivo, como en el listado principal.
+    """
+    
+    MOTOR = 'openpyxl'
+    COLUMNAS = {}
+    
+    def __init__(self, ruta, nombre=None):
+        self.ruta = ruta
+        self.nombre = nombre or os.path.splitext(os.path.basename(ruta))[0]
+    
+    def __repr__(self):
+        return f'{type(self).__name__}({self.ruta!r})'
+    
+    def normalizar_columnas(self, df):
+        """Renombrar las columnas del archivo a las del catálogo"""
+        if not self.COLUMNAS:
+            return df.rename(columns=lambda col: str(col).strip())
+        renombres = {col: self.COLUMNAS.get(clave_columna(col)) for col in df.columns}
+        # Las columnas sin equivalente en el catálogo se descartan
+        df = df[[col for col, nombre in renombres.items() if nombre]]
+        return df.rename(columns=renombres)
+    
+    def completar(self, df):
+        """Agregar las columnas que la fuente no trae pero se pueden calcular"""
+        return df
+    
+    def leer(self):
+        """Leer la fuente: DataFrame con columnas del catálogo y precios no interpretables"""
+        df = self.normalizar_columnas(pd.read_excel(self.ruta, engine=self.MOTOR))
+        df, precios_invalidos = limpiar_catalogo(df)
+        for invalido in precios_invalidos:
+            invalido['fuente'] = self.nombre
+        return self.completar(df), precios_invalidos
+
+class FuenteListaPrecios(FuenteCatalogo):
+    """Lista de precios heredada del sistema anterior (.xls).
+    
+    LP1 coincide con el precio de Caldas y LP2 con el de Chagualo (ambos sin
+    IVA); LP3 no corresponde a ninguna sede y no se usa.
+    """
+    
+    MOTOR = 'xlrd'
+    COLUMNAS = {
+        'referencia': 'Referencia',
+        'desc. item': 'DESCRIPCION',
+        'lp1': 'PRECIO CALDAS',
+        'lp2': 'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL'
+    }
+    
+    def completar(self, df):
+        for sin_iva, con_iva in GRUPOS_PRECIO:
+            if con_iva not in df.columns and sin_iva in df.columns:
+                df[con_iva] = np.round(df[sin_iva] * (1 + TASA_IVA))
+        return df
+
+# Fuentes del catálogo en orden de precedencia: ante una misma referencia manda la primera
+FUENTES_CATALOGO = [
+    FuenteCatalogo(ARCHIVO_CATALOGO),
+    FuenteListaPrecios("preciosItens2 septo 2025.xls")
+]
+
+def combinar_fuentes_catalogo(tablas):
+    """Unir los catálogos de varias fuentes por Referencia.
+    
+    `tablas` es una lista de (nombre, DataFrame) en orden de precedencia:
+    - las filas de la primera fuente se conservan tal cual y en su orden; las
+      referencias nuevas de cada fuente siguiente se agregan al final
+    - cada texto vacío se completa con el de la siguiente fuente que lo tenga
+    - los precios de una sede (sin IVA y con IVA) se toman juntos de la
+      primera fuente que tenga alguno de los dos mayor que cero
+    
+    Devuelve el catálogo, los conflictos de precio (dos fuentes con precio
+    distinto para la misma referencia y sede) y un resumen por fuente.
+    """
+    nombre, combinado = tablas[0]
+    combinado = combinado.reset_index(drop=True)
+    resumen = {nombre: {'filas': len(combinado), 'agregadas': len(combinado), 'completadas': 0}}
+    conflictos = []
+    # Fuente de la que salió cada grupo de precios de cada fila
+    origen_precios = {
+        sin_iva: np.where((combinado[sin_iva] > 0) | (combinado[con_iva] > 0), nombre, None)
+        for sin_iva, con_iva in GRUPOS_PRECIO if sin_iva in combinado.columns
+    }
+    
+    for nombre, df in tablas[1:]:
+        claves_df = df['Referencia'].astype(str).str.strip().str.upper()
+        df = df[~claves_df.duplicated()].reset_index(drop=True)
+        claves_df = claves_df[~claves_df.duplicated()].reset_index(drop=True)
+        claves = combinado['Referencia'].astype(str).str.strip().str.upper()
+        posiciones = pd.Index(claves_df).get_indexer(claves)
+        presentes = posiciones >= 0
+        filas = np.flatnonzero(presentes)
+        origen = posiciones[presentes]
+        completadas = 0
+        
+        for col in df.columns:
+            if col not in combinado.columns:
+                combinado[col] = '' if col not in COLUMNAS_PRECIO else 0.0
+        for sin_iva, _ in GRUPOS_PRECIO:
+            if sin_iva in combinado.columns and sin_iva not in origen_precios:
+                # Grupo de precios que ninguna fuente anterior traía: todavía sin origen
+                origen_precios[sin_iva] = np.full(len(combinado), None, dtype=object)
+        
+        for col in df.columns:
+            if col in COLUMNAS_PRECIO or col == 'Referencia':
+                continue
+            actual = combinado[col].iloc[filas]
+            nuevo = df[col].iloc[origen]
+            vacias = (
+                (actual.isna() | (actual.astype(str).str.strip() == '')).to_numpy()
+                & (nuevo.notna() & (nuevo.astype(str).str.strip() != '')).to_numpy()
+            )
+            if vacias.any():
+                combinado.loc[filas[vacias], col] = nuevo.to_numpy()[vacias]
+                completadas += int(vacias.sum())
+        
+        for sin_iva, con_iva in GRUPOS_PRECIO:
+            if sin_iva not in df.columns:
+                continue
+            actual_sin = combinado[sin_iva].to_numpy()[filas]
+            actual_con = combinado[con_iva].to_numpy()[filas]
+            nuevo_sin = df[sin_iva].to_numpy()[origen]
+            nuevo_con = df[con_iva].to_numpy()[origen]
+            con_precio = (actual_sin > 0) | (actual_con > 0)
+            nuevo_con_precio = (nuevo_sin > 0) | (nuevo_con > 0)
+            
+            distintos = np.flatnonzero(
+                (actual_sin > 0) & (nuevo_sin > 0) & (np.round(actual_sin) != np.round(nuevo_sin))
+            )
+            for i in distintos.tolist():
+                fila = int(filas[i])
+                conflictos.append({
+                    'referencia': combinado['Referencia'].iat[fila],
+                    'columna': sin_iva,
+                    'fuente': origen_precios[sin_iva][fila],
+                    'valor': float(actual_sin[i]),
+                    'fuente_descartada': nombre,
+                    'valor_descartado': float(nuevo_sin[i])
+                })
+            
+            completar = ~con_precio & nuevo_con_precio
+            if completar.any():
+                destino = filas[completar]
+                combinado.loc[destino, sin_iva] = nuevo_sin[completar]
+                combinado.loc[destino, con_iva] = nuevo_con[completar]
+                origen_precios[sin_iva][destino] = nombre
+                completadas += int(completar.sum())
+        
+        # Referencias que solo trae esta fuente
+        nuevas = np.setdiff1d(np.arange(len(df)), origen)
+        if len(nuevas):
+            agregadas = df.iloc[nuevas].reindex(columns=combinado.columns)
+            for col in combinado.columns:
+                if col not in df.columns:
+                    agregadas[col] = 0.0 if col in COLUMNAS_PRECIO else ''
+            for sin_iva, con_iva in GRUPOS_PRECIO:
+                if sin_iva in combinado.columns:
+                    con_precio = ((agregadas[sin_iva] > 0) | (agregadas[con_iva] > 0)).to_numpy()
+                    origen_precios[sin_iva] = np.concatenate([
+                        origen_precios[sin_iva], np.where(con_precio, nombre, None)
+                    ])
+            combinado = pd.concat([combinado, agregadas], ignore_index=True)
+        
+        resumen[nombre] = {'filas': len(df), 'agregadas': len(nuevas), 'completadas': completadas}
+    
+    return combinado, conflictos, resumen
+
+def leer_fuentes_catalogo(fuentes):
+    """Leer varias fuentes a la vez y combinarlas en un solo catálogo.
+    
+    Las lecturas van en paralelo, así que el tiempo total es el de la fuente
+    más lenta y no la suma. Devuelve (catálogo, precios_invalidos, conflictos, resumen).
+    """
+    if len(fuentes) == 1:
+        df, precios_invalidos = fuentes[0].leer()
+        resumen = {fuentes[0].nombre: {'filas': len(df), 'agregadas': len(df), 'completadas': 0}}
+        return compactar_catalogo(df), precios_invalidos, [], resumen
+    
+    with ThreadPoolExecutor(max_workers=len(fuentes)) as pool:
+        lecturas = [pool.submit(fuente.leer) for fuente in fuentes]
+        resultados = [lectura.result() for lectura in lecturas]
+    
+    precios_invalidos = [invalido for _, invalidos in resultados for invalido in invalidos]
+    df, conflictos, resumen = combinar_fuentes_catalogo(
+        [(fuente.nombre, df) for fuente, (df, _) in zip(fuentes, resultados)]
+    )
+    return compactar_catalogo(df), precios_invalidos, conflictos, resumen
+
+# Un texto se guarda como categoría si tiene a lo sumo esta fracción de valores distintos
+UMBRAL_CATEGORICA = 0.5
+
+def _texto_en_objetos(serie):
+    """True si cada valor de la columna es un objeto str de Python (no un arreglo Arrow)"""
+    return serie.dtype == object or getattr(serie.dtype, 'storage', None) == 'python'
+
+def compactar_catalogo(df):
+    """Representación compacta del catálogo, con los mismos valores.
+    
+    - textos con pocos valores distintos (tipo de madera, acabado, uso...) -> category
+    - precios -> float32 cuando todos sus valores se representan exactos
+    - referencias -> cadenas internadas, compartidas con el índice de referencias
+    """
+    df = df.copy(deep=False)
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_float_dtype(serie):
+            valores = serie.to_numpy(dtype='float64')
+            compacto = valores.astype(np.float32)
+            if np.array_equal(compacto, valores, equal_nan=True):
+                df[col] = pd.Series(compacto, index=serie.index)
+        elif col == 'Referencia':
+            if _texto_en_objetos(serie):
+                df[col] = pd.Series(
+                    [sys.intern(r) if isinstance(r, str) else r for r in serie.tolist()],
+                    index=serie.index, dtype=serie.dtype
+                )
+        elif not pd.api.types.is_numeric_dtype(serie) and serie.nunique() <= UMBRAL_CATEGORICA * len(serie):
+            df[col] = serie.astype('category')
+    return df
+
+def reporte_memoria_catalogo(productos):
+    """Bytes por columna del catálogo compacto y de la misma columna sin compactar"""
+    columnas = {}
+    for col in productos.columns:
+        serie = productos[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            original = serie.astype(serie.cat.categories.dtype)
+        elif pd.api.types.is_float_dtype(serie):
+            original = serie.astype('float64')
+        else:
+            original = serie
+        columnas[col] = {
+            'tipo': str(serie.dtype),
+            'bytes_antes': int(original.memory_usage(index=False, deep=True)),
+            'bytes_despues': int(serie.memory_usage(index=False, deep=True))
+        }
+    antes = sum(c['bytes_antes'] for c in columnas.values())
+    despues = sum(c['bytes_despues'] for c in columnas.values())
+    return {
+        'columnas': columnas,
+        'bytes_antes': antes,
+        'bytes_despues': despues,
+        'ahorro': 1 - despues / antes if antes else 0.0
+    }
+
+FORMATO_SNAPSHOT = 3
+
+def ruta_snapshot_catalogo(ruta_excel):
+    """Directorio del snapshot binario asociado a un listado de precios"""
+    base, _ = os.path.splitext(ruta_excel)
+    return base + '.snapshot'
+
+def escribir_snapshot_catalogo(df, ruta_snapshot, fuentes, huella, precios_invalidos=None, conflictos=None, resumen_fuentes=None):
+    """Guardar el catálogo ya limpio como columnas .npy listas para memory-map"""
+    version = huella[:12]
+    destino = os.path.join(ruta_snapshot, version)
+    temporal = f'{destino}.tmp-{os.getpid()}-{threading.get_ident()}'
+    os.makedirs(temporal, exist_ok=True)
+    
+    columnas = []
+    for i, col in enumerate(df.columns):
+        serie = df[col]
+        entrada = {'nombre': col, 'archivo': f'col_{i:03d}.npy', 'nulos': None}
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            # Códigos por fila y valores distintos aparte (sin nulos: son el código -1)
+            entrada['tipo'] = 'categoria'
+            entrada['categorias'] = f'categorias_{i:03d}.npy'
+            np.save(
+                os.path.join(temporal, entrada['categorias']),
+                np.asarray([str(c) for c in serie.cat.categories], dtype=str)
+            )
+            valores = serie.cat.codes.to_numpy()
+        elif pd.api.types.is_numeric_dtype(serie):
+            entrada['tipo'] = 'numero'
+            # Los precios compactados a float32 se guardan así
+            valores = serie.to_numpy(dtype='float32' if serie.dtype == np.float32 else 'float64')
+        else:
+            entrada['tipo'] = 'texto'
+            nulos = serie.isna().to_numpy()
+            if nulos.any():
+                entrada['nulos'] = f'nulos_{i:03d}.npy'
+                np.save(os.path.join(temporal, entrada['nulos']), nulos)
+            valores = np.asarray(serie.fillna('').astype(str).tolist(), dtype=str)
+        np.save(os.path.join(temporal, entrada['archivo']), valores)
+        columnas.append(entrada)
+    
+    meta = {
+        'formato': FORMATO_SNAPSHOT,
+        'filas': len(df),
+        'columnas': columnas,
+        'precios_invalidos': precios_invalidos or [],
+        'conflictos': conflictos or [],
+        'resumen_fuentes': resumen_fuentes or {},
+        'huella': huella,
+        # [{'nombre', 'mtime_ns', 'tamano', 'huella'}] de cada archivo combinado
+        'fuentes': fuentes
+    }
+    with open(os.path.join(temporal, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    
+    if os.path.exists(destino):
+        shutil.rmtree(temporal, ignore_errors=True)
+    else:
+        os.replace(temporal, destino)
+    
+    # El puntero ACTUAL se reemplaza de forma atómica: un lector nunca ve una versión a medias
+    puntero = os.path.join(ruta_snapshot, 'ACTUAL')
+    with open(puntero + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(puntero + '.tmp', puntero)
+    
+    # Eliminar versiones anteriores
+    for nombre in os.listdir(ruta_snapshot):
+        ruta = os.path.join(ruta_snapshot, nombre)
+        if nombre != version and '.tmp' not in nombre and os.path.isdir(ruta):
+            shutil.rmtree(ruta, ignore_errors=True)
+    return destino
+
+def leer_meta_snapshot(ruta_snapshot):
+    """Leer los metadatos de la versión vigente del snapshot, o None si no existe"""
+    try:
+        with open(os.path.join(ruta_snapshot, 'ACTUAL'), encoding='utf-8') as f:
+            version = f.read().strip()
+        directorio = os.path.join(ruta_snapshot, version)
+        with open(os.path.join(directorio, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('formato') != FORMATO_SNAPSHOT:
+        return None
+    meta['directorio'] = directorio
+    return meta
+
+def cargar_snapshot_catalogo(meta):
+    """Construir el DataFrame del catálogo a partir de un snapshot binario"""
+    datos = {}
+    for entrada in meta['columnas']:
+        valores = np.load(os.path.join(meta['directorio'], entrada['archivo']), mmap_mode='r')
+        if entrada['tipo'] == 'numero':
+            # Las columnas numéricas quedan respaldadas directamente por el memory-map
+            datos[entrada['nombre']] = pd.Series(valores, copy=False)
+        elif entrada['tipo'] == 'categoria':
+            categorias = np.load(os.path.join(meta['directorio'], entrada['categorias']))
+            datos[entrada['nombre']] = pd.Series(pd.Categorical.from_codes(
+                np.asarray(valores), pd.Index(categorias.tolist(), dtype='str')
+            ))
+        else:
+            serie = pd.Series(valores.tolist(), dtype='str')
+            if entrada['nulos']:
+                nulos = np.load(os.path.join(meta['directorio'], entrada['nulos']))
+                serie = serie.mask(nulos)
+            datos[entrada['nombre']] = serie
+    # Las categorías y los float32 ya vienen del snapshot; falta internar las referencias
+    return compactar_catalogo(pd.DataFrame(datos, copy=False))
+
+def resolver_fuentes_catalogo(ruta=None, fuentes=None):
+    """Fuentes a cargar: un único archivo, las indicadas o las del catálogo por defecto"""
+    if ruta is not None:
+        return [FuenteCatalogo(ruta)]
+    return list(fuentes or FUENTES_CATALOGO)
+
+def compilar_snapshot_catalogo(ruta_excel=None, fuentes=None):
+    """Convertir los listados de precios en un snapshot binario (paso de build/despliegue)"""
+    fuentes = [f for f in resolver_fuentes_catalogo(ruta_excel, fuentes) if os.path.exists(f.ruta)]
+    descripcion = AlmacenCatalogo._describir_fuentes(fuentes)
+    df, precios_invalidos, conflictos, resumen = leer_fuentes_catalogo(fuentes)
+    return escribir_snapshot_catalogo(
+        df, ruta_snapshot_catalogo(fuentes[0].ruta), descripcion,
+        AlmacenCatalogo._huella_combinada(descripcion), precios_invalidos, conflictos, resumen
+    )
+
+COLUMNAS_BUSQUEDA = ['DESCRIPCION', 'TIPO MADERA', 'ACABADO DE LA MADERA', 'USO']
+
+PATRON_TOKEN = re.compile(r'[0-9a-z]+(?:[.,/][0-9a-z]+)*')
+
+def plegar_texto(texto):
+    """Pasar a minúsculas y quitar tildes para comparar sin importar acentos"""
+    descompuesto = unicodedata.normalize('NFKD', str(texto).lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+def tokenizar(texto):
+    """Dividir un texto en tokens normalizados ("2x4 (Pino)" -> ["2x4", "pino"])"""
+    return PATRON_TOKEN.findall(plegar_texto(texto))
+
+class IndiceBusqueda:
+    """Índice invertido de tokens del catálogo.
+    
+    Cada token normalizado apunta al arreglo ordenado de filas que lo contienen
+    en alguna de las columnas de búsqueda. Una consulta se resuelve con
+    búsqueda binaria por prefijo sobre el vocabulario y la intersección de
+    las listas de filas, sin recorrer el catálogo completo.
+    """
+    
+    def __init__(self, productos):
+        self._construir(self._filas_por_token(productos), productos)
+    
+    @staticmethod
+    def _filas_por_token(productos, filas=None, filas_por_token=None):
+        """Agregar a filas_por_token las filas (todas, o las indicadas) en que aparece cada token"""
+        if filas_por_token is None:
+            filas_por_token = {}
+        seleccion = productos if filas is None else productos.iloc[filas]
+        posiciones = np.arange(len(productos)) if filas is None else np.asarray(filas)
+        for col in COLUMNAS_BUSQUEDA:
+            if col not in seleccion.columns:
+                continue
+            codigos, valores = pd.factorize(seleccion[col])
+            # Filas agrupadas por valor distinto, para tokenizar cada valor una sola vez
+            orden = np.argsort(codigos, kind='stable')
+            limites = np.searchsorted(codigos[orden], np.arange(len(valores) + 1))
+            for codigo, valor in enumerate(valores):
+                filas_valor = posiciones[orden[limites[codigo]:limites[codigo + 1]]]
+                for token in set(tokenizar(valor)):
+                    filas_por_token.setdefault(token, []).append(filas_valor)
+        return filas_por_token
+    
+    def _construir(self, filas_por_token, productos):
+        self.tokens = sorted(filas_por_token)
+        # Cada parte ya viene ordenada y sin repetidos; solo se unen los tokens con varias
+        self.filas = [
+            (partes[0] if len(partes) == 1 else np.unique(np.concatenate(partes))).astype(np.int32, copy=False)
+            for partes in (filas_por_token[token] for token in self.tokens)
+        ]
+        
+        if 'TIPO MADERA' in productos.columns:
+            self.sin_inmunizar = productos['TIPO MADERA'].str.contains(
+                'SIN INMUNIZAR', case=False, na=False
+            ).to_numpy()
+        else:
+            self.sin_inmunizar = np.zeros(len(productos), dtype=bool)
+    
+    def derivar(self, productos, mapa, filas_nuevas):
+        """Índice de otra versión del catálogo, reutilizando las filas ya tokenizadas.
+        
+        `mapa` da la fila en la versión nueva de cada fila de esta (-1 si se
+        eliminó o hay que volver a tokenizarla) y `filas_nuevas` son las filas
+        de la versión nueva que se tokenizan (agregadas o con texto cambiado).
+        """
+        filas_por_token = {}
+        conservadas = mapa[mapa >= 0]
+        ordenado = bool(np.all(conservadas[1:] > conservadas[:-1]))
+        for token, filas in zip(self.tokens, self.filas):
+            movidas = mapa[filas]
+            movidas = movidas[movidas >= 0]
+            if len(movidas):
+                filas_por_token[token] = [movidas if ordenado else np.sort(movidas)]
+        if len(filas_nuevas):
+            self._filas_por_token(productos, filas_nuevas, filas_por_token)
+        
+        indice = object.__new__(IndiceBusqueda)
+        indice._construir(filas_por_token, productos)
+        return indice
+    
+    def rango_prefijo(self, prefijo):
+        """Rango [inicio, fin) del vocabulario con tokens que empiezan por el prefijo"""
+        return (
+            bisect_left(self.tokens, prefijo),
+            bisect_left(self.tokens, prefijo + '\uffff')
+        )
+    
+    def filas_prefijo(self, prefijo):
+        """Filas que contienen algún token con el prefijo dado"""
+        inicio, fin = self.rango_prefijo(prefijo)
+        if fin - inicio == 1:
+            return self.filas[inicio]
+        if fin == inicio:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(self.filas[inicio:fin]))
+    
+    def buscar(self, consulta):
+        """Filas (en orden del catálogo) que contienen todos los términos de la consulta como prefijo.
+        
+        Devuelve None si la consulta no tiene ningún término indexable.
+        """
+        terminos = set(tokenizar(consulta))
+        if not terminos:
+            return None
+        
+        candidatos = sorted((self.filas_prefijo(t) for t in terminos), key=len)
+        filas = candidatos[0]
+        for otras in candidatos[1:]:
+            if len(filas) == 0:
+                break
+            filas = np.intersect1d(filas, otras, assume_unique=True)
+        return filas
+    
+    def filtrar_inmunizacion(self, filas, solo_inmunizada):
+        """Aplicar el filtro de inmunización sobre un arreglo de filas"""
+        if solo_inmunizada is None:
+            return filas
+        sin_inmunizar = self.sin_inmunizar[filas]
+        return filas[~sin_inmunizar] if solo_inmunizada else filas[sin_inmunizar]
+
+def normalizar_referencia(referencia):
+    """Clave de búsqueda de una referencia: sin espacios de relleno y en mayúsculas"""
+    return str(referencia).strip().upper()
+
+def distancia_edicion(a, b, maximo):
+    """Distancia de Levenshtein entre dos textos, o maximo + 1 si la supera"""
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i]
+        for j, cb in enumerate(b, 1):
+            actual.append(min(
+                anterior[j] + 1,
+                actual[j - 1] + 1,
+                anterior[j - 1] + (ca != cb)
+            ))
+        if min(actual) > maximo:
+            return maximo + 1
+        anterior = actual
+    return anterior[-1]
+
+def trigramas(token):
+    """Trigramas de un token con marcas de inicio y fin"""
+    marcado = f'${token}$'
+    return {marcado[i:i + 3] for i in range(len(marcado) - 2)}
+
+class IndiceDifuso:
+    """Índice de trigramas sobre el vocabulario para búsqueda tolerante a errores.
+    
+    Los trigramas se calculan sobre los tokens distintos del catálogo (no sobre
+    las filas), así que el costo de una consulta depende del tamaño del
+    vocabulario y no del número de productos.
+    """
+    
+    # Candidatos del vocabulario que se verifican con distancia de edición
+    MAX_CANDIDATOS = 40
+    # Similitud mínima (coeficiente de Dice entre trigramas) para considerar un token
+    SIMILITUD_MINIMA = 0.3
+    
+    def __init__(self, indice, indice_referencias):
+        self.indice = indice
+        self.indice_referencias = indice_referencias
+        ids_por_trigrama = {}
+        self.trigramas_por_token = np.zeros(len(indice.tokens), dtype=np.int32)
+        for token_id, token in enumerate(indice.tokens):
+            tris = trigramas(token)
+            self.trigramas_por_token[token_id] = len(tris)
+            for tri in tris:
+                ids_por_trigrama.setdefault(tri, []).append(token_id)
+        self.ids_por_trigrama = {
+            tri: np.asarray(ids, dtype=np.int32) for tri, ids in ids_por_trigrama.items()
+        }
+    
+    def derivar(self, indice, indice_referencias):
+        """Índice difuso sobre otro índice; los trigramas se reutilizan si el vocabulario no cambió"""
+        if indice.tokens != self.indice.tokens:
+            return IndiceDifuso(indice, indice_referencias)
+        difuso = object.__new__(IndiceDifuso)
+        difuso.indice = indice
+        difuso.indice_referencias = indice_referencias
+        difuso.trigramas_por_token = self.trigramas_por_token
+        difuso.ids_por_trigrama = self.ids_por_trigrama
+        return difuso
+    
+    @staticmethod
+    def errores_permitidos(termino):
+        if len(termino) <= 3:
+            return 0
+        return 1 if len(termino) <= 6 else 2
+    
+    def tokens_similares(self, termino):
+        """Tokens del vocabulario parecidos al término, con su similitud (0 a 1]"""
+        tokens = self.indice.tokens
+        similares = {}
+        
+        # Coincidencia exacta o por prefijo
+        inicio, fin = self.indice.rango_prefijo(termino)
+        for token_id in range(inicio, fin):
+            similares[token_id] = 1.0 if tokens[token_id] == termino else 0.95
+        
+        # El término aparece dentro del token (p. ej. "300" en "8.5x2.3x300")
+        internos = [termino[i:i + 3] for i in range(len(termino) - 2)]
+        if internos and all(tri in self.ids_por_trigrama for tri in internos):
+            candidatos = self.ids_por_trigrama[internos[0]]
+            for tri in internos[1:]:
+                candidatos = np.intersect1d(candidatos, self.ids_por_trigrama[tri], assume_unique=True)
+            for token_id in candidatos.tolist():
+                if token_id not in similares and termino in tokens[token_id]:
+                    similares[token_id] = 0.8
+        
+        maximo = self.errores_permitidos(termino)
+        tris = [tri for tri in trigramas(termino) if tri in self.ids_por_trigrama]
+        if not tris or not maximo:
+            return similares
+        conteos = np.bincount(
+            np.concatenate([self.ids_por_trigrama[tri] for tri in tris]),
+            minlength=len(tokens)
+        )
+        dice = 2 * conteos / (len(trigramas(termino)) + self.trigramas_por_token)
+        orden = np.argsort(-dice, kind='stable')[:self.MAX_CANDIDATOS]
+        
+        for token_id in orden.tolist():
+            if dice[token_id] < self.SIMILITUD_MINIMA:
+                break
+            if token_id in similares:
+                continue
+            token = tokens[token_id]
+            # Se compara también contra el prefijo del token del mismo largo ("alfar" ~ "alfarda")
+            distancia = min(
+                distancia_edicion(termino, token, maximo),
+                distancia_edicion(termino, token[:len(termino)], maximo) + 1
+            )
+            if distancia <= maximo:
+                similares[token_id] = 0.9 * (1 - distancia / max(len(termino), len(token)))
+        return similares
+    
+    def buscar(self, consulta):
+        """Filas que se parecen a la consulta, ordenadas por relevancia.
+        
+        Primero las coincidencias exactas de referencia, luego las filas que
+        contienen más términos de la consulta y, a igualdad, las de mayor
+        similitud (menor distancia de edición). Los empates conservan el orden
+        del catálogo.
+        """
+        n_filas = len(self.indice.sin_inmunizar)
+        referencia = np.zeros(n_filas, dtype=bool)
+        fila_referencia = self.indice_referencias.get(normalizar_referencia(consulta))
+        if fila_referencia is not None:
+            referencia[fila_referencia] = True
+        
+        coincidencias = np.zeros(n_filas, dtype=np.int16)
+        similitud = np.zeros(n_filas, dtype=np.float32)
+        for termino in set(tokenizar(consulta)):
+            puntaje = np.zeros(n_filas, dtype=np.float32)
+            for token_id, valor in self.tokens_similares(termino).items():
+                filas = self.indice.filas[token_id]
+                puntaje[filas] = np.maximum(puntaje[filas], valor)
+            coincidencias += puntaje > 0
+            similitud += puntaje
+        
+        filas = np.flatnonzero(referencia | (coincidencias > 0))
+        orden = np.lexsort((
+            filas,
+            -similitud[filas],
+            -coincidencias[filas],
+            ~referencia[filas]
+        ))
+        return filas[orden]
+
+# Nombres de columna aceptados en los archivos de pedido (ya sin tildes y en minúsculas)
+COLUMNAS_PEDIDO = {
+    'referencia': ['referencia', 'ref', 'codigo', 'cod', 'sku', 'item'],
+    'cantidad': ['cantidad', 'cant', 'unidades', 'qty']
+}
+
+def leer_archivo_pedido(archivo):
+    """Leer un archivo de pedido CSV o Excel con columnas referencia y cantidad.
+    
+    Acepta una ruta o un archivo subido (objeto con atributo ``name``).
+    """
+    nombre = archivo if isinstance(archivo, str) else getattr(archivo, 'name', '')
+    extension = os.path.splitext(nombre)[1].lower()
+    
+    def separador():
+        # Detectado entre los separadores habituales (en Colombia es común el punto y coma);
+        # sin restringirlos, un archivo de una sola columna se partía por el guion de la referencia
+        if hasattr(archivo, 'read'):
+            archivo.seek(0)
+            muestra = archivo.read(4096)
+        else:
+            with open(archivo, 'rb') as f:
+                muestra = f.read(4096)
+        if isinstance(muestra, bytes):
+            muestra = muestra.decode('utf-8', errors='replace')
+        try:
+            return csv.Sniffer().sniff(muestra, delimiters=',;\t|').delimiter
+        except csv.Error:
+            return ','
+    
+    def leer(encabezado):
+        if hasattr(archivo, 'seek'):
+            archivo.seek(0)
+        if extension in ('.xlsx', '.xls'):
+            return pd.read_excel(archivo, dtype=str, header=encabezado)
+        return pd.read_csv(archivo, sep=sep, dtype=str, header=encabezado)
+    
+    sep = None if extension in ('.xlsx', '.xls') else separador()
+    
+    df = leer(0)
+    columnas = {plegar_texto(col).strip(): col for col in df.columns}
+    seleccion = {}
+    for destino, alias in COLUMNAS_PEDIDO.items():
+        encontrada = next((columnas[a] for a in alias if a in columnas), None)
+        if encontrada is not None:
+            seleccion[destino] = encontrada
+    if len(seleccion) < 2:
+        if len(df.columns) < 2:
+            raise ValueError('El archivo debe tener columnas de referencia y cantidad')
+        # Sin encabezados reconocibles: primera columna referencia, segunda cantidad.
+        # Si en la primera fila la cantidad es un número, es un dato y no un
+        # encabezado: el archivo se vuelve a leer para no perder esa línea
+        cantidad = str(df.columns[1]).strip().replace(',', '.')
+        if not seleccion and pd.notna(pd.to_numeric(cantidad, errors='coerce')):
+            df = leer(None)
+        seleccion = {'referencia': df.columns[0], 'cantidad': df.columns[1]}
+    
+    return pd.DataFrame({
+        'referencia': df[seleccion['referencia']],
+        'cantidad': df[seleccion['cantidad']]
+    })
+
+def recurso_del_proceso(obtener):
+    """Objeto único por proceso a partir de una función con @st.cache_resource.
+    
+    Streamlit ejecuta este script en un módulo nuevo en cada recarga, así que
+    un global creado aquí sería distinto en cada recarga y en cada sesión; bajo
+    Streamlit el objeto sale de st.cache_resource. Importado como módulo (API,
+    CLI) el global ya es único y se crea directamente.
+    """
+    if st.runtime.exists():
+        return obtener()
+    return obtener.__wrapped__()
+
+class CacheLRU:
+    """Caché acotada con expulsión LRU, vencimiento opcional y contadores de aciertos"""
+    
+    def __init__(self, maximo=256, ttl=None):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+    
+    def obtener(self, clave, calcular):
+        """Valor guardado para la clave, o el resultado de calcular() si no está o venció"""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and (self.ttl is None or ahora - entrada[0] < self.ttl):
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+        
+        valor = calcular()
+        with self._lock:
+            self._datos[clave] = (ahora, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+        return valor
+    
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+    
+    def migrar(self, transformar):
+        """Copiar entradas bajo otra clave: transformar(clave, valor) -> (clave, valor) o None"""
+        with self._lock:
+            entradas = list(self._datos.items())
+        copias = []
+        for clave, (momento, valor) in entradas:
+            nueva = transformar(clave, valor)
+            if nueva is not None:
+                copias.append((nueva[0], (momento, nueva[1])))
+        with self._lock:
+            for clave, entrada in copias:
+                self._datos.setdefault(clave, entrada)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+        return len(copias)
+    
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._datos),
+                'maximo': self.maximo,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0
+            }
+
+@st.cache_resource
+def obtener_cache_busquedas():
+    """Caché de búsquedas compartida por todas las sesiones (sobrevive a las recargas del script)"""
+    return CacheLRU(maximo=512, ttl=600)
+
+# Resultados de búsqueda compartidos entre sesiones; se vacía al recargar el catálogo
+CACHE_BUSQUEDAS = recurso_del_proceso(obtener_cache_busquedas)
+
+# Registro de cambios de precio entre versiones del catálogo (una línea JSON por cambio)
+ARCHIVO_AUDITORIA_PRECIOS = "auditoria_precios.jsonl"
+
+def diferencias_catalogo(anterior, nuevo):
+    """Comparar dos versiones del catálogo por Referencia.
+    
+    Devuelve las referencias agregadas y eliminadas, los cambios de precio
+    (uno por referencia y columna) y las filas cuyo texto de búsqueda cambió,
+    más el mapa fila anterior -> fila nueva (-1 si se eliminó) con el que se
+    derivan los índices. Si alguna versión repite referencias, 'incremental'
+    es False y los índices se reconstruyen completos.
+    """
+    claves_anteriores = anterior['Referencia'].astype(str).str.strip().str.upper()
+    claves_nuevas = nuevo['Referencia'].astype(str).str.strip().str.upper()
+    incremental = not claves_anteriores.duplicated().any() and not claves_nuevas.duplicated().any()
+    
+    # Con referencias repetidas se compara la primera aparición de cada una
+    primeras_nuevas = ~claves_nuevas.duplicated().to_numpy()
+    posiciones = np.flatnonzero(primeras_nuevas)
+    mapa = pd.Index(claves_nuevas[primeras_nuevas]).get_indexer(claves_anteriores)
+    mapa = np.where(mapa >= 0, posiciones[mapa], -1)
+    if not incremental:
+        mapa[claves_anteriores.duplicated().to_numpy()] = -1
+    
+    comunes = np.flatnonzero(mapa >= 0)
+    destino = mapa[comunes]
+    orden_conservado = bool(np.all(destino[1:] > destino[:-1]))
+    agregadas = np.setdiff1d(posiciones, destino)
+    eliminadas = np.flatnonzero(mapa < 0 if incremental else ~claves_anteriores.isin(claves_nuevas).to_numpy())
+    
+    cambios_precio = []
+    for col in COLUMNAS_PRECIO:
+        if col not in anterior.columns or col not in nuevo.columns:
+            continue
+        antes = anterior[col].to_numpy(dtype='float64')[comunes]
+        despues = nuevo[col].to_numpy(dtype='float64')[destino]
+        distintos = np.flatnonzero((antes != despues) & ~(np.isnan(antes) & np.isnan(despues)))
+        for i in distintos.tolist():
+            cambios_precio.append({
+                'referencia': nuevo['Referencia'].iat[destino[i]],
+                'columna': col,
+                'anterior': float(antes[i]),
+                'nuevo': float(despues[i])
+            })
+    
+    texto_cambiado = np.zeros(len(comunes), dtype=bool)
+    for col in COLUMNAS_BUSQUEDA:
+        if col in anterior.columns and col in nuevo.columns:
+            antes = anterior[col].iloc[comunes].astype(object).fillna('').astype(str).to_numpy()
+            despues = nuevo[col].iloc[destino].astype(object).fillna('').astype(str).to_numpy()
+            texto_cambiado |= antes != despues
+        elif col in anterior.columns or col in nuevo.columns:
+            texto_cambiado[:] = True
+    
+    return {
+        'incremental': incremental,
+        'agregadas': agregadas,
+        'eliminadas': eliminadas,
+        'cambios_precio': cambios_precio,
+        'texto_cambiado': destino[texto_cambiado],
+        'mapa': mapa,
+        'orden_conservado': orden_conservado,
+        'misma_estructura': (
+            incremental and len(anterior) == len(nuevo)
+            and np.array_equal(mapa, np.arange(len(anterior))) and not texto_cambiado.any()
+        )
+    }
+
+def resumen_diferencias(diferencias):
+    """Conteos del reporte de diferencias (para estadísticas y mensajes)"""
+    return {
+        'agregadas': len(diferencias['agregadas']),
+        'eliminadas': len(diferencias['eliminadas']),
+        'precios_cambiados': len(diferencias['cambios_precio']),
+        'referencias_con_precio_cambiado': len({c['referencia'] for c in diferencias['cambios_precio']}),
+        'texto_cambiado': len(diferencias['texto_cambiado']),
+        'incremental': diferencias['incremental']
+    }
+
+def _versiones_auditadas(lineas):
+    """Pares (versión anterior, versión) que ya tienen cambios en el registro de auditoría"""
+    pares = set()
+    for linea in lineas:
+        try:
+            entrada = json.loads(linea)
+            pares.add((entrada['version_anterior'], entrada['version']))
+        except (ValueError, KeyError, TypeError):
+            continue
+    return pares
+
+def registrar_auditoria_precios(diferencias, anterior, nuevo, ruta=ARCHIVO_AUDITORIA_PRECIOS):
+    """Agregar al registro de auditoría los cambios entre dos versiones del catálogo.
+    
+    Cada par de versiones se registra una sola vez: los demás procesos que
+    carguen la misma versión nueva encuentran el par ya escrito y no lo repiten.
+    """
+    base = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'version_anterior': anterior.version,
+        'version': nuevo.version
+    }
+    lineas = [dict(base, tipo='precio', **cambio) for cambio in diferencias['cambios_precio']]
+    for fila in diferencias['agregadas'].tolist():
+        lineas.append(dict(base, tipo='agregada', referencia=nuevo.productos['Referencia'].iat[fila]))
+    for fila in diferencias['eliminadas'].tolist():
+        lineas.append(dict(base, tipo='eliminada', referencia=anterior.productos['Referencia'].iat[fila]))
+    if not lineas:
+        return 0
+    with open(ruta, 'a+', encoding='utf-8') as f:
+        if fcntl is not None:
+            # Nadie agrega el mismo par entre la lectura y la escritura (se libera al cerrar)
+            fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        if (anterior.version, nuevo.version) in _versiones_auditadas(f):
+            return 0
+        f.write(''.join(json.dumps(linea, ensure_ascii=False) + '\n' for linea in lineas))
+    return len(lineas)
+
+class SnapshotCatalogo:
+    """Versión inmutable del catálogo compartida por todas las sesiones"""
+    
+    def __init__(self, productos, ruta, firma, huella, precios_invalidos=None, conflictos=None, resumen_fuentes=None):
+        self.productos = productos
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._indice_busqueda = None
+        self._indice_difuso = None
+        self._indice_referencias = None
+        # Conjuntos de coincidencias por búsqueda (para paginar sin recalcular)
+        self._coincidencias = CacheLRU(maximo=128)
+        # Celdas de precio con contenido no interpretable (quedaron en 0)
+        self.precios_invalidos = precios_invalidos or []
+        # Referencias con precios distintos entre fuentes (se usó el de la fuente con precedencia)
+        self.conflictos = conflictos or []
+        # Filas leídas, agregadas y completadas por cada fuente
+        self.resumen_fuentes = resumen_fuentes or {}
+        # ((nombre, mtime_ns, tamaño), ...) de los archivos fuente al momento de cargarlos
+        self.firma = firma
+        # SHA-256 del contenido de los archivos fuente
+        self.huella = huella
+        self.version = huella[:12]
+        self.cargado_en = datetime.now()
+        # Diferencias con la versión de la que se derivó (None si se cargó completa)
+        self.diferencias = None
+        self._memoria = None
+        self._precios = None
+    
+    @property
+    def memoria(self):
+        """Reporte de memoria del catálogo por columna (antes y después de compactarlo)"""
+        if self._memoria is None:
+            self._memoria = reporte_memoria_catalogo(self.productos)
+        return self._memoria
+    
+    def derivar(self, productos, diferencias, ruta, firma, huella, precios_invalidos=None, conflictos=None, resumen_fuentes=None):
+        """Versión siguiente del catálogo, reutilizando lo que las diferencias no tocan.
+        
+        Si solo cambiaron precios se comparten tal cual los índices y las
+        coincidencias ya calculadas; si cambiaron filas o textos, los índices
+        se derivan moviendo las filas existentes y tokenizando solo las nuevas.
+        Si el archivo se reordenó, sale más barato construirlos de nuevo.
+        """
+        nuevo = SnapshotCatalogo(productos, ruta, firma, huella, precios_invalidos, conflictos, resumen_fuentes)
+        nuevo.diferencias = diferencias
+        if not (diferencias['incremental'] and diferencias['orden_conservado']) or self._indice_busqueda is None:
+            return nuevo
+        
+        if diferencias['misma_estructura']:
+            nuevo._indice_busqueda = self._indice_busqueda
+            nuevo._indice_referencias = self._indice_referencias
+            nuevo._indice_difuso = self._indice_difuso
+            nuevo._coincidencias = self._coincidencias
+            return nuevo
+        
+        mapa = diferencias['mapa'].copy()
+        # Las filas con texto cambiado salen de sus tokens anteriores y se vuelven a tokenizar
+        mapa[np.isin(mapa, diferencias['texto_cambiado'])] = -1
+        filas_nuevas = np.union1d(diferencias['agregadas'], diferencias['texto_cambiado'])
+        nuevo._indice_busqueda = self._indice_busqueda.derivar(productos, mapa, filas_nuevas)
+        if self._indice_difuso is not None:
+            nuevo._indice_difuso = self._indice_difuso.derivar(nuevo._indice_busqueda, nuevo.indice_referencias)
+        return nuevo
+    
+    @classmethod
+    def desde_dataframe(cls, productos):
+        """Envolver un DataFrame cargado por fuera del almacén (versión según su contenido)"""
+        contenido = pd.util.hash_pandas_object(productos, index=True).to_numpy()
+        huella = hashlib.sha256(contenido.tobytes()).hexdigest()
+        return cls(productos, None, None, huella)
+    
+    @property
+    def indice_busqueda(self):
+        """Índice invertido de búsqueda, construido una sola vez por versión"""
+        if self._indice_busqueda is None:
+            with self._lock:
+                if self._indice_busqueda is None:
+                    self._indice_busqueda = IndiceBusqueda(self.productos)
+        return self._indice_busqueda
+    
+    @property
+    def indice_difuso(self):
+        """Índice de trigramas para la búsqueda difusa, construido una sola vez por versión"""
+        # Los índices base se piden antes de tomar el candado (no es reentrante)
+        indice = self.indice_busqueda
+        referencias = self.indice_referencias
+        if self._indice_difuso is None:
+            with self._lock:
+                if self._indice_difuso is None:
+                    self._indice_difuso = IndiceDifuso(indice, referencias)
+        return self._indice_difuso
+    
+    @property
+    def precios(self):
+        """Matriz de precios filas × sede × (sin IVA, con IVA), construida una sola vez por versión"""
+        if self._precios is None:
+            with self._lock:
+                if self._precios is None:
+                    precios = matriz_precios(self.productos)
+                    precios.setflags(write=False)
+                    self._precios = precios
+        return self._precios
+    
+    def precalentar(self, difuso=False):
+        """Construir de una vez los índices que de otro modo se arman en la primera consulta"""
+        # Se leen con getattr y no como expresiones sueltas: al ejecutarse como
+        # script de Streamlit, la "magia" convertiría cada una en un st.write
+        nombres = ['indice_referencias', 'indice_busqueda', 'precios']
+        if difuso:
+            nombres.append('indice_difuso')
+        for nombre in nombres:
+            getattr(self, nombre)
+        return self
+    
+    def coincidencias(self, clave, calcular):
+        """Filas que coinciden con una búsqueda, calculadas una vez por clave"""
+        def calcular_solo_lectura():
+            filas = calcular()
+            filas.setflags(write=False)
+            return filas
+        return self._coincidencias.obtener(clave, calcular_solo_lectura)
+    
+    @property
+    def indice_referencias(self):
+        """Diccionario referencia normalizada -> fila (primera aparición)"""
+        if self._indice_referencias is None:
+            with self._lock:
+                if self._indice_referencias is None:
+                    claves = self.productos['Referencia'].astype(str).str.strip().str.upper().tolist()
+                    # Se recorre al revés para que gane la primera aparición de cada referencia;
+                    # las claves internadas son los mismos objetos que las referencias ya normalizadas
+                    self._indice_referencias = {
+                        sys.intern(clave): fila for fila, clave in reversed(list(enumerate(claves)))
+                    }
+        return self._indice_referencias
+
+class AlmacenCatalogo:
+    """Almacén de catálogos a nivel de proceso, compartido entre sesiones.
+    
+    Las fuentes se leen una sola vez; solo se vuelven a leer cuando cambia la
+    fecha de modificación de alguna y además cambia su contenido (hash).
+    Una versión nueva se arma completa (DataFrame e índices) antes de
+    reemplazar a la vigente, y mientras se arma se sigue sirviendo la anterior.
+    """
+    
+    def __init__(self, ruta_auditoria=ARCHIVO_AUDITORIA_PRECIOS):
+        self._lock = threading.Lock()
+        # Solo una carga a la vez; quien ya tiene una versión no espera por ella
+        self._lock_carga = threading.Lock()
+        self._snapshots = {}
+        # Registro JSONL de cambios de precio entre versiones (None para no registrar)
+        self.ruta_auditoria = ruta_auditoria
+    
+    def _publicar(self, ruta, snapshot):
+        """Dejar un snapshot como vigente (reemplazo atómico de la referencia compartida)"""
+        anterior = self._snapshots.get(ruta)
+        if anterior is not None and anterior is not snapshot:
+            # Quien pase a la versión nueva encuentra los índices ya construidos
+            snapshot.precalentar(difuso=anterior._indice_difuso is not None)
+        with self._lock:
+            self._snapshots[ruta] = snapshot
+        if anterior is not None and anterior is not snapshot:
+            if snapshot.diferencias is not None and snapshot.diferencias['misma_estructura']:
+                # Solo cambiaron precios: las búsquedas ya resueltas pasan a la versión nueva
+                self._migrar_busquedas(anterior, snapshot)
+            else:
+                # Los resultados de la versión anterior ya no sirven
+                CACHE_BUSQUEDAS.limpiar()
+    
+    @staticmethod
+    def _migrar_busquedas(anterior, snapshot):
+        def transformar(clave, resultado):
+            if clave[0] != anterior.version:
+                return None
+            resultados = resultado.get('resultados')
+            # Por atributo y no con isinstance: la caché guarda resultados creados en
+            # distintas ejecuciones del script de Streamlit, cada una con su propia clase
+            if hasattr(resultados, 'sobre'):
+                # Mismas filas; los precios se formatean desde el catálogo nuevo
+                resultado = dict(resultado, resultados=resultados.sobre(snapshot.productos, snapshot.precios))
+            return (snapshot.version,) + clave[1:], resultado
+        return CACHE_BUSQUEDAS.migrar(transformar)
+    
+    def _nueva_version(self, actual, productos, ruta, firma, huella, precios_invalidos=None, conflictos=None, resumen_fuentes=None):
+        """Snapshot de la versión recién leída, derivado de la vigente si la hay"""
+        if actual is None:
+            return SnapshotCatalogo(productos, ruta, firma, huella, precios_invalidos, conflictos, resumen_fuentes)
+        diferencias = diferencias_catalogo(actual.productos, productos)
+        snapshot = actual.derivar(
+            productos, diferencias, ruta, firma, huella, precios_invalidos, conflictos, resumen_fuentes
+        )
+        if self.ruta_auditoria:
+            try:
+                registrar_auditoria_precios(diferencias, actual, snapshot, self.ruta_auditoria)
+            except OSError:
+                pass
+        return snapshot
+    
+    @staticmethod
+    def _firma_archivo(ruta):
+        info = os.stat(ruta)
+        return (info.st_mtime_ns, info.st_size)
+    
+    @staticmethod
+    def _huella_archivo(ruta):
+        sha = hashlib.sha256()
+        with open(ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(1 << 20), b''):
+                sha.update(bloque)
+        return sha.hexdigest()
+    
+    @classmethod
+    def _firma_fuentes(cls, fuentes):
+        return tuple((fuente.nombre,) + cls._firma_archivo(fuente.ruta) for fuente in fuentes)
+    
+    @staticmethod
+    def _firma_meta(meta):
+        return tuple((f['nombre'], f['mtime_ns'], f['tamano']) for f in meta['fuentes'])
+    
+    @classmethod
+    def _describir_fuentes(cls, fuentes):
+        """Firma y hash de cada fuente, como se guardan en el snapshot"""
+        descripcion = []
+        for fuente in fuentes:
+            mtime_ns, tamano = cls._firma_archivo(fuente.ruta)
+            descripcion.append({
+                'nombre': fuente.nombre, 'mtime_ns': mtime_ns, 'tamano': tamano,
+                'huella': cls._huella_archivo(fuente.ruta)
+            })
+        return descripcion
+    
+    @staticmethod
+    def _huella_combinada(descripcion):
+        """Hash de la versión del catálogo (el del archivo, si hay una sola fuente)"""
+        if len(descripcion) == 1:
+            return descripcion[0]['huella']
+        texto = '\n'.join(f"{f['nombre']}:{f['huella']}" for f in descripcion)
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+    
+    def obtener(self, ruta=None, fuentes=None):
+        """Obtener el snapshot vigente del catálogo, recargándolo si alguna fuente cambió.
+        
+        Sin argumentos se combinan FUENTES_CATALOGO; con `ruta` se carga solo ese
+        archivo. Las fuentes secundarias que no existan simplemente se omiten.
+        """
+        fuentes = resolver_fuentes_catalogo(ruta, fuentes)
+        ruta = os.path.abspath(fuentes[0].ruta)
+        if not os.path.exists(ruta):
+            # Sin el Excel principal se sirve el último snapshot binario compilado
+            return self._obtener_sin_fuente(ruta)
+        fuentes = [fuente for fuente in fuentes if os.path.exists(fuente.ruta)]
+        firma = self._firma_fuentes(fuentes)
+        
+        actual = self._snapshots.get(ruta)
+        if actual is not None and actual.firma == firma:
+            return actual
+        
+        if not self._lock_carga.acquire(blocking=actual is None):
+            # Otro hilo ya está cargando la versión nueva: entretanto sirve la vigente
+            return actual
+        try:
+            # Otra sesión pudo haberlo recargado mientras esperábamos el lock
+            actual = self._snapshots.get(ruta)
+            if actual is not None and actual.firma == firma:
+                return actual
+            
+            # Snapshot binario compilado a partir de estas mismas versiones de las fuentes
+            meta = leer_meta_snapshot(ruta_snapshot_catalogo(ruta))
+            if meta is not None and self._firma_meta(meta) == firma:
+                huella = meta['huella']
+                if actual is not None and actual.huella == huella:
+                    actual.firma = firma
+                    return actual
+                snapshot = self._desde_meta(meta, ruta, actual)
+                self._publicar(ruta, snapshot)
+                return snapshot
+            
+            descripcion = self._describir_fuentes(fuentes)
+            huella = self._huella_combinada(descripcion)
+            if actual is not None and actual.huella == huella:
+                # Solo cambió la fecha de modificación: se conserva la misma versión
+                actual.firma = firma
+                return actual
+            
+            df, precios_invalidos, conflictos, resumen = leer_fuentes_catalogo(fuentes)
+            try:
+                escribir_snapshot_catalogo(
+                    df, ruta_snapshot_catalogo(ruta), descripcion, huella,
+                    precios_invalidos, conflictos, resumen
+                )
+            except OSError:
+                # Sistema de archivos de solo lectura: se sigue funcionando desde el Excel
+                pass
+            snapshot = self._nueva_version(actual, df, ruta, firma, huella, precios_invalidos, conflictos, resumen)
+            self._publicar(ruta, snapshot)
+            return snapshot
+        finally:
+            self._lock_carga.release()
+    
+    def _desde_meta(self, meta, ruta, actual=None):
+        return self._nueva_version(
+            actual, cargar_snapshot_catalogo(meta), ruta, self._firma_meta(meta), meta['huella'],
+            meta.get('precios_invalidos'), meta.get('conflictos'), meta.get('resumen_fuentes')
+        )
+    
+    def _obtener_sin_fuente(self, ruta):
+        with self._lock_carga:
+            actual = self._snapshots.get(ruta)
+            if actual is not None:
+                return actual
+            meta = leer_meta_snapshot(ruta_snapshot_catalogo(ruta))
+            if meta is None:
+                raise FileNotFoundError(f"No se encontró el archivo '{ruta}' ni su snapshot compilado")
+            snapshot = self._desde_meta(meta, ruta)
+            self._publicar(ruta, snapshot)
+            return snapshot
+    
+    def vigente(self, ruta=None):
+        """Snapshot publicado para el catálogo (sin revisar las fuentes), o None si no se ha cargado"""
+        if ruta is None:
+            ruta = FUENTES_CATALOGO[0].ruta
+        return self._snapshots.get(os.path.abspath(ruta))
+    
+    def comparar(self, ruta=None, fuentes=None):
+        """Diferencias entre las fuentes en disco y la versión vigente, sin aplicarlas"""
+        fuentes = [f for f in resolver_fuentes_catalogo(ruta, fuentes) if os.path.exists(f.ruta)]
+        actual = self.vigente(fuentes[0].ruta) if fuentes else None
+        if actual is None:
+            raise ValueError('No hay una versión del catálogo cargada para comparar')
+        df = leer_fuentes_catalogo(fuentes)[0]
+        diferencias = diferencias_catalogo(actual.productos, df)
+        return dict(
+            resumen_diferencias(diferencias),
+            cambios_precio=diferencias['cambios_precio'],
+            referencias_agregadas=df['Referencia'].iloc[diferencias['agregadas']].tolist(),
+            referencias_eliminadas=actual.productos['Referencia'].iloc[diferencias['eliminadas']].tolist()
+        )
+    
+    def invalidar(self, ruta=None):
+        """Descartar los snapshots cargados para forzar una nueva lectura"""
+        with self._lock:
+            if ruta is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(os.path.abspath(ruta), None)
+        CACHE_BUSQUEDAS.limpiar()
+
+@st.cache_resource
+def obtener_almacen_catalogo():
+    """Almacén de catálogos compartido por todas las sesiones (sobrevive a las recargas del script)"""
+    return AlmacenCatalogo()
+
+# Único almacén por proceso: todas las sesiones de Streamlit apuntan al mismo snapshot
+ALMACEN_CATALOGO = recurso_del_proceso(obtener_almacen_catalogo)
+
+# Segundos entre revisiones de las fuentes del catálogo
+INTERVALO_VIGILANCIA = 5.0
+
+class VigilanteCatalogo:
+    """Hilo que revisa las fuentes del catálogo y publica cada versión nueva.
+    
+    Cada `intervalo` segundos compara la fecha de modificación de las fuentes;
+    si cambió, el almacén las vuelve a leer y arma los índices en este hilo, y
+    solo al final reemplaza el snapshot compartido. `al_publicar` recibe cada
+    versión nueva publicada.
+    """
+    
+    def __init__(self, almacen=None, intervalo=INTERVALO_VIGILANCIA, fuentes=None, al_publicar=None):
+        self.almacen = almacen or ALMACEN_CATALOGO
+        self.intervalo = intervalo
+        self.fuentes = fuentes
+        self.al_publicar = al_publicar
+        self.recargas = 0
+        self.errores = 0
+        self.ultimo_error = None
+        self._detener = threading.Event()
+        self._hilo = None
+    
+    def revisar(self):
+        """Revisar las fuentes una vez; devuelve el snapshot si se publicó uno nuevo"""
+        ruta = resolver_fuentes_catalogo(None, self.fuentes)[0].ruta
+        anterior = self.almacen.vigente(ruta)
+        snapshot = self.almacen.obtener(fuentes=self.fuentes)
+        if snapshot is anterior:
+            return None
+        self.recargas += 1
+        if self.al_publicar is not None:
+            self.al_publicar(snapshot)
+        return snapshot
+    
+    def _ejecutar(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.revisar()
+            except Exception as e:
+                # Archivo a medio guardar o con errores: se sigue sirviendo la versión vigente
+                self.errores += 1
+                self.ultimo_error = str(e)
+    
+    def iniciar(self):
+        """Arrancar el hilo de vigilancia (si no está corriendo)"""
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._ejecutar, name='vigilante-catalogo', daemon=True)
+            self._hilo.start()
+        return self
+    
+    def detener(self, espera=None):
+        """Detener el hilo de vigilancia"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(espera)
+    
+    def estadisticas(self):
+        return {
+            'activo': self._hilo is not None and self._hilo.is_alive(),
+            'intervalo': self.intervalo,
+            'recargas': self.recargas,
+            'errores': self.errores,
+            'ultimo_error': self.ultimo_error
+        }
+
+# Campo del producto formateado -> columna del catálogo
+CAMPOS_PRODUCTO = {
+    'referencia': 'Referencia',
+    'descripcion': 'DESCRIPCION',
+    'tipo_madera': 'TIPO MADERA',
+    'acabado': 'ACABADO DE LA MADERA',
+    'uso': 'USO',
+    'garantia': 'GARANTIA'
+}
+
+# Variante de precio -> columna del catálogo
+VARIANTES_PRECIO = {
+    'caldas_sin_iva': 'PRECIO CALDAS',
+    'caldas_con_iva': 'PRECIO CALDAS CON IVA',
+    'chagualo_sin_iva': 'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL',
+    'chagualo_con_iva': 'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL IVA INCLUIDO'
+}
+
+# Posición de cada sede en la matriz de precios (filas × sede × [sin IVA, con IVA]),
+# en el mismo orden de GRUPOS_PRECIO y VARIANTES_PRECIO
+POSICION_SEDE = {'caldas': 0, 'chagualo': 1}
+
+# Textos aceptados como sí/no en pedidos, parámetros y archivos de lote
+VALORES_VERDADEROS = ('1', 'true', 'si', 'yes')
+VALORES_FALSOS = ('0', 'false', 'no')
+
+def leer_booleano(valor, defecto):
+    """Sí/no desde JSON, CSV o parámetros de URL ("false" y "0" son falsos), o ValueError"""
+    if valor is None or valor == '':
+        return defecto
+    if isinstance(valor, (bool, int, float)):
+        return bool(valor)
+    texto = plegar_texto(valor).strip()
+    if texto in VALORES_VERDADEROS:
+        return True
+    if texto in VALORES_FALSOS:
+        return False
+    raise ValueError(f"valor sí/no inválido: {valor}")
+
+def leer_sede(valor, defecto='caldas'):
+    """Nombre de sede sin espacios ni mayúsculas, o ValueError si no es una sede conocida"""
+    if valor is None or valor == '':
+        return defecto
+    sede = str(valor).strip().lower()
+    if sede not in POSICION_SEDE:
+        raise ValueError(f"sede inválida: {valor}")
+    return sede
+
+def matriz_precios(productos):
+    """Precios del catálogo como arreglo filas × sede × (sin IVA, con IVA)"""
+    matriz = np.zeros((len(productos), len(GRUPOS_PRECIO), 2))
+    for sede, columnas in enumerate(GRUPOS_PRECIO):
+        for iva, columna in enumerate(columnas):
+            if columna in productos.columns:
+                matriz[:, sede, iva] = productos[columna].to_numpy(dtype='float64', na_value=np.nan)
+    return matriz
+
+def matriz_precios_items(items, ubicacion='caldas', incluir_iva=True):
+    """Matriz items × sede × IVA con los precios que trae cada producto seleccionado.
+    
+    Cada variante sale del diccionario 'precios' del producto; las que falten
+    toman su 'precio_numerico'. Ese 'precio_numerico' es además el precio de
+    la variante con que se eligió el producto (su 'ubicacion' e 'incluir_iva',
+    o los de la cotización si no los trae), así que un precio puesto a mano no
+    se reemplaza por el del catálogo.
+    """
+    matriz = np.zeros((len(items), len(GRUPOS_PRECIO), 2))
+    variantes = matriz.reshape(len(items), len(VARIANTES_PRECIO))
+    for fila, item in enumerate(items):
+        precio = item.get('precio_numerico')
+        precios = item.get('precios') or {}
+        respaldo = 0 if precio is None else precio
+        variantes[fila] = [precios.get(variante, respaldo) for variante in VARIANTES_PRECIO]
+        if precio is not None:
+            sede = POSICION_SEDE.get(item.get('ubicacion'), POSICION_SEDE[ubicacion])
+            iva = int(bool(item.get('incluir_iva', incluir_iva)))
+            matriz[fila, sede, iva] = precio
+    return matriz
+
+def redondear_pesos(valores):
+    """Redondear a pesos enteros (las mitades hacia arriba); NaN cuenta como 0"""
+    valores = np.nan_to_num(np.asarray(valores, dtype='float64'))
+    # Redondear antes a 6 decimales evita que un x,5 guardado como x,4999999 baje
+    return np.floor(np.round(valores, 6) + 0.5).astype(np.int64)
+
+def totales_cotizacion(precios, cantidades, descuento=0):
+    """Totales de una cotización en todas las sedes, con y sin IVA, de una vez.
+    
+    `precios` es la matriz items × sede × IVA y `cantidades` el vector de
+    cantidades por item. Cada línea se redondea a pesos enteros, el subtotal
+    es la suma exacta de las líneas y el descuento se redondea al peso.
+    """
+    cantidades = np.asarray(cantidades, dtype='float64')
+    lineas = redondear_pesos(cantidades[:, None, None] * precios)
+    subtotal = lineas.sum(axis=0)
+    valor_descuento = redondear_pesos(subtotal * (descuento / 100))
+    return {
+        'lineas': lineas,
+        'subtotal': subtotal,
+        'descuento': valor_descuento,
+        'total': subtotal - valor_descuento
+    }
+
+class ResultadosBusqueda:
+    """Resultados de búsqueda guardados por columnas.
+    
+    Se comporta como una lista de productos formateados (los mismos
+    diccionarios de formatear_producto), pero las columnas se extraen y los
+    precios se formatean de una sola vez para todas las filas, y cada
+    diccionario se arma solo cuando se accede a esa posición. Los
+    diccionarios quedan en caché: quien necesite modificarlos debe copiarlos.
+    """
+    
+    __slots__ = ('generador', 'productos', 'precios', 'filas', 'ubicacion', 'incluir_iva', '_columnas', '_items')
+    
+    def __init__(self, generador, productos, filas, ubicacion='caldas', incluir_iva=True, precios=None):
+        self.generador = generador
+        self.productos = productos
+        # Matriz de precios del catálogo completo (si no se da, se arma con las filas seleccionadas)
+        self.precios = precios
+        self.filas = np.asarray(filas, dtype=np.int64)
+        self.ubicacion = ubicacion
+        self.incluir_iva = incluir_iva
+        self._columnas = None
+        self._items = {}
+    
+    def __len__(self):
+        return len(self.filas)
+    
+    def sobre(self, productos, precios=None):
+        """Las mismas filas sobre otra versión del catálogo con la misma estructura"""
+        return ResultadosBusqueda(self.generador, productos, self.filas, self.ubicacion, self.incluir_iva, precios)
+    
+    def __iter__(self):
+        for i in range(len(self.filas)):
+            yield self[i]
+    
+    def __getitem__(self, posicion):
+        if isinstance(posicion, slice):
+            return [self[i] for i in range(*posicion.indices(len(self.filas)))]
+        if posicion < 0:
+            posicion += len(self.filas)
+        if not 0 <= posicion < len(self.filas):
+            raise IndexError('posición fuera de rango')
+        item = self._items.get(posicion)
+        if item is None:
+            item = self._materializar(posicion)
+            self._items[posicion] = item
+        return item
+    
+    def columnas(self):
+        """Columnas de las filas seleccionadas, extraídas y formateadas en bloque"""
+        if self._columnas is None:
+            seleccion = self.productos.iloc[self.filas]
+            n = len(seleccion)
+            
+            def columna(nombre, defecto):
+                if nombre in seleccion.columns:
+                    return seleccion[nombre].tolist()
+                return [defecto] * n
+            
+            if self.precios is None:
+                precios = matriz_precios(seleccion)
+            else:
+                precios = self.precios[self.filas]
+            columnas = {campo: columna(nombre, '') for campo, nombre in CAMPOS_PRODUCTO.items()}
+            columnas['precio_numerico'] = precios[:, POSICION_SEDE[self.ubicacion], int(bool(self.incluir_iva))].tolist()
+            columnas['precio'] = self.generador.formatear_precios(columnas['precio_numerico'])
+            for variante, valores in zip(VARIANTES_PRECIO, precios.reshape(n, -1).T):
+                columnas[variante] = valores.tolist()
+                columnas[f'{variante}_formateado'] = self.generador.formatear_precios(valores)
+            self._columnas = columnas
+        return self._columnas
+    
+    def a_dataframe(self):
+        """Vista DataFrame de las filas seleccionadas del catálogo"""
+        return self.productos.iloc[self.filas]
+    
+    def _materializar(self, i):
+        columnas = self.columnas()
+        producto = {campo: columnas[campo][i] for campo in CAMPOS_PRODUCTO}
+        producto.update({
+            'ubicacion': self.ubicacion,
+            'incluir_iva': self.incluir_iva,
+            'precio': columnas['precio'][i],
+            'precio_numerico': columnas['precio_numerico'][i],
+            'precios': {variante: columnas[variante][i] for variante in VARIANTES_PRECIO},
+            'precios_formateados': {
+                variante: columnas[f'{variante}_formateado'][i] for variante in VARIANTES_PRECIO
+            }
+        })
+        return producto
+
+DATOS_EMPRESA_POR_DEFECTO = {
+    'nombre': 'Construinmuniza',
+    'nit': '900.XXX.XXX-X',
+    'direccion': 'Calle XX # XX - XX',
+    'telefono': 'XXX-XXXX',
+    'ciudad': 'Medellín',
+    'email': 'ventas@construinmuniza.com'
+}
+
+class _CeldaImporte(str):
+    """Celda de importe de la tabla extensa: el texto formateado y su valor en pesos"""
+    
+    def __new__(cls, texto, valor):
+        celda = super().__new__(cls, texto)
+        celda.valor = valor
+        return celda
+
+class PlantillaPDF:
+    """Plantilla reutilizable para el PDF de cotización.
+    
+    Los estilos, los colores y el logo (ya reducido y guardado en memoria) se
+    preparan una sola vez por proceso, al crear la primera plantilla (que es
+    también cuando se importa ReportLab). El encabezado de la empresa, las
+    condiciones y las firmas se construyen una vez por hilo y por datos de
+    empresa; cada cotización solo arma el bloque del cliente, la tabla de
+    productos y los totales.
+    """
+    
+    # Versión del diseño: subirla al cambiar el PDF invalida la caché de PDF
+    VERSION = 4
+    
+    # Desde cuántas líneas se usa la tabla extensa (texto ajustado y subtotal por hoja),
+    # y la separación entre líneas de sus celdas
+    LINEAS_MODO_EXTENSO = 60
+    INTERLINEA_EXTENSA = 7.5
+    
+    # Tamaño del logo en el PDF y factor de resolución al reducirlo
+    TAMANO_LOGO = 80
+    ESCALA_LOGO = 3
+    
+    def __init__(self, logo_path="logo.png"):
+        cargar_reportlab()
+        
+        # Colores Construinmuniza
+        self.verde_construinmuniza = colors.Color(27/255, 94/255, 32/255)  # #1B5E20
+        self.verde_claro_construinmuniza = colors.Color(46/255, 125/255, 50/255)  # #2E7D32
+        self.amarillo_construinmuniza = colors.Color(255/255, 193/255, 7/255)  # #FFC107
+        
+        # Estilos
+        styles = getSampleStyleSheet()
+        self.title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=16,
+            textColor=self.verde_construinmuniza,
+            spaceAfter=12,
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold'
+        )
+        
+        self.header_style = ParagraphStyle(
+            'HeaderStyle',
+            parent=styles['Normal'],
+            fontSize=10,
+            textColor=colors.black,
+            alignment=TA_LEFT,
+            fontName='Helvetica'
+        )
+        
+        self.header_right_style = ParagraphStyle(
+            'HeaderRight',
+            parent=styles['Normal'],
+            fontSize=12,
+            textColor=self.verde_construinmuniza,
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold'
+        )
+        
+        self.cotizacion_number_style = ParagraphStyle(
+            'CotizacionNumber',
+            parent=styles['Normal'],
+            fontSize=14,
+            textColor=self.verde_construinmuniza,
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold',
+            spaceAfter=15
+        )
+        
+        self.conditions_title_style = ParagraphStyle(
+            'ConditionsTitle', parent=styles['Normal'],
+            fontSize=10, fontName='Helvetica-Bold',
+            textColor=self.verde_construinmuniza
+        )
+        
+        self.condition_style = ParagraphStyle(
+            'Condition', parent=styles['Normal'],
+            fontSize=9, leftIndent=10
+        )
+        
+        self.header_table_style = TableStyle([
+            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+            ('ALIGN', (1, 0), (1, 0), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 8),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+            ('TOPPADDING', (0, 0), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ])
+        
+        self.cliente_table_style = TableStyle([
+            ('BOX', (0, 0), (-1, -1), 1, self.verde_construinmuniza),
+            ('INNERGRID', (0, 0), (-1, -1), 1, self.verde_construinmuniza),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 10),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+            ('TOPPADDING', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+        ])
+        
+        self.productos_table_style = TableStyle([
+            # Header con colores Construinmuniza
+            ('BACKGROUND', (0, 0), (-1, 0), self.verde_construinmuniza),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 7),
+            
+            # Datos
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 6),
+            ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # Referencia centrada
+            ('ALIGN', (1, 1), (1, -1), 'LEFT'),
+            ('ALIGN', (2, 1), (3, -1), 'CENTER'),  # Tipo y Acabado centrados
+            ('ALIGN', (4, 1), (4, -1), 'CENTER'),  # Cantidad centrada
+            ('ALIGN', (5, 1), (-1, -1), 'RIGHT'),  # Precios a la derecha
+            
+            # Bordes
+            ('BOX', (0, 0), (-1, -1), 1, self.verde_construinmuniza),
+            ('INNERGRID', (0, 0), (-1, -1), 0.5, self.verde_claro_construinmuniza),
+            
+            # Padding
+            ('LEFTPADDING', (0, 0), (-1, -1), 4),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+            ('TOPPADDING', (0, 0), (-1, -1), 3),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ])
+        
+        # Cotizaciones extensas: texto ajustado en varias líneas, más juntas que en la tabla simple
+        self.productos_extensa_style = TableStyle(self.productos_table_style.getCommands() + [
+            ('LEADING', (0, 1), (-1, -1), self.INTERLINEA_EXTENSA),
+        ])
+        
+        self.totales_table_style = TableStyle([
+            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (1, 0), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (1, 0), (-1, -1), 9),
+            ('BOX', (1, 0), (-1, -1), 1, self.verde_construinmuniza),
+            ('INNERGRID', (1, 0), (-1, -1), 0.5, self.verde_claro_construinmuniza),
+            ('BACKGROUND', (1, -1), (-1, -1), colors.Color(241/255, 248/255, 233/255)),  # Verde muy claro
+            ('LEFTPADDING', (1, 0), (-1, -1), 6),
+            ('RIGHTPADDING', (1, 0), (-1, -1), 6),
+            ('TOPPADDING', (1, 0), (-1, -1), 6),
+            ('BOTTOMPADDING', (1, 0), (-1, -1), 6),
+        ])
+        
+        self.firmas_table_style = TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('TEXTCOLOR', (0, 0), (-1, 0), self.verde_construinmuniza),
+            ('TOPPADDING', (0, 0), (-1, -1), 15),
+        ])
+        
+        self.logo_png = self._preparar_logo(logo_path)
+        
+        # Flowables estáticos por hilo: ReportLab guarda estado de maquetación en ellos
+        self._local = threading.local()
+    
+    def _preparar_logo(self, logo_path):
+        """Leer el logo una sola vez y reducirlo al tamaño con que se imprime"""
+        if not os.path.exists(logo_path):
+            return None
+        try:
+            from PIL import Image as ImagenPIL
+            lado = self.TAMANO_LOGO * self.ESCALA_LOGO
+            with ImagenPIL.open(logo_path) as imagen:
+                reducida = imagen.convert('RGB').resize((lado, lado), ImagenPIL.LANCZOS)
+            salida = BytesIO()
+            reducida.save(salida, format='PNG', optimize=True)
+            return salida.getvalue()
+        except Exception:
+            return None
+    
+    def _cache_local(self):
+        cache = getattr(self._local, 'flowables', None)
+        if cache is None:
+            cache = self._local.flowables = {}
+        return cache
+    
+    @staticmethod
+    def _copia(flowable):
+        """Copia ligera de un flowable ya construido para usarlo en otro documento"""
+        copia = copy.copy(flowable)
+        # Marca que deja doc.build cuando el flowable pasó a la página siguiente
+        copia.__dict__.pop('_postponed', None)
+        return copia
+    
+    @staticmethod
+    def _texto(valor):
+        """Texto escapado para ponerlo dentro del marcado de un Paragraph"""
+        return escape(str(valor))
+    
+    def encabezado(self, datos_empresa, numero_cotizacion):
+        """Tabla de encabezado con los datos de la empresa y el logo"""
+        clave = ('encabezado', tuple(sorted(datos_empresa.items())))
+        cache = self._cache_local()
+        if self.logo_png is not None and clave in cache:
+            return self._copia(cache[clave])
+        
+        # HEADER DE LA EMPRESA CON LOGO
+        if self.logo_png is not None:
+            logo_element = Image(BytesIO(self.logo_png), width=self.TAMANO_LOGO, height=self.TAMANO_LOGO)
+        else:
+            logo_element = Paragraph(f"""
+            <b>COTIZACIÓN</b><br/>
+            No. {self._texto(numero_cotizacion)}
+            """, self.header_right_style)
+        
+        empresa = {campo: self._texto(valor) for campo, valor in datos_empresa.items()}
+        header_data = [
+            [
+                Paragraph(f"""
+                <b>{empresa['nombre']}</b><br/>
+                <font color='#2E7D32'>Madera Inmunizada</font><br/>
+                NIT: {empresa['nit']}<br/>
+                {empresa['direccion']}<br/>
+                Tel: {empresa['telefono']}<br/>
+                {empresa['ciudad']}
+                """, self.header_style),
+                logo_element
+            ]
+        ]
+        
+        header_table = Table(header_data, colWidths=[4.2*inch, 2.5*inch])
+        header_table.setStyle(self.header_table_style)
+        
+        # Sin logo el encabezado lleva el número de la cotización y no se puede reutilizar
+        if self.logo_png is not None:
+            cache[clave] = header_table
+        return header_table
+    
+    def condiciones(self, condiciones):
+        """Bloque de condiciones generales"""
+        clave = ('condiciones', tuple(condiciones))
+        cache = self._cache_local()
+        if clave not in cache:
+            bloque = [Paragraph("<b>Condiciones Generales:</b>", self.conditions_title_style), Spacer(1, 8)]
+            for condicion in condiciones:
+                bloque.append(Paragraph(f"• {self._texto(condicion)}", self.condition_style))
+            bloque.append(Spacer(1, 20))
+            cache[clave] = bloque
+        return [self._copia(flowable) for flowable in cache[clave]]
+    
+    def firmas(self):
+        """Tabla de firmas"""
+        cache = self._cache_local()
+        if 'firmas' not in cache:
+            firmas_data = [
+                ['Elaborado', 'Aprobado', 'Recibido'],
+                ['', '', ''],
+                ['', '', ''],
+                ['_________________', '_________________', '_________________']
+            ]
+            firmas_table = Table(firmas_data, colWidths=[2.2*inch, 2.2*inch, 2.2*inch])
+            firmas_table.setStyle(self.firmas_table_style)
+            cache['firmas'] = firmas_table
+        return self._copia(cache['firmas'])
+    
+    def bloque_cliente(self, cotizacion):
+        """Tabla con la información del cliente y de la cotización"""
+        # Los datos vienen del usuario: se escapan para que "<" o "&" no rompan el marcado
+        cliente = cotizacion['cliente']
+        texto = self._texto
+        cliente_data = [
+            [
+                Paragraph(f"""
+                <b>Cliente</b><br/>
+                <b>Nombre:</b> {texto(cliente['nombre'])}<br/>
+                <b>NIT/Cédula:</b> {texto(cliente.get('nit_cedula', 'N/A'))}<br/>
+                <b>Empresa:</b> {texto(cliente.get('empresa', 'N/A'))}<br/>
+                <b>Teléfono:</b> {texto(cliente.get('telefono', 'N/A'))}<br/>
+                <b>Email:</b> {texto(cliente.get('email', 'N/A'))}
+                """, self.header_style),
+                Paragraph(f"""
+                <b>Fecha:</b> {texto(cotizacion['fecha'])}<br/>
+                <b>Vencimiento:</b> {texto(cotizacion['fecha_vencimiento'])}<br/>
+                <b>Ubicación:</b> {texto(cotizacion['ubicacion'])}<br/>
+                <b>IVA incluido:</b> {'Sí' if cotizacion['incluye_iva'] else 'No'}
+                """, self.header_style)
+            ]
+        ]
+        
+        cliente_table = Table(cliente_data, colWidths=[3.3*inch, 3.3*inch])
+        cliente_table.setStyle(self.cliente_table_style)
+        return cliente_table
+    
+    def tabla_productos(self, items):
+        """Tabla de productos de la cotización"""
+        productos_headers = [
+            'Referencia', 'Descripción', 'Tipo', 'Acabado', 'Cantidad', 'Precio Unitario', 'Total'
+        ]
+        
+        # Datos de productos
+        productos_data = [productos_headers]
+        
+        for item in items:
+            productos_data.append([
+                item['referencia'],
+                item['descripcion'][:25] if len(item['descripcion']) > 25 else item['descripcion'],
+                item['tipo_madera'][:15] if len(item['tipo_madera']) > 15 else item['tipo_madera'],
+                item['acabado'][:12] if len(item['acabado']) > 12 else item['acabado'],
+                str(item['cantidad']),
+                item['precio_unitario'],
+                item['total']
+            ])
+        
+        # Crear tabla de productos
+        productos_table = Table(
+            productos_data,
+            colWidths=[1.5*inch, 1.5*inch, 1.0*inch, 0.8*inch, 0.5*inch, 0.9*inch, 0.9*inch]
+        )
+        productos_table.setStyle(self.productos_table_style)
+        return productos_table
+    
+    def tabla_productos_extensa(self, items):
+        """Tabla de productos de una cotización extensa.
+        
+        Es una sola LongTable que ReportLab reparte entre las hojas repitiendo
+        el encabezado. Las celdas de texto se ajustan en varias líneas en lugar
+        de recortarse; el ajuste se calcula una vez por texto distinto y las
+        celdas siguen siendo cadenas, que se maquetan mucho más rápido que los
+        párrafos. Con el número de líneas de cada fila se pasan las alturas ya
+        calculadas, así ReportLab no vuelve a medir las filas restantes cada vez
+        que parte la tabla. El subtotal de cada hoja lo agrega subtotales_por_hoja.
+        """
+        columnas = [1.5*inch, 1.5*inch, 1.0*inch, 0.8*inch, 0.5*inch, 0.9*inch, 0.9*inch]
+        productos_headers = [
+            'Referencia', 'Descripción', 'Tipo', 'Acabado', 'Cantidad', 'Precio Unitario', 'Total'
+        ]
+        
+        # Texto ajustado al ancho de la columna (menos el padding), calculado columna por columna
+        lineas_por_fila = np.ones(len(items), dtype='int64')
+        
+        def ajustados(campo, columna):
+            ancho = columnas[columna] - 8
+            unicos = {}
+            celdas = []
+            lineas = []
+            for item in items:
+                texto = str(item[campo])
+                ajuste = unicos.get(texto)
+                if ajuste is None:
+                    partes = simpleSplit(texto, 'Helvetica', 6, ancho)
+                    ajuste = unicos[texto] = ('\n'.join(partes), len(partes))
+                celdas.append(ajuste[0])
+                lineas.append(ajuste[1])
+            np.maximum(lineas_por_fila, lineas, out=lineas_por_fila)
+            return celdas
+        
+        referencias = ajustados('referencia', 0)
+        descripciones = ajustados('descripcion', 1)
+        tipos = ajustados('tipo_madera', 2)
+        acabados = ajustados('acabado', 3)
+        cantidades = [str(item['cantidad']) for item in items]
+        precios = [item['precio_unitario'] for item in items]
+        totales = [_CeldaImporte(item['total'], item.get('total_numerico', 0)) for item in items]
+        
+        datos = [productos_headers]
+        datos.extend(map(list, zip(referencias, descripciones, tipos, acabados, cantidades, precios, totales)))
+        # Encabezado de una línea con la interlínea por defecto (12) y 3 + 3 de padding
+        alturas = [18.0] + (lineas_por_fila * self.INTERLINEA_EXTENSA + 6).tolist()
+        tabla = LongTable(datos, colWidths=columnas, rowHeights=alturas, repeatRows=1)
+        tabla.setStyle(self.productos_extensa_style)
+        return tabla
+    
+    def subtotales_por_hoja(self, doc):
+        """Imprimir al pie de cada hoja con productos su subtotal y el acumulado.
+        
+        Cada parte de la tabla extensa que se dibuja pasa por afterFlowable,
+        donde se suman sus importes; afterPage escribe el pie antes de cerrar
+        la hoja.
+        """
+        subtotal = None
+        acumulado = 0
+        
+        def despues_de_flowable(flowable):
+            nonlocal subtotal
+            if isinstance(flowable, LongTable):
+                importes = [fila[-1].valor for fila in flowable._cellvalues if isinstance(fila[-1], _CeldaImporte)]
+                subtotal = (subtotal or 0) + sum(importes)
+        
+        def despues_de_hoja():
+            nonlocal subtotal, acumulado
+            if subtotal is None:
+                return
+            acumulado += subtotal
+            canvas = doc.canv
+            canvas.saveState()
+            canvas.setFont('Helvetica-Bold', 7)
+            canvas.setFillColor(self.verde_construinmuniza)
+            canvas.drawRightString(
+                doc.pagesize[0] - doc.rightMargin,
+                doc.bottomMargin - 12,
+                f"Subtotal hoja {doc.page}: {formatear_pesos(subtotal)}    Acumulado: {formatear_pesos(acumulado)}"
+            )
+            canvas.restoreState()
+            subtotal = None
+        
+        doc.afterFlowable = despues_de_flowable
+        doc.afterPage = despues_de_hoja
+    
+    def tabla_totales(self, resumen):
+        """Tabla de totales de la cotización"""
+        totales_data = [
+            ['', 'Valor Subtotal:', resumen['subtotal']],
+        ]
+        
+        if resumen['descuento']:
+            totales_data.append(['', 'Descuento:', resumen['descuento']])
+        
+        totales_data.append(['', 'Total:', resumen['total']])
+        
+        totales_table = Table(totales_data, colWidths=[3.5*inch, 1.5*inch, 1.5*inch])
+        totales_table.setStyle(self.totales_table_style)
+        return totales_table
+    
+    def construir(self, cotizacion, datos_empresa=None):
+        """Construir el PDF de una cotización y devolverlo en un BytesIO"""
+        buffer = BytesIO()
+        
+        # Configuración de la página con márgenes equilibrados
+        doc = SimpleDocTemplate(
+            buffer,
+            pagesize=A4,
+            rightMargin=15*mm,
+            leftMargin=15*mm,
+            topMargin=15*mm,
+            bottomMargin=15*mm
+        )
+        
+        # Datos de empresa por defecto
+        if datos_empresa is None:
+            datos_empresa = DATOS_EMPRESA_POR_DEFECTO
+        
+        # Contenido del PDF
+        story = []
+        
+        story.append(self.encabezado(datos_empresa, cotizacion['numero_cotizacion']))
+        story.append(Spacer(1, 20))
+        
+        # NÚMERO DE COTIZACIÓN DEBAJO DEL HEADER
+        story.append(Paragraph(
+            f"<b>COTIZACIÓN No. {self._texto(cotizacion['numero_cotizacion'])}</b>",
+            self.cotizacion_number_style
+        ))
+        
+        # TÍTULO
+        story.append(Paragraph("PRECOTIZACIÓN CONSTRUINMUNIZA", self.title_style))
+        story.append(Spacer(1, 15))
+        
+        # INFORMACIÓN DEL CLIENTE Y COTIZACIÓN
+        story.append(self.bloque_cliente(cotizacion))
+        story.append(Spacer(1, 20))
+        
+        # TABLA DE PRODUCTOS (con subtotal por hoja si la cotización es extensa)
+        if len(cotizacion['items']) > self.LINEAS_MODO_EXTENSO:
+            story.append(self.tabla_productos_extensa(cotizacion['items']))
+            self.subtotales_por_hoja(doc)
+        else:
+            story.append(self.tabla_productos(cotizacion['items']))
+        story.append(Spacer(1, 20))
+        
+        # TOTALES
+        story.append(self.tabla_totales(cotizacion['resumen']))
+        story.append(Spacer(1, 30))
+        
+        # CONDICIONES GENERALES
+        if cotizacion.get('condiciones'):
+            story.extend(self.condiciones(cotizacion['condiciones']))
+        
+        # FIRMAS
+        story.append(self.firmas())
+        
+        # Generar PDF
+        doc.build(story)
+        buffer.seek(0)
+        return buffer
+
+_plantilla_pdf = None
+_plantilla_pdf_lock = threading.Lock()
+
+def obtener_plantilla_pdf():
+    """Plantilla PDF compartida por el proceso (se prepara en el primer uso)"""
+    global _plantilla_pdf
+    if _plantilla_pdf is None:
+        with _plantilla_pdf_lock:
+            if _plantilla_pdf is None:
+                _plantilla_pdf = PlantillaPDF()
+    return _plantilla_pdf
+
+def nombre_archivo_pdf(cotizacion):
+    """Nombre del archivo PDF de una cotización"""
+    return f"Cotizacion_Construinmuniza_{cotizacion['numero_cotizacion']}.pdf"
+
+DIRECTORIO_CACHE_PDF = ".cache_pdf"
+
+class CachePDF:
+    """Caché en disco de PDF generados, direccionada por contenido.
+    
+    La clave es un hash de la cotización (serializada de forma canónica), los
+    datos de empresa, la versión de la plantilla y el logo: si nada de eso
+    cambia, el PDF se sirve desde disco sin volver a generarlo. El tamaño total
+    se limita a `maximo_bytes` expulsando los PDF menos usados (por fecha de
+    último acceso, que se actualiza en cada lectura). Es segura entre procesos:
+    cada PDF se escribe en un temporal y se renombra de forma atómica.
+    """
+    
+    def __init__(self, directorio=DIRECTORIO_CACHE_PDF, maximo_bytes=200 * 1024 * 1024, logo_path="logo.png"):
+        self.directorio = directorio
+        self.maximo_bytes = maximo_bytes
+        self.logo_path = logo_path
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+    
+    def clave(self, cotizacion, datos_empresa=None):
+        """Hash del contenido que determina el PDF"""
+        try:
+            logo = os.stat(self.logo_path)
+            firma_logo = [logo.st_mtime_ns, logo.st_size]
+        except OSError:
+            firma_logo = None
+        contenido = json.dumps(
+            {
+                'plantilla': PlantillaPDF.VERSION,
+                'logo': firma_logo,
+                'empresa': datos_empresa or DATOS_EMPRESA_POR_DEFECTO,
+                'cotizacion': cotizacion
+            },
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+    
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.pdf")
+    
+    def leer(self, clave):
+        """Bytes del PDF guardado con esa clave, o None"""
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, 'rb') as f:
+                contenido = f.read()
+            os.utime(ruta)  # marca de uso para la expulsión LRU
+        except OSError:
+            with self._lock:
+                self.fallos += 1
+            return None
+        with self._lock:
+            self.aciertos += 1
+        return contenido
+    
+    def guardar(self, clave, contenido):
+        """Guardar un PDF y expulsar los menos usados si se supera el tamaño máximo"""
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            temporal = f"{self._ruta(clave)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporal, 'wb') as f:
+                f.write(contenido)
+            os.replace(temporal, self._ruta(clave))
+            self._expulsar()
+        except OSError:
+            # Sin caché en disco el PDF igual se entrega
+            pass
+    
+    def obtener(self, cotizacion, datos_empresa, generar):
+        """PDF de la caché o, si no está, el resultado de generar() (que se guarda)"""
+        clave = self.clave(cotizacion, datos_empresa)
+        contenido = self.leer(clave)
+        if contenido is None:
+            contenido = generar()
+            self.guardar(clave, contenido)
+        return contenido
+    
+    def _archivos(self):
+        try:
+            with os.scandir(self.directorio) as entradas:
+                return [
+                    (e.stat().st_mtime_ns, e.stat().st_size, e.path)
+                    for e in entradas if e.name.endswith('.pdf')
+                ]
+        except OSError:
+            return []
+    
+    def _expulsar(self):
+        archivos = self._archivos()
+        total = sum(tamano for _, tamano, _ in archivos)
+        if total <= self.maximo_bytes:
+            return
+        for _, tamano, ruta in sorted(archivos):
+            try:
+                os.remove(ruta)
+            except OSError:
+                continue
+            total -= tamano
+            if total <= self.maximo_bytes:
+                break
+    
+    def limpiar(self):
+        shutil.rmtree(self.directorio, ignore_errors=True)
+    
+    def estadisticas(self):
+        archivos = self._archivos()
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(archivos),
+                'bytes': sum(tamano for _, tamano, _ in archivos),
+                'maximo_bytes': self.maximo_bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0
+            }
+
+@st.cache_resource
+def obtener_cache_pdf():
+    """Caché de PDF compartida por todas las sesiones (sobrevive a las recargas del script)"""
+    return CachePDF()
+
+# PDF ya generados, compartidos por sesiones y procesos a través del disco
+CACHE_PDF = recurso_del_proceso(obtener_cache_pdf)
+
+def _renderizar_pdf_lote(indice, cotizacion, datos_empresa):
+    """Tarea de un proceso del lote: cada proceso prepara su propia plantilla"""
+    return indice, obtener_plantilla_pdf().construir(cotizacion, datos_empresa).getvalue()
+
+def generar_pdfs_lote(cotizaciones, datos_empresa=None, max_procesos=None, destino_zip=None, progreso=None, destino_directorio=None):
+    """Generar los PDF de muchas cotizaciones en paralelo con un pool de procesos.
+    
+    Cada PDF es idéntico al de generar_pdf_cotizacion. Como máximo hay
+    2 × max_procesos cotizaciones en vuelo, así que la memoria no crece con el
+    tamaño del lote. Si se indica destino_zip (ruta o archivo) o
+    destino_directorio los PDF se escriben ahí a medida que terminan; si no, se
+    devuelven en 'pdfs' en el mismo orden de entrada. progreso(completadas,
+    total) se llama tras cada PDF.
+    """
+    cotizaciones = list(cotizaciones)
+    total = len(cotizaciones)
+    if max_procesos is None:
+        max_procesos = os.cpu_count() or 1
+    max_procesos = max(1, min(max_procesos, total or 1))
+    
+    pdfs = [None] * total
+    errores = []
+    archivo_zip = zipfile.ZipFile(destino_zip, 'w', zipfile.ZIP_DEFLATED) if destino_zip is not None else None
+    if destino_directorio is not None:
+        os.makedirs(destino_directorio, exist_ok=True)
+    completadas = 0
+    
+    def registrar(indice, contenido=None, error=None):
+        nonlocal completadas
+        completadas += 1
+        if error is not None:
+            errores.append({
+                'indice': indice,
+                'numero_cotizacion': cotizaciones[indice].get('numero_cotizacion'),
+                'error': str(error)
+            })
+        elif archivo_zip is not None:
+            archivo_zip.writestr(nombre_archivo_pdf(cotizaciones[indice]), contenido)
+        elif destino_directorio is not None:
+            with open(os.path.join(destino_directorio, nombre_archivo_pdf(cotizaciones[indice])), 'wb') as f:
+                f.write(contenido)
+        else:
+            pdfs[indice] = contenido
+        if progreso is not None:
+            progreso(completadas, total)
+    
+    try:
+        if max_procesos == 1:
+            # Sin paralelismo no vale la pena pagar el arranque del pool
+            for indice, cotizacion in enumerate(cotizaciones):
+                try:
+                    registrar(*_renderizar_pdf_lote(indice, cotizacion, datos_empresa))
+                except Exception as e:
+                    registrar(indice, error=e)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            
+            with ProcessPoolExecutor(max_workers=max_procesos) as pool:
+                pendientes = {}
+                siguientes = iter(enumerate(cotizaciones))
+                while True:
+                    for indice, cotizacion in siguientes:
+                        futuro = pool.submit(_renderizar_pdf_lote, indice, cotizacion, datos_empresa)
+                        pendientes[futuro] = indice
+                        if len(pendientes) >= 2 * max_procesos:
+                            break
+                    if not pendientes:
+                        break
+                    listos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                    for futuro in listos:
+                        indice = pendientes.pop(futuro)
+                        try:
+                            registrar(*futuro.result())
+                        except Exception as e:
+                            registrar(indice, error=e)
+    finally:
+        if archivo_zip is not None:
+            archivo_zip.close()
+    
+    return {
+        'exito': not errores,
+        'total': total,
+        'generados': total - len(errores),
+        'pdfs': pdfs if archivo_zip is None and destino_directorio is None else None,
+        'zip': destino_zip,
+        'directorio': destino_directorio,
+        'errores': errores
+    }
+
+class RenderizadorPDF:
+    """Genera PDF de cotizaciones en hilos de fondo.
+    
+    Los trabajos se identifican por la clave de contenido de CachePDF: pedir
+    otra vez el mismo PDF devuelve el trabajo en curso (o ya terminado) en
+    lugar de lanzar uno nuevo, y si el PDF ya está en la caché en disco no se
+    vuelve a generar. Se recuerdan los últimos `maximo` trabajos.
+    """
+    
+    def __init__(self, max_hilos=2, maximo=64, cache=None):
+        self.maximo = maximo
+        self.cache = cache if cache is not None else CACHE_PDF
+        self._pool = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix='pdf')
+        self._trabajos = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _generar(self, clave, cotizacion, datos_empresa):
+        contenido = self.cache.leer(clave)
+        if contenido is None:
+            contenido = obtener_plantilla_pdf().construir(cotizacion, datos_empresa).getvalue()
+            self.cache.guardar(clave, contenido)
+        return contenido
+    
+    def solicitar(self, cotizacion, datos_empresa=None):
+        """Encolar el PDF de una cotización (si no está ya en curso) y devolver su clave"""
+        clave = self.cache.clave(cotizacion, datos_empresa)
+        with self._lock:
+            futuro = self._trabajos.get(clave)
+            if futuro is not None and not (futuro.done() and futuro.exception() is not None):
+                self._trabajos.move_to_end(clave)
+                return clave
+            # Se entrega una copia por si la sesión modifica la cotización mientras tanto
+            self._trabajos[clave] = self._pool.submit(
+                self._generar, clave, copy.deepcopy(cotizacion), dict(datos_empresa) if datos_empresa else None
+            )
+            self._trabajos.move_to_end(clave)
+            # Olvidar los trabajos terminados más antiguos
+            for antigua in list(self._trabajos):
+                if len(self._trabajos) <= self.maximo:
+                    break
+                if self._trabajos[antigua].done():
+                    del self._trabajos[antigua]
+        return clave
+    
+    def estado(self, clave):
+        """Estado de un trabajo: {'estado': 'pendiente'|'listo'|'error'|'desconocido', 'pdf', 'error'}"""
+        with self._lock:
+            futuro = self._trabajos.get(clave)
+        if futuro is None:
+            # Trabajo ya olvidado (o de otro proceso): puede seguir en la caché en disco
+            contenido = self.cache.leer(clave) if clave else None
+            if contenido is not None:
+                return {'estado': 'listo', 'pdf': contenido, 'error': None}
+            return {'estado': 'desconocido', 'pdf': None, 'error': None}
+        if not futuro.done():
+            return {'estado': 'pendiente', 'pdf': None, 'error': None}
+        error = futuro.exception()
+        if error is not None:
+            return {'estado': 'error', 'pdf': None, 'error': str(error)}
+        return {'estado': 'listo', 'pdf': futuro.result(), 'error': None}
+
+@st.cache_resource
+def obtener_renderizador_pdf():
+    """Renderizador de PDF compartido por todas las sesiones (sobrevive a las recargas del script)"""
+    return RenderizadorPDF()
+
+ARCHIVO_COTIZACIONES = "cotizaciones.db"
+
+ESQUEMA_COTIZACIONES = """
+CREATE TABLE IF NOT EXISTS cotizaciones (
+    numero TEXT PRIMARY KEY,
+    fecha TEXT NOT NULL,
+    fecha_vencimiento TEXT,
+    cliente_nombre TEXT,
+    cliente_nit TEXT,
+    nit_normalizado TEXT,
+    cliente_empresa TEXT,
+    cliente_telefono TEXT,
+    cliente_email TEXT,
+    ubicacion TEXT,
+    incluye_iva INTEGER,
+    subtotal REAL,
+    descuento REAL,
+    total REAL,
+    lineas INTEGER,
+    creada_en TEXT NOT NULL,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    numero TEXT NOT NULL REFERENCES cotizaciones(numero) ON DELETE CASCADE,
+    linea INTEGER NOT NULL,
+    referencia TEXT,
+    referencia_normalizada TEXT,
+    descripcion TEXT,
+    cantidad REAL,
+    precio_unitario REAL,
+    total REAL,
+    PRIMARY KEY (numero, linea)
+);
+CREATE INDEX IF NOT EXISTS idx_cotizaciones_nit_fecha ON cotizaciones(nit_normalizado, fecha);
+CREATE INDEX IF NOT EXISTS idx_cotizaciones_fecha ON cotizaciones(fecha);
+CREATE INDEX IF NOT EXISTS idx_items_referencia ON items(referencia_normalizada, numero);
+"""
+
+def normalizar_nit(nit):
+    """NIT o cédula solo con sus dígitos (y la letra del dígito de verificación si la hay)"""
+    return re.sub(r'[^0-9A-Z]', '', str(nit or '').upper())
+
+def _fecha_iso(fecha):
+    """Fecha dd/mm/aaaa de la cotización, ISO (aaaa-mm-dd) o date/datetime en formato ISO para ordenar e indexar"""
+    if not fecha:
+        return None
+    if hasattr(fecha, 'strftime'):
+        return fecha.strftime('%Y-%m-%d')
+    texto = str(fecha).strip()
+    for convertir in (lambda t: datetime.strptime(t, '%d/%m/%Y'), datetime.fromisoformat):
+        try:
+            return convertir(texto).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha inválida: {fecha!r} (se espera dd/mm/aaaa o aaaa-mm-dd)")
+
+class BaseSQLite:
+    """Conexión SQLite por hilo (modo WAL) y transacciones de escritura"""
+    
+    def __init__(self, ruta, esquema):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._conexion().executescript(esquema)
+    
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.execute("PRAGMA foreign_keys=ON")
+            self._local.conexion = conexion
+        return conexion
+    
+    @contextmanager
+    def _transaccion(self):
+        """Transacción de escritura: BEGIN IMMEDIATE toma el lock de escritura de una vez"""
+        conexion = self._conexion()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            yield conexion
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+        conexion.execute("COMMIT")
+
+ESQUEMA_SECUENCIAS = """
+CREATE TABLE IF NOT EXISTS secuencias (
+    periodo TEXT PRIMARY KEY,
+    ultimo INTEGER NOT NULL
+);
+"""
+
+class AsignadorNumeros(BaseSQLite):
+    """Numeración de cotizaciones COT-CONST-AAAAMM-NNNNNN sin colisiones.
+    
+    Cada mes tiene su propia secuencia creciente guardada en SQLite; reservar
+    números es una transacción BEGIN IMMEDIATE, así que es seguro entre hilos y
+    entre procesos. Con tamano_bloque > 1 cada proceso reserva bloques de
+    números y los entrega desde memoria (bajo un lock) sin ir a la base por
+    cada cotización; los números de un bloque que no se usen quedan sin
+    asignar, pero nunca se repiten. El sufijo crece más allá de 6 cifras en
+    lugar de dar la vuelta.
+    """
+    
+    PREFIJO = "COT-CONST"
+    
+    def __init__(self, ruta=ARCHIVO_COTIZACIONES, tamano_bloque=1):
+        super().__init__(ruta, ESQUEMA_SECUENCIAS)
+        self.tamano_bloque = max(1, int(tamano_bloque))
+        self._lock = threading.Lock()
+        self._bloques = {}  # periodo -> [siguiente, último reservado]
+    
+    @classmethod
+    def formatear(cls, periodo, secuencia):
+        return f"{cls.PREFIJO}-{periodo}-{secuencia:06d}"
+    
+    def reservar_bloque(self, cantidad, fecha=None):
+        """Reservar `cantidad` números consecutivos del mes; devuelve (periodo, primero, último)"""
+        cantidad = int(cantidad)
+        if cantidad < 1:
+            raise ValueError('La cantidad de números a reservar debe ser positiva')
+        periodo = (fecha or datetime.now()).strftime('%Y%m')
+        with self._transaccion() as conexion:
+            conexion.execute(
+                "INSERT INTO secuencias (periodo, ultimo) VALUES (?, ?) "
+                "ON CONFLICT(periodo) DO UPDATE SET ultimo = ultimo + excluded.ultimo",
+                (periodo, cantidad)
+            )
+            ultimo = conexion.execute("SELECT ultimo FROM secuencias WHERE periodo = ?", (periodo,)).fetchone()[0]
+        return periodo, ultimo - cantidad + 1, ultimo
+    
+    def numeros(self, cantidad, fecha=None):
+        """Lista de `cantidad` números nuevos, reservados en una sola transacción"""
+        periodo, primero, ultimo = self.reservar_bloque(cantidad, fecha)
+        return [self.formatear(periodo, secuencia) for secuencia in range(primero, ultimo + 1)]
+    
+    def siguiente(self, fecha=None):
+        """Número siguiente, tomado del bloque reservado por este proceso"""
+        periodo = (fecha or datetime.now()).strftime('%Y%m')
+        with self._lock:
+            bloque = self._bloques.get(periodo)
+            if bloque is None or bloque[0] > bloque[1]:
+                _, primero, ultimo = self.reservar_bloque(self.tamano_bloque, fecha)
+                bloque = self._bloques[periodo] = [primero, ultimo]
+            secuencia = bloque[0]
+            bloque[0] += 1
+        return self.formatear(periodo, secuencia)
+
+class RepositorioCotizaciones(BaseSQLite):
+    """Cotizaciones guardadas en SQLite: encabezado, líneas y totales.
+    
+    Cada hilo usa su propia conexión; la base está en modo WAL, así que
+    varias sesiones o procesos pueden leer mientras otro escribe. La cotización
+    completa se guarda además como JSON para recuperarla tal como se generó.
+    La numeración la lleva un AsignadorNumeros sobre la misma base.
+    """
+    
+    def __init__(self, ruta=ARCHIVO_COTIZACIONES, tamano_bloque=1):
+        super().__init__(ruta, ESQUEMA_COTIZACIONES)
+        self.numeracion = AsignadorNumeros(ruta, tamano_bloque)
+    
+    def siguiente_numero(self, fecha=None):
+        """Número de cotización siguiente en la secuencia del mes (atómico entre procesos)"""
+        return self.numeracion.siguiente(fecha)
+    
+    def guardar(self, cotizacion):
+        """Guardar (o reemplazar) una cotización con sus líneas"""
+        return self.guardar_varias([cotizacion])
+    
+    def guardar_varias(self, cotizaciones):
+        """Guardar varias cotizaciones en una sola transacción"""
+        encabezados = []
+        lineas = []
+        creada_en = datetime.now().isoformat(timespec='seconds')
+        for cotizacion in cotizaciones:
+            cliente = cotizacion.get('cliente') or {}
+            resumen = cotizacion.get('resumen') or {}
+            numero = cotizacion['numero_cotizacion']
+            encabezados.append((
+                numero,
+                _fecha_iso(cotizacion['fecha']),
+                _fecha_iso(cotizacion.get('fecha_vencimiento')),
+                cliente.get('nombre'),
+                cliente.get('nit_cedula'),
+                normalizar_nit(cliente.get('nit_cedula')),
+                cliente.get('empresa'),
+                cliente.get('telefono'),
+                cliente.get('email'),
+                cotizacion.get('ubicacion'),
+                int(bool(cotizacion.get('incluye_iva'))),
+                resumen.get('subtotal_numerico'),
+                resumen.get('descuento_numerico'),
+                resumen.get('total_numerico'),
+                len(cotizacion['items']),
+                creada_en,
+                json.dumps(cotizacion, ensure_ascii=False, default=str)
+            ))
+            for linea, item in enumerate(cotizacion['items'], start=1):
+                lineas.append((
+                    numero,
+                    linea,
+                    item['referencia'],
+                    normalizar_referencia(item['referencia']),
+                    item.get('descripcion'),
+                    item.get('cantidad'),
+                    item.get('precio_unitario_numerico'),
+                    item.get('total_numerico')
+                ))
+        
+        with self._transaccion() as conexion:
+            conexion.executemany("DELETE FROM items WHERE numero = ?", [(e[0],) for e in encabezados])
+            conexion.executemany(
+                f"INSERT OR REPLACE INTO cotizaciones VALUES ({', '.join('?' * 17)})",
+                encabezados
+            )
+            conexion.executemany("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?)", lineas)
+        
+        return {
+            'exito': True,
+            'guardadas': len(encabezados),
+            'mensaje': f'{len(encabezados)} cotizaciones guardadas'
+        }
+    
+    def obtener(self, numero):
+        """Cotización completa tal como se guardó, o None"""
+        fila = self._conexion().execute("SELECT datos FROM cotizaciones WHERE numero = ?", (numero,)).fetchone()
+        return json.loads(fila['datos']) if fila else None
+    
+    def buscar(self, nit=None, referencia=None, desde=None, hasta=None, limite=200):
+        """Encabezados de cotizaciones por NIT, referencia cotizada y rango de fechas (más recientes primero)"""
+        condiciones = []
+        parametros = []
+        if nit:
+            condiciones.append("c.nit_normalizado = ?")
+            parametros.append(normalizar_nit(nit))
+        if referencia:
+            condiciones.append("c.numero IN (SELECT numero FROM items WHERE referencia_normalizada = ?)")
+            parametros.append(normalizar_referencia(referencia))
+        if desde:
+            condiciones.append("c.fecha >= ?")
+            parametros.append(_fecha_iso(desde))
+        if hasta:
+            condiciones.append("c.fecha <= ?")
+            parametros.append(_fecha_iso(hasta))
+        
+        consulta = (
+            "SELECT c.numero, c.fecha, c.cliente_nombre, c.cliente_nit, c.cliente_empresa, "
+            "c.ubicacion, c.lineas, c.total FROM cotizaciones c"
+        )
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        consulta += " ORDER BY c.fecha DESC, c.numero DESC LIMIT ?"
+        parametros.append(limite)
+        
+        resultados = [dict(fila) for fila in self._conexion().execute(consulta, parametros)]
+        return {
+            'exito': True,
+            'resultados': resultados,
+            'total': len(resultados)
+        }
+    
+    def contar(self):
+        return self._conexion().execute("SELECT COUNT(*) FROM cotizaciones").fetchone()[0]
+
+@st.cache_resource
+def obtener_repositorio_cotizaciones():
+    """Repositorio de cotizaciones compartido por todas las sesiones"""
+    return RepositorioCotizaciones()
+
+@st.cache_resource
+def obtener_vigilante_catalogo():
+    """Vigilante de las fuentes del catálogo, uno por proceso, sobre el mismo almacén que leen las sesiones"""
+    return VigilanteCatalogo(almacen=obtener_almacen_catalogo()).iniciar()
 
 class GeneradorCotizacionesMadera:
-    def __init__(self):
+    def __init__(self, repositorio=None):
         self.productos = None
+        self.catalogo = None
+        # Protege el cambio de versión del catálogo (productos y snapshot van juntos)
+        self._lock_catalogo = threading.Lock()
+        # Repositorio de cotizaciones (numeración y guardado); opcional
+        self.repositorio = repositorio
         self.ubicaciones = {
             'caldas': {
                 'sin_iva': 'PRECIO CALDAS',
@@ -30,46 +2795,30 @@ class GeneradorCotizacionesMadera:
         
     def cargar_excel_automatico(self):
         """Cargar productos desde archivo Excel automáticamente"""
-        file_path = "GUION PARA IA LISTADO.xlsx"
+        file_path = ARCHIVO_CATALOGO
         
         try:
-            if not os.path.exists(file_path):
+            if not os.path.exists(file_path) and leer_meta_snapshot(ruta_snapshot_catalogo(file_path)) is None:
                 return {
                     'exito': False,
                     'error': f"No se encontró el archivo '{file_path}'",
                     'mensaje': f'Archivo {file_path} no encontrado en el directorio'
                 }
             
-            # Leer el archivo Excel
-            df = pd.read_excel(file_path, engine='openpyxl')
-            
-            # Limpiar nombres de columnas
-            df.columns = df.columns.str.strip()
-            
-            # Filtrar filas con referencia y descripción válidas
-            df = df.dropna(subset=['Referencia', 'DESCRIPCION'])
-            df = df[df['Referencia'].str.strip() != '']
-            df = df[df['DESCRIPCION'].str.strip() != '']
-            
-            # Limpiar precios (convertir a numérico)
-            columnas_precio = [
-                'PRECIO CALDAS',
-                'PRECIO CALDAS CON IVA',
-                'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL',
-                'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL IVA INCLUIDO'
-            ]
-            
-            for col in columnas_precio:
-                if col in df.columns:
-                    df[col] = df[col].apply(self.limpiar_precio)
-            
-            self.productos = df
+            # El catálogo (listado principal + fuentes secundarias) se lee una sola vez
+            # por proceso y se comparte entre sesiones
+            self._usar_catalogo(ALMACEN_CATALOGO.obtener())
+            df = self.productos
             
             return {
                 'exito': True,
                 'total_productos': len(df),
                 'mensaje': f'Excel cargado exitosamente con {len(df)} productos',
-                'columnas': list(df.columns)
+                'columnas': list(df.columns),
+                'version': self.catalogo.version,
+                'precios_invalidos': self.catalogo.precios_invalidos,
+                'conflictos': self.catalogo.conflictos,
+                'fuentes': self.catalogo.resumen_fuentes
             }
         except Exception as e:
             return {
@@ -80,460 +2829,458 @@ class GeneradorCotizacionesMadera:
     
     def limpiar_precio(self, precio):
         """Limpiar y convertir precio a número"""
-        if pd.isna(precio):
-            return 0
-        
-        # Convertir a string y limpiar
-        precio_str = str(precio)
-        # Remover caracteres no numéricos excepto punto y coma
-        precio_limpio = re.sub(r'[^\d.,]', '', precio_str)
-        # Remover comas (separadores de miles)
-        precio_limpio = precio_limpio.replace(',', '')
-        
-        try:
-            return float(precio_limpio)
-        except:
-            return 0
+        return limpiar_precio(precio)
     
     def formatear_precio(self, precio):
         """Formatear precio como moneda colombiana"""
-        if pd.isna(precio) or precio == 0:
-            return "$ 0"
-        return f"$ {precio:,.0f}".replace(',', '.')
+        return formatear_pesos(precio)
+    
+    def formatear_precios(self, precios):
+        """Formatear un arreglo de precios; cada valor distinto se formatea una sola vez"""
+        precios = np.asarray(precios, dtype='float64')
+        if len(precios) == 0:
+            return []
+        distintos, posiciones = np.unique(precios, return_inverse=True)
+        formateados = [self.formatear_precio(precio) for precio in distintos.tolist()]
+        return [formateados[i] for i in posiciones.ravel().tolist()]
+    
+    def obtener_snapshot(self):
+        """Snapshot del catálogo con el que trabaja este generador"""
+        catalogo = self.catalogo
+        if catalogo is not None and catalogo.productos is self.productos:
+            return catalogo
+        with self._lock_catalogo:
+            if self.catalogo is None or self.catalogo.productos is not self.productos:
+                # Productos asignados directamente, sin pasar por el almacén compartido
+                self.catalogo = SnapshotCatalogo.desde_dataframe(self.productos)
+            return self.catalogo
+    
+    def _usar_catalogo(self, snapshot):
+        with self._lock_catalogo:
+            self.productos = snapshot.productos
+            self.catalogo = snapshot
+    
+    def catalogo_publicado(self):
+        """Versión del catálogo publicada en el almacén, si es distinta de la de este generador"""
+        ruta = self.catalogo.ruta if self.catalogo is not None else None
+        if self.catalogo is not None and ruta is None:
+            # Catálogo asignado a mano: no sigue al almacén
+            return None
+        vigente = ALMACEN_CATALOGO.vigente(ruta)
+        if vigente is None or vigente is self.catalogo:
+            return None
+        return vigente
+    
+    def actualizar_catalogo(self):
+        """Pasar a la última versión publicada del catálogo; True si cambió.
+        
+        Cada llamada a los métodos de búsqueda y cotización trabaja sobre un
+        solo snapshot, así que el cambio no afecta a las que ya están en curso.
+        """
+        vigente = self.catalogo_publicado()
+        if vigente is None:
+            return False
+        self._usar_catalogo(vigente)
+        return True
     
-    def buscar_productos(self, termino_busqueda, ubicacion='caldas', incluir_iva=True, limite=10, solo_inmunizada=None):
-        """Buscar productos por descripción"""
+    def buscar_productos(self, termino_busqueda, ubicacion='caldas', incluir_iva=True, limite=10, solo_inmunizada=None, difuso=False, desplazamiento=0):
+        """Buscar productos por descripción, tipo de madera, acabado o uso.
+        
+        Con difuso=True tolera errores de digitación y ordena por relevancia.
+        Los resultados se entregan por páginas de `limite` productos a partir de
+        `desplazamiento`; 'siguiente' indica el desplazamiento de la próxima
+        página (None en la última) y 'total_coincidencias' el total encontrado.
+        """
         if self.productos is None or self.productos.empty:
             return {
                 'exito': False,
                 'mensaje': 'No hay productos cargados'
             }
         
-        # Filtrar productos que contengan el término de búsqueda
-        mask = self.productos['DESCRIPCION'].str.contains(
-            termino_busqueda, 
-            case=False, 
-            na=False
+        snapshot = self.obtener_snapshot()
+        clave = (
+            snapshot.version, plegar_texto(termino_busqueda).strip(), ubicacion, bool(incluir_iva),
+            solo_inmunizada, bool(difuso), limite, max(0, int(desplazamiento))
+        )
+        return CACHE_BUSQUEDAS.obtener(
+            clave,
+            lambda: self._buscar_productos(
+                snapshot, termino_busqueda, ubicacion, incluir_iva, limite, solo_inmunizada, difuso, desplazamiento
+            )
+        )
+    
+    def _buscar_productos(self, snapshot, termino_busqueda, ubicacion, incluir_iva, limite, solo_inmunizada, difuso, desplazamiento):
+        clave = (plegar_texto(termino_busqueda).strip(), solo_inmunizada, bool(difuso))
+        filas = snapshot.coincidencias(
+            clave,
+            lambda: self._calcular_coincidencias(snapshot, termino_busqueda, solo_inmunizada, difuso)
         )
         
-        # Filtro adicional por tipo de inmunización
-        if solo_inmunizada is not None:
-            if solo_inmunizada:
-                # Filtrar solo productos inmunizados (que NO contengan "SIN INMUNIZAR")
-                mask_inmunizada = ~self.productos['TIPO MADERA'].str.contains(
-                    'SIN INMUNIZAR', 
-                    case=False, 
-                    na=False
-                )
-            else:
-                # Filtrar solo productos sin inmunizar
-                mask_inmunizada = self.productos['TIPO MADERA'].str.contains(
-                    'SIN INMUNIZAR', 
-                    case=False, 
-                    na=False
-                )
-            mask = mask & mask_inmunizada
-        
-        resultados = self.productos[mask].head(limite)
+        desplazamiento = max(0, int(desplazamiento))
+        fin = desplazamiento + limite
+        resultados = ResultadosBusqueda(
+            self, snapshot.productos, filas[desplazamiento:fin], ubicacion, incluir_iva, snapshot.precios
+        )
         
-        if resultados.empty:
+        if len(resultados) == 0:
             return {
                 'exito': False,
-                'mensaje': f'No se encontraron productos para: {termino_busqueda}'
+                'mensaje': f'No se encontraron productos para: {termino_busqueda}',
+                'total_coincidencias': len(filas)
             }
         
-        # Formatear resultados
-        productos_formateados = []
-        for _, producto in resultados.iterrows():
-            producto_formateado = self.formatear_producto(producto, ubicacion, incluir_iva)
-            productos_formateados.append(producto_formateado)
-        
         return {
             'exito': True,
-            'resultados': productos_formateados,
-            'total': len(productos_formateados)
+            'resultados': resultados,
+            'total': len(resultados),
+            'total_coincidencias': len(filas),
+            'desplazamiento': desplazamiento,
+            'siguiente': fin if fin < len(filas) else None,
+            'anterior': max(0, desplazamiento - limite) if desplazamiento > 0 else None
         }
     
-    def formatear_producto(self, producto, ubicacion='caldas', incluir_iva=True):
-        """Formatear un producto con toda la información"""
-        ubicacion_config = self.ubicaciones[ubicacion]
-        columna_precio = ubicacion_config['con_iva'] if incluir_iva else ubicacion_config['sin_iva']
+    def _calcular_coincidencias(self, snapshot, termino_busqueda, solo_inmunizada, difuso):
+        """Arreglo completo de filas que coinciden con la búsqueda, en el orden a mostrar"""
+        indice = snapshot.indice_busqueda
         
-        precio = producto.get(columna_precio, 0)
+        if difuso:
+            filas = snapshot.indice_difuso.buscar(termino_busqueda)
+        else:
+            # Todas las palabras deben aparecer (como prefijo) en el producto
+            filas = indice.buscar(termino_busqueda)
+        if filas is None or len(filas) == 0:
+            # Sin coincidencias por palabras: búsqueda literal dentro de la descripción
+            mask = snapshot.productos['DESCRIPCION'].str.contains(
+                termino_busqueda.strip(),
+                case=False,
+                na=False,
+                regex=False
+            )
+            filas = np.flatnonzero(mask.to_numpy())
         
-        return {
-            'referencia': producto.get('Referencia', ''),
-            'descripcion': producto.get('DESCRIPCION', ''),
-            'tipo_madera': producto.get('TIPO MADERA', ''),
-            'acabado': producto.get('ACABADO DE LA MADERA', ''),
-            'uso': producto.get('USO', ''),
-            'garantia': producto.get('GARANTIA', ''),
-            'ubicacion': ubicacion,
-            'incluir_iva': incluir_iva,
-            'precio': self.formatear_precio(precio),
-            'precio_numerico': precio,
-            'precios': {
-                'caldas_sin_iva': producto.get('PRECIO CALDAS', 0),
-                'caldas_con_iva': producto.get('PRECIO CALDAS CON IVA', 0),
-                'chagualo_sin_iva': producto.get('PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL', 0),
-                'chagualo_con_iva': producto.get('PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL IVA INCLUIDO', 0)
-            }
-        }
+        # Filtro adicional por tipo de inmunización
+        return np.array(indice.filtrar_inmunizacion(filas, solo_inmunizada), dtype=np.int64)
     
-    def generar_cotizacion(self, productos_seleccionados, datos_cliente, opciones=None):
-        """Generar cotización completa"""
-        if opciones is None:
-            opciones = {}
-            
-        ubicacion = opciones.get('ubicacion', 'caldas')
-        incluir_iva = opciones.get('incluir_iva', True)
-        descuento_porcentaje = opciones.get('descuento', 0)
-        validez_dias = opciones.get('validez_dias', 30)
-        
-        subtotal = 0
-        items_cotizacion = []
-        
-        for item in productos_seleccionados:
-            cantidad = item.get('cantidad', 1)
-            precio_unitario = item['precio_numerico']
-            total_item = cantidad * precio_unitario
-            subtotal += total_item
-            
-            items_cotizacion.append({
-                'referencia': item['referencia'],
-                'descripcion': item['descripcion'],
-                'tipo_madera': item['tipo_madera'],
-                'acabado': item['acabado'],
-                'uso': item['uso'],
-                'garantia': item['garantia'],
-                'cantidad': cantidad,
-                'precio_unitario': self.formatear_precio(precio_unitario),
-                'total': self.formatear_precio(total_item),
-                'precio_unitario_numerico': precio_unitario,
-                'total_numerico': total_item
-            })
-        
-        # Calcular totales
-        valor_descuento = subtotal * (descuento_porcentaje / 100)
-        total = subtotal - valor_descuento
-        
-        fecha_actual = datetime.now()
-        fecha_vencimiento = fecha_actual + timedelta(days=validez_dias)
+    def buscar_por_referencia(self, referencias, ubicacion='caldas', incluir_iva=True):
+        """Buscar muchos productos por su referencia en una sola llamada"""
+        if self.productos is None or self.productos.empty:
+            return {
+                'exito': False,
+                'mensaje': 'No hay productos cargados'
+            }
         
-        ubicacion_texto = 'Caldas' if ubicacion == 'caldas' else 'Chagualo, Girardota, San Cristóbal'
+        snapshot = self.obtener_snapshot()
+        indice_referencias = snapshot.indice_referencias
+        filas = []
+        no_encontradas = []
+        for referencia in referencias:
+            fila = indice_referencias.get(normalizar_referencia(referencia))
+            if fila is None:
+                no_encontradas.append(referencia)
+            else:
+                filas.append(fila)
         
         return {
-            'numero_cotizacion': self.generar_numero_cotizacion(),
-            'fecha': fecha_actual.strftime('%d/%m/%Y'),
-            'fecha_vencimiento': fecha_vencimiento.strftime('%d/%m/%Y'),
-            'cliente': datos_cliente,
-            'ubicacion': ubicacion_texto,
-            'incluye_iva': incluir_iva,
-            'items': items_cotizacion,
-            'resumen': {
-                'subtotal': self.formatear_precio(subtotal),
-                'descuento': f'{descuento_porcentaje}% - {self.formatear_precio(valor_descuento)}' if descuento_porcentaje > 0 else None,
-                'total': self.formatear_precio(total),
-                'subtotal_numerico': subtotal,
-                'descuento_numerico': valor_descuento,
-                'total_numerico': total
-            },
-            'condiciones': self.obtener_condiciones_generales()
+            'exito': bool(filas),
+            'resultados': self.formatear_filas(filas, ubicacion, incluir_iva, snapshot),
+            'no_encontradas': no_encontradas,
+            'total': len(filas),
+            'mensaje': f'{len(filas)} referencias encontradas, {len(no_encontradas)} no encontradas'
         }
     
-    def generar_numero_cotizacion(self):
-        """Generar número único de cotización"""
-        fecha = datetime.now()
-        timestamp = str(int(fecha.timestamp()))[-6:]
-        return f"COT-CONST-{fecha.strftime('%Y%m')}-{timestamp}"
-    
-    def generar_pdf_cotizacion(self, cotizacion, datos_empresa=None):
-        """Generar PDF de la cotización con formato profesional y colores Construinmuniza"""
-        buffer = BytesIO()
-        
-        # Configuración de la página con márgenes equilibrados
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            rightMargin=15*mm,
-            leftMargin=15*mm,
-            topMargin=15*mm,
-            bottomMargin=15*mm
-        )
-        
-        # Colores Construinmuniza
-        verde_construinmuniza = colors.Color(27/255, 94/255, 32/255)  # #1B5E20
-        verde_claro_construinmuniza = colors.Color(46/255, 125/255, 50/255)  # #2E7D32
-        amarillo_construinmuniza = colors.Color(255/255, 193/255, 7/255)  # #FFC107
-        
-        # Estilos
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            textColor=verde_construinmuniza,
-            spaceAfter=12,
-            alignment=TA_CENTER,
-            fontName='Helvetica-Bold'
-        )
-        
-        header_style = ParagraphStyle(
-            'HeaderStyle',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.black,
-            alignment=TA_LEFT,
-            fontName='Helvetica'
-        )
+    def resolver_pedido(self, pedido, ubicacion='caldas', incluir_iva=True):
+        """Resolver un pedido (DataFrame referencia/cantidad) contra el catálogo.
         
-        # Datos de empresa por defecto
-        if datos_empresa is None:
-            datos_empresa = {
-                'nombre': 'Construinmuniza',
-                'nit': '900.XXX.XXX-X',
-                'direccion': 'Calle XX # XX - XX',
-                'telefono': 'XXX-XXXX',
-                'ciudad': 'Medellín',
-                'email': 'ventas@construinmuniza.com'
+        El cruce se hace de una sola vez sobre las columnas completas. Devuelve
+        los productos listos para generar_cotizacion (cada uno con su 'linea'
+        del pedido) y, por separado, las líneas con referencia desconocida, sin
+        precio o con cantidad inválida.
+        """
+        if self.productos is None or self.productos.empty:
+            return {
+                'exito': False,
+                'mensaje': 'No hay productos cargados'
             }
         
-        # Contenido del PDF
-        story = []
-        
-        # HEADER DE LA EMPRESA CON LOGO
-        logo_element = None
-        logo_path = "logo.png"
-        
-        if os.path.exists(logo_path):
-            try:
-                logo_element = Image(logo_path, width=80, height=80)
-            except Exception as e:
-                logo_element = Paragraph(f"""
-                <b>COTIZACIÓN</b><br/>
-                No. {cotizacion['numero_cotizacion']}
-                """, ParagraphStyle(
-                    'HeaderRight',
-                    parent=styles['Normal'],
-                    fontSize=12,
-                    textColor=verde_construinmuniza,
-                    alignment=TA_CENTER,
-                    fontName='Helvetica-Bold'
-                ))
-        else:
-            logo_element = Paragraph(f"""
-            <b>COTIZACIÓN</b><br/>
-            No. {cotizacion['numero_cotizacion']}
-            """, ParagraphStyle(
-                'HeaderRight',
-                parent=styles['Normal'],
-                fontSize=12,
-                textColor=verde_construinmuniza,
-                alignment=TA_CENTER,
-                fontName='Helvetica-Bold'
-            ))
-        
-        header_data = [
-            [
-                Paragraph(f"""
-                <b>{datos_empresa['nombre']}</b><br/>
-                <font color='#2E7D32'>Madera Inmunizada</font><br/>
-                NIT: {datos_empresa['nit']}<br/>
-                {datos_empresa['direccion']}<br/>
-                Tel: {datos_empresa['telefono']}<br/>
-                {datos_empresa['ciudad']}
-                """, header_style),
-                logo_element
-            ]
-        ]
-        
-        header_table = Table(header_data, colWidths=[4.2*inch, 2.5*inch])
-        header_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
-        
-        story.append(header_table)
-        story.append(Spacer(1, 20))
+        snapshot = self.obtener_snapshot()
+        indice_referencias = snapshot.indice_referencias
+        referencias = pd.Series(pedido['referencia'], dtype='object').reset_index(drop=True)
+        claves = referencias.astype(str).str.strip().str.upper()
+        filas = claves.map(indice_referencias)
+        texto_cantidad = pd.Series(pedido['cantidad'], dtype='object').reset_index(drop=True).astype(str)
+        cantidades = pd.to_numeric(
+            texto_cantidad.str.strip().str.replace(',', '.', regex=False),
+            errors='coerce'
+        )
+        # Línea 1 = primera fila de datos del archivo
+        lineas = np.arange(1, len(referencias) + 1)
         
-        # NÚMERO DE COTIZACIÓN DEBAJO DEL HEADER
-        cotizacion_number = Paragraph(f"<b>COTIZACIÓN No. {cotizacion['numero_cotizacion']}</b>", 
-                                    ParagraphStyle(
-                                        'CotizacionNumber',
-                                        parent=styles['Normal'],
-                                        fontSize=14,
-                                        textColor=verde_construinmuniza,
-                                        alignment=TA_CENTER,
-                                        fontName='Helvetica-Bold',
-                                        spaceAfter=15
-                                    ))
-        story.append(cotizacion_number)
+        vacias = (referencias.isna() | (claves == '')).to_numpy()
+        encontradas = filas.notna().to_numpy() & ~vacias
+        cantidad_valida = (cantidades.notna() & (cantidades > 0)).to_numpy()
+        posiciones = filas[encontradas].astype(np.int64).to_numpy()
         
-        # TÍTULO
-        story.append(Paragraph("PRECOTIZACIÓN CONSTRUINMUNIZA", title_style))
-        story.append(Spacer(1, 15))
+        precios = np.zeros(len(referencias), dtype='float64')
+        if encontradas.any():
+            precios[encontradas] = snapshot.precios[posiciones, POSICION_SEDE[ubicacion], int(bool(incluir_iva))]
+        con_precio = precios > 0
         
-        # INFORMACIÓN DEL CLIENTE Y COTIZACIÓN
-        cliente_data = [
-            [
-                Paragraph(f"""
-                <b>Cliente</b><br/>
-                <b>Nombre:</b> {cotizacion['cliente']['nombre']}<br/>
-                <b>NIT/Cédula:</b> {cotizacion['cliente'].get('nit_cedula', 'N/A')}<br/>
-                <b>Empresa:</b> {cotizacion['cliente'].get('empresa', 'N/A')}<br/>
-                <b>Teléfono:</b> {cotizacion['cliente'].get('telefono', 'N/A')}<br/>
-                <b>Email:</b> {cotizacion['cliente'].get('email', 'N/A')}
-                """, header_style),
-                Paragraph(f"""
-                <b>Fecha:</b> {cotizacion['fecha']}<br/>
-                <b>Vencimiento:</b> {cotizacion['fecha_vencimiento']}<br/>
-                <b>Ubicación:</b> {cotizacion['ubicacion']}<br/>
-                <b>IVA incluido:</b> {'Sí' if cotizacion['incluye_iva'] else 'No'}
-                """, header_style)
+        def reporte(mascara, valores):
+            return [
+                {'linea': int(linea), 'referencia': referencia, 'valor': valor}
+                for linea, referencia, valor in zip(
+                    lineas[mascara].tolist(),
+                    referencias[mascara].tolist(),
+                    valores[mascara].tolist()
+                )
             ]
-        ]
         
-        cliente_table = Table(cliente_data, colWidths=[3.3*inch, 3.3*inch])
-        cliente_table.setStyle(TableStyle([
-            ('BOX', (0, 0), (-1, -1), 1, verde_construinmuniza),
-            ('INNERGRID', (0, 0), (-1, -1), 1, verde_construinmuniza),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 10),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-            ('TOPPADDING', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-        ]))
+        no_encontradas = ~encontradas & ~vacias
+        sin_precio = encontradas & ~con_precio
+        cantidades_invalidas = encontradas & con_precio & ~cantidad_valida
+        validas = encontradas & con_precio & cantidad_valida
         
-        story.append(cliente_table)
-        story.append(Spacer(1, 20))
+        cantidades_validas = cantidades.to_numpy(dtype='float64', na_value=np.nan)[validas]
+        if np.all(cantidades_validas == np.round(cantidades_validas)):
+            cantidades_validas = cantidades_validas.astype(np.int64)
+        productos = self.formatear_filas(
+            filas[validas].astype(np.int64).to_numpy(), ubicacion, incluir_iva, snapshot
+        )
+        for producto, cantidad, linea in zip(productos, cantidades_validas.tolist(), lineas[validas].tolist()):
+            producto['cantidad'] = cantidad
+            producto['linea'] = linea
         
-        # TABLA DE PRODUCTOS
-        productos_headers = [
-            'Referencia', 'Descripción', 'Tipo', 'Acabado', 'Cantidad', 'Precio Unitario', 'Total'
-        ]
+        return {
+            'exito': bool(productos),
+            'productos': productos,
+            'no_encontradas': reporte(no_encontradas, referencias),
+            'sin_precio': reporte(sin_precio, referencias),
+            'cantidades_invalidas': reporte(cantidades_invalidas, texto_cantidad),
+            'total_lineas': len(referencias),
+            'mensaje': f'{len(productos)} de {len(referencias)} líneas del pedido listas para cotizar'
+        }
+    
+    def importar_pedido(self, archivo, ubicacion='caldas', incluir_iva=True):
+        """Importar un archivo de pedido CSV/Excel y resolverlo contra el catálogo"""
+        try:
+            pedido = leer_archivo_pedido(archivo)
+        except Exception as e:
+            return {
+                'exito': False,
+                'error': str(e),
+                'mensaje': 'Error al leer el archivo de pedido'
+            }
+        return self.resolver_pedido(pedido, ubicacion, incluir_iva)
+    
+    def cotizar_pedido(self, pedido, datos_cliente, opciones=None):
+        """Resolver un pedido (DataFrame referencia/cantidad) y generar su cotización.
         
-        # Datos de productos
-        productos_data = [productos_headers]
+        Además de la cotización devuelve las líneas que no se pudieron cotizar
+        (como resolver_pedido); 'exito' es False si no quedó ninguna línea.
+        """
+        opciones = opciones or {}
+        resuelto = self.resolver_pedido(pedido, opciones.get('ubicacion', 'caldas'), opciones.get('incluir_iva', True))
+        resultado = {
+            'exito': resuelto['exito'],
+            'cotizacion': None,
+            'no_encontradas': resuelto.get('no_encontradas', []),
+            'sin_precio': resuelto.get('sin_precio', []),
+            'cantidades_invalidas': resuelto.get('cantidades_invalidas', []),
+            'mensaje': resuelto['mensaje']
+        }
+        if resuelto['exito']:
+            resultado['cotizacion'] = self.generar_cotizacion(resuelto['productos'], datos_cliente, opciones)
+        return resultado
+    
+    def formatear_filas(self, filas, ubicacion='caldas', incluir_iva=True, snapshot=None):
+        """Formatear varias filas del catálogo a la vez, columna por columna.
         
-        for item in cotizacion['items']:
-            productos_data.append([
-                item['referencia'],
-                item['descripcion'][:25] if len(item['descripcion']) > 25 else item['descripcion'],
-                item['tipo_madera'][:15] if len(item['tipo_madera']) > 15 else item['tipo_madera'],
-                item['acabado'][:12] if len(item['acabado']) > 12 else item['acabado'],
-                str(item['cantidad']),
-                item['precio_unitario'],
-                item['total']
-            ])
+        Produce los mismos diccionarios que formatear_producto, sin recorrer
+        el DataFrame fila por fila. Las filas se refieren a `snapshot` (por
+        defecto, el catálogo actual del generador).
+        """
+        snapshot = snapshot or self.obtener_snapshot()
+        return list(ResultadosBusqueda(self, snapshot.productos, filas, ubicacion, incluir_iva, snapshot.precios))
+    
+    def formatear_producto(self, producto, ubicacion='caldas', incluir_iva=True):
+        """Formatear un producto con toda la información"""
+        ubicacion_config = self.ubicaciones[ubicacion]
+        columna_precio = ubicacion_config['con_iva'] if incluir_iva else ubicacion_config['sin_iva']
         
-        # Crear tabla de productos
-        productos_table = Table(
-            productos_data, 
-            colWidths=[1.5*inch, 1.5*inch, 1.0*inch, 0.8*inch, 0.5*inch, 0.9*inch, 0.9*inch]
-        )
+        def valor(columna):
+            # Las columnas compactadas en float32 se devuelven como float de Python
+            precio = producto.get(columna, 0)
+            return precio.item() if isinstance(precio, np.generic) else precio
         
-        productos_table.setStyle(TableStyle([
-            # Header con colores Construinmuniza
-            ('BACKGROUND', (0, 0), (-1, 0), verde_construinmuniza),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 7),
-            
-            # Datos
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 6),
-            ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # Referencia centrada
-            ('ALIGN', (1, 1), (1, -1), 'LEFT'),
-            ('ALIGN', (2, 1), (3, -1), 'CENTER'),  # Tipo y Acabado centrados
-            ('ALIGN', (4, 1), (4, -1), 'CENTER'),  # Cantidad centrada
-            ('ALIGN', (5, 1), (-1, -1), 'RIGHT'),  # Precios a la derecha
-            
-            # Bordes
-            ('BOX', (0, 0), (-1, -1), 1, verde_construinmuniza),
-            ('INNERGRID', (0, 0), (-1, -1), 0.5, verde_claro_construinmuniza),
+        precio = valor(columna_precio)
+        
+        return {
+            'referencia': producto.get('Referencia', ''),
+            'descripcion': producto.get('DESCRIPCION', ''),
+            'tipo_madera': producto.get('TIPO MADERA', ''),
+            'acabado': producto.get('ACABADO DE LA MADERA', ''),
+            'uso': producto.get('USO', ''),
+            'garantia': producto.get('GARANTIA', ''),
+            'ubicacion': ubicacion,
+            'incluir_iva': incluir_iva,
+            'precio': self.formatear_precio(precio),
+            'precio_numerico': precio,
+            'precios': {
+                'caldas_sin_iva': valor('PRECIO CALDAS'),
+                'caldas_con_iva': valor('PRECIO CALDAS CON IVA'),
+                'chagualo_sin_iva': valor('PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL'),
+                'chagualo_con_iva': valor('PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL IVA INCLUIDO')
+            },
+            'precios_formateados': {
+                variante: self.formatear_precio(valor(columna))
+                for variante, columna in VARIANTES_PRECIO.items()
+            }
+        }
+    
+    def generar_cotizacion(self, productos_seleccionados, datos_cliente, opciones=None):
+        """Generar cotización completa"""
+        if opciones is None:
+            opciones = {}
             
-            # Padding
-            ('LEFTPADDING', (0, 0), (-1, -1), 4),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-            ('TOPPADDING', (0, 0), (-1, -1), 3),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
+        ubicacion = opciones.get('ubicacion', 'caldas')
+        incluir_iva = opciones.get('incluir_iva', True)
+        descuento_porcentaje = opciones.get('descuento', 0)
+        validez_dias = opciones.get('validez_dias', 30)
         
-        story.append(productos_table)
-        story.append(Spacer(1, 20))
+        # Precios de cada item en todas las sedes; la cotización toma la de su sede e IVA
+        cantidades = [item.get('cantidad', 1) for item in productos_seleccionados]
+        precios = matriz_precios_items(productos_seleccionados, ubicacion, incluir_iva)
+        totales = totales_cotizacion(precios, cantidades, descuento_porcentaje)
+        sede, iva = POSICION_SEDE[ubicacion], int(bool(incluir_iva))
         
-        # TOTALES
-        totales_data = [
-            ['', 'Valor Subtotal:', cotizacion['resumen']['subtotal']],
-        ]
+        precios_unitarios = precios[:, sede, iva]
+        totales_items = totales['lineas'][:, sede, iva]
+        precios_formateados = self.formatear_precios(precios_unitarios)
+        totales_formateados = self.formatear_precios(totales_items)
         
-        if cotizacion['resumen']['descuento']:
-            totales_data.append(['', 'Descuento:', cotizacion['resumen']['descuento']])
+        items_cotizacion = []
+        for i, (item, cantidad, precio_unitario, total_item) in enumerate(
+            zip(productos_seleccionados, cantidades, precios_unitarios.tolist(), totales_items.tolist())
+        ):
+            items_cotizacion.append({
+                'referencia': item['referencia'],
+                'descripcion': item['descripcion'],
+                'tipo_madera': item['tipo_madera'],
+                'acabado': item['acabado'],
+                'uso': item['uso'],
+                'garantia': item['garantia'],
+                'cantidad': cantidad,
+                'precio_unitario': precios_formateados[i],
+                'total': totales_formateados[i],
+                'precio_unitario_numerico': precio_unitario,
+                'total_numerico': total_item
+            })
         
-        totales_data.append(['', 'Total:', cotizacion['resumen']['total']])
+        # Totales en pesos enteros: el subtotal es la suma exacta de las líneas
+        subtotal = int(totales['subtotal'][sede, iva])
+        valor_descuento = int(totales['descuento'][sede, iva])
+        total = int(totales['total'][sede, iva])
         
-        totales_table = Table(totales_data, colWidths=[3.5*inch, 1.5*inch, 1.5*inch])
-        totales_table.setStyle(TableStyle([
-            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (1, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (1, 0), (-1, -1), 9),
-            ('BOX', (1, 0), (-1, -1), 1, verde_construinmuniza),
-            ('INNERGRID', (1, 0), (-1, -1), 0.5, verde_claro_construinmuniza),
-            ('BACKGROUND', (1, -1), (-1, -1), colors.Color(241/255, 248/255, 233/255)),  # Verde muy claro
-            ('LEFTPADDING', (1, 0), (-1, -1), 6),
-            ('RIGHTPADDING', (1, 0), (-1, -1), 6),
-            ('TOPPADDING', (1, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (1, 0), (-1, -1), 6),
-        ]))
+        fecha_actual = datetime.now()
+        fecha_vencimiento = fecha_actual + timedelta(days=validez_dias)
         
-        story.append(totales_table)
-        story.append(Spacer(1, 30))
+        ubicacion_texto = 'Caldas' if ubicacion == 'caldas' else 'Chagualo, Girardota, San Cristóbal'
         
-        # CONDICIONES GENERALES
-        if cotizacion.get('condiciones'):
-            story.append(Paragraph("<b>Condiciones Generales:</b>", 
-                                 ParagraphStyle('ConditionsTitle', parent=styles['Normal'], 
-                                              fontSize=10, fontName='Helvetica-Bold',
-                                              textColor=verde_construinmuniza)))
-            story.append(Spacer(1, 8))
-            
-            for condicion in cotizacion['condiciones']:
-                story.append(Paragraph(f"• {condicion}", 
-                                     ParagraphStyle('Condition', parent=styles['Normal'], 
-                                                  fontSize=9, leftIndent=10)))
-            
-            story.append(Spacer(1, 20))
+        return {
+            'numero_cotizacion': opciones.get('numero_cotizacion') or self.generar_numero_cotizacion(),
+            'fecha': fecha_actual.strftime('%d/%m/%Y'),
+            'fecha_vencimiento': fecha_vencimiento.strftime('%d/%m/%Y'),
+            'cliente': datos_cliente,
+            'ubicacion': ubicacion_texto,
+            'incluye_iva': incluir_iva,
+            'items': items_cotizacion,
+            'resumen': {
+                'subtotal': self.formatear_precio(subtotal),
+                'descuento': f'{descuento_porcentaje}% - {self.formatear_precio(valor_descuento)}' if descuento_porcentaje > 0 else None,
+                'total': self.formatear_precio(total),
+                'subtotal_numerico': subtotal,
+                'descuento_numerico': valor_descuento,
+                'total_numerico': total
+            },
+            'condiciones': self.obtener_condiciones_generales()
+        }
+    
+    def comparar_sedes(self, productos_seleccionados, incluir_iva=True, descuento=0):
+        """Totales de los mismos productos en cada sede, para comparar dónde sale más económico"""
+        if not productos_seleccionados:
+            return {
+                'exito': False,
+                'mensaje': 'No hay productos seleccionados'
+            }
         
-        # FIRMAS
-        firmas_data = [
-            ['Elaborado', 'Aprobado', 'Recibido'],
-            ['', '', ''],
-            ['', '', ''],
-            ['_________________', '_________________', '_________________']
-        ]
+        cantidades = [item.get('cantidad', 1) for item in productos_seleccionados]
+        totales = totales_cotizacion(matriz_precios_items(productos_seleccionados, incluir_iva=incluir_iva), cantidades, descuento)
+        iva = int(bool(incluir_iva))
         
-        firmas_table = Table(firmas_data, colWidths=[2.2*inch, 2.2*inch, 2.2*inch])
-        firmas_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('TEXTCOLOR', (0, 0), (-1, 0), verde_construinmuniza),
-            ('TOPPADDING', (0, 0), (-1, -1), 15),
-        ]))
+        sedes = {}
+        for ubicacion, sede in POSICION_SEDE.items():
+            total = int(totales['total'][sede, iva])
+            sedes[ubicacion] = {
+                'subtotal_numerico': int(totales['subtotal'][sede, iva]),
+                'descuento_numerico': int(totales['descuento'][sede, iva]),
+                'total_numerico': total,
+                'total': self.formatear_precio(total)
+            }
+        mas_economica = min(sedes, key=lambda ubicacion: sedes[ubicacion]['total_numerico'])
+        diferencia = max(datos['total_numerico'] for datos in sedes.values()) - sedes[mas_economica]['total_numerico']
         
-        story.append(firmas_table)
+        return {
+            'exito': True,
+            'sedes': sedes,
+            'mas_economica': mas_economica,
+            'diferencia': self.formatear_precio(diferencia),
+            'diferencia_numerica': diferencia
+        }
+    
+    def generar_numero_cotizacion(self):
+        """Generar número único de cotización"""
+        if self.repositorio is not None:
+            return self.repositorio.siguiente_numero()
+        fecha = datetime.now()
+        timestamp = str(int(fecha.timestamp()))[-6:]
+        return f"COT-CONST-{fecha.strftime('%Y%m')}-{timestamp}"
+    
+    def reservar_numeros_cotizacion(self, cantidad):
+        """Reservar de una vez los números de un lote de cotizaciones.
         
-        # Generar PDF
-        doc.build(story)
-        buffer.seek(0)
-        return buffer
+        Cada número se pasa luego en opciones['numero_cotizacion'] de
+        generar_cotizacion, sin consultar la base por cada cotización.
+        """
+        if self.repositorio is None:
+            raise RuntimeError('Se necesita un repositorio de cotizaciones para reservar números')
+        return self.repositorio.numeracion.numeros(cantidad)
+    
+    def guardar_cotizacion(self, cotizacion):
+        """Guardar la cotización en el repositorio, si hay uno configurado"""
+        if self.repositorio is None:
+            return {
+                'exito': False,
+                'mensaje': 'No hay repositorio de cotizaciones configurado'
+            }
+        try:
+            return self.repositorio.guardar(cotizacion)
+        except sqlite3.Error as e:
+            return {
+                'exito': False,
+                'mensaje': f'Error al guardar la cotización: {str(e)}'
+            }
+    
+    def generar_pdf_cotizacion(self, cotizacion, datos_empresa=None):
+        """Generar PDF de la cotización con formato profesional y colores Construinmuniza"""
+        contenido = CACHE_PDF.obtener(
+            cotizacion, datos_empresa,
+            lambda: obtener_plantilla_pdf().construir(cotizacion, datos_empresa).getvalue()
+        )
+        return BytesIO(contenido)
+    
+    def generar_pdfs_lote(self, cotizaciones, datos_empresa=None, max_procesos=None, destino_zip=None, progreso=None, destino_directorio=None):
+        """Generar los PDF de varias cotizaciones en paralelo (ver generar_pdfs_lote)"""
+        return generar_pdfs_lote(cotizaciones, datos_empresa, max_procesos, destino_zip, progreso, destino_directorio)
     
     def obtener_condiciones_generales(self):
         """Condiciones generales de la cotización"""
@@ -545,21 +3292,46 @@ class GeneradorCotizacionesMadera:
             'Productos con garantía Construinmuniza'
         ]
     
+    def estado_catalogo(self):
+        """Versión y tamaño del catálogo vigente, sin recorrer la caché de PDF ni medir la memoria"""
+        if self.productos is None:
+            return None
+        snapshot = self.obtener_snapshot()
+        return {
+            'version_catalogo': snapshot.version,
+            'total_productos': len(snapshot.productos),
+            'cache_busquedas': CACHE_BUSQUEDAS.estadisticas()
+        }
+    
     def obtener_estadisticas(self):
         """Obtener estadísticas del catálogo"""
         if self.productos is None or self.productos.empty:
             return None
         
+        snapshot = self.obtener_snapshot()
+        productos = snapshot.productos
+        # Los productos que solo trae una fuente secundaria no tienen acabado ni uso
+        acabados = productos['ACABADO DE LA MADERA'].dropna()
+        usos = productos['USO'].dropna()
         stats = {
-            'total_productos': len(self.productos),
-            'acabados_disponibles': self.productos['ACABADO DE LA MADERA'].dropna().unique().tolist(),
-            'usos_disponibles': self.productos['USO'].dropna().unique().tolist()
+            'version_catalogo': snapshot.version,
+            'fuentes_catalogo': snapshot.resumen_fuentes,
+            'conflictos_precio': len(snapshot.conflictos),
+            # Cambios respecto de la versión anterior, si esta se aplicó en caliente
+            'cambios_catalogo': resumen_diferencias(snapshot.diferencias) if snapshot.diferencias else None,
+            'memoria_catalogo': snapshot.memoria,
+            'cache_busquedas': CACHE_BUSQUEDAS.estadisticas(),
+            'cache_pdf': CACHE_PDF.estadisticas(),
+            'total_productos': len(productos),
+            'acabados_disponibles': acabados[acabados != ''].unique().tolist(),
+            'usos_disponibles': usos[usos != ''].unique().tolist()
         }
         
         # Estadísticas de precios por ubicación
         for ubicacion, config in self.ubicaciones.items():
-            precios_sin_iva = self.productos[config['sin_iva']].dropna()
-            precios_con_iva = self.productos[config['con_iva']].dropna()
+            # En float64: algunas columnas se guardan en float32 y el promedio perdería precisión
+            precios_sin_iva = productos[config['sin_iva']].dropna().astype('float64')
+            precios_con_iva = productos[config['con_iva']].dropna().astype('float64')
             
             if not precios_sin_iva.empty:
                 stats[f'precios_{ubicacion}'] = {
@@ -573,6 +3345,27 @@ class GeneradorCotizacionesMadera:
         
         return stats
 
+RESULTADOS_POR_PAGINA = 20
+
+# Segundos entre consultas mientras se prepara el PDF
+INTERVALO_PDF = 0.5
+
+# Cotizaciones anteriores de la sesión que se ofrecen para volver a descargar
+MAX_HISTORIAL_PDF = 10
+
+def datos_empresa_sesion():
+    """Datos de empresa configurados en la sesión, o None para usar los de la plantilla"""
+    if not any(key.startswith('empresa_') for key in st.session_state.keys()):
+        return None
+    return {
+        'nombre': st.session_state.get('empresa_nombre', 'Construinmuniza'),
+        'nit': st.session_state.get('empresa_nit', '900.XXX.XXX-X'),
+        'direccion': st.session_state.get('empresa_direccion', 'Calle XX # XX - XX'),
+        'telefono': st.session_state.get('empresa_telefono', 'XXX-XXXX'),
+        'ciudad': st.session_state.get('empresa_ciudad', 'Medellín'),
+        'email': st.session_state.get('empresa_email', 'ventas@construinmuniza.com')
+    }
+
 def main():
     # Configuración de la página - DEBE IR PRIMERO
     st.set_page_config(
@@ -814,7 +3607,7 @@ def main():
     
     # Inicializar el generador
     if 'generador' not in st.session_state:
-        st.session_state.generador = GeneradorCotizacionesMadera()
+        st.session_state.generador = GeneradorCotizacionesMadera(repositorio=obtener_repositorio_cotizaciones())
     
     # Cargar archivo automáticamente
     if 'catalogo_cargado' not in st.session_state:
@@ -826,6 +3619,18 @@ def main():
             
             if resultado['exito']:
                 st.session_state.catalogo_cargado = True
+                if resultado['precios_invalidos']:
+                    referencias = sorted({p['referencia'] for p in resultado['precios_invalidos']})
+                    st.warning(
+                        f"⚠️ {len(resultado['precios_invalidos'])} precios no se pudieron interpretar y quedaron en $ 0 "
+                        f"(referencias: {', '.join(referencias[:10])}{'...' if len(referencias) > 10 else ''})"
+                    )
+                if resultado['conflictos']:
+                    referencias = sorted({c['referencia'] for c in resultado['conflictos']})
+                    st.info(
+                        f"ℹ️ {len(referencias)} referencias tienen precios distintos entre listados; "
+                        f"se usó el de {ARCHIVO_CATALOGO}"
+                    )
             else:
                 st.error(f"❌ {resultado['mensaje']}")
                 st.warning("💡 Asegúrate de que el archivo 'GUION PARA IA LISTADO.xlsx' esté en el directorio de la aplicación.")
@@ -835,6 +3640,23 @@ def main():
     if not st.session_state.get('catalogo_cargado', False):
         st.stop()
     
+    # Las versiones nuevas del listado se cargan en segundo plano; cada sesión
+    # pasa a la nueva solo cuando no tiene una cotización abierta
+    obtener_vigilante_catalogo()
+    if st.session_state.generador.catalogo_publicado() is not None:
+        if st.session_state.get('productos_cotizacion') or 'ultima_cotizacion' in st.session_state:
+            st.info("🔄 Hay precios actualizados; se aplicarán al terminar la cotización en curso.")
+        elif st.session_state.generador.actualizar_catalogo():
+            diferencias = st.session_state.generador.catalogo.diferencias
+            detalle = ''
+            if diferencias is not None:
+                cambios = resumen_diferencias(diferencias)
+                detalle = (
+                    f": {cambios['referencias_con_precio_cambiado']} precios cambiados, "
+                    f"{cambios['agregadas']} productos nuevos, {cambios['eliminadas']} retirados"
+                )
+            st.toast(f"🔄 Catálogo actualizado{detalle}")
+    
     # Layout principal con dos columnas
     col_main, col_cotizacion = st.columns([2, 1])
     
@@ -887,7 +3709,11 @@ def main():
                         st.markdown(f"📦 Cantidad: {producto['cantidad']}")
                     
                     with col_info2:
-                        st.markdown(f"💰 Precio: {producto['precio']}")
+                        # Precio en la sede e IVA elegidos ahora (el producto trae las cuatro variantes)
+                        precio = producto.get('precios_formateados', {}).get(
+                            f"{ubicacion}_{'con' if incluir_iva else 'sin'}_iva", producto['precio']
+                        )
+                        st.markdown(f"💰 Precio: {precio}")
                     
                     with col_btn:
                         if st.button("🗑️ Eliminar", key=f"eliminar_lateral_{i}", use_container_width=True):
@@ -898,11 +3724,18 @@ def main():
             total_items = sum(producto['cantidad'] for producto in st.session_state.productos_cotizacion)
             st.info(f"📊 **Total items:** {total_items}")
             
+            # Total en cada sede (sin descuento) para comparar
+            comparacion = st.session_state.generador.comparar_sedes(st.session_state.productos_cotizacion, incluir_iva)
+            sedes = comparacion['sedes']
+            st.caption(
+                f"💰 Caldas: {sedes['caldas']['total']} | Chagualo: {sedes['chagualo']['total']}"
+                + (f" — {comparacion['mas_economica'].capitalize()} ahorra {comparacion['diferencia']}" if comparacion['diferencia_numerica'] else '')
+            )
+            
             # Botón para limpiar toda la cotización
             if st.button("🗑️ Limpiar Todo", type="secondary", use_container_width=True):
                 st.session_state.productos_cotizacion = []
-                if 'pdf_generado' in st.session_state:
-                    del st.session_state.pdf_generado
+                st.session_state.pop('clave_pdf', None)
                 if 'ultima_cotizacion' in st.session_state:
                     del st.session_state.ultima_cotizacion
                 st.rerun()
@@ -917,8 +3750,133 @@ def main():
             "Describe el producto que buscas:",
             placeholder="Ej: tabla, piso, vareta, estacón, alfarda, rústico..."
         )
+        busqueda_difusa = st.checkbox(
+            "🔤 Tolerar errores de escritura",
+            value=True,
+            help="Ordena los resultados por relevancia y encuentra productos aunque la palabra esté mal escrita"
+        )
+        
+        # Búsqueda por códigos (listas enviadas por los clientes)
+        with st.expander("📋 Buscar por referencias"):
+            texto_referencias = st.text_area(
+                "Pega las referencias (una por línea o separadas por comas):",
+                key="texto_referencias"
+            )
+            if texto_referencias.strip():
+                referencias = [r for r in re.split(r'[\s,;]+', texto_referencias) if r]
+                resultado_refs = st.session_state.generador.buscar_por_referencia(
+                    referencias,
+                    ubicacion=ubicacion,
+                    incluir_iva=incluir_iva
+                )
+                
+                if resultado_refs['no_encontradas']:
+                    st.warning(f"⚠️ Referencias no encontradas: {', '.join(resultado_refs['no_encontradas'])}")
+                
+                if resultado_refs['exito']:
+                    st.dataframe(
+                        pd.DataFrame(resultado_refs['resultados'])[['referencia', 'descripcion', 'precio']],
+                        use_container_width=True,
+                        column_config={
+                            "referencia": "📋 Referencia",
+                            "descripcion": "🌲 Descripción",
+                            "precio": "💰 Precio"
+                        }
+                    )
+                    if st.button(f"🛒 Agregar {resultado_refs['total']} productos a la Cotización", key="agregar_referencias"):
+                        if 'productos_cotizacion' not in st.session_state:
+                            st.session_state.productos_cotizacion = []
+                        for producto in resultado_refs['resultados']:
+                            producto_con_cantidad = producto.copy()
+                            producto_con_cantidad['cantidad'] = 1
+                            st.session_state.productos_cotizacion.append(producto_con_cantidad)
+                        st.rerun()
+        
+        # Importación masiva de pedidos (contratistas)
+        with st.expander("📥 Importar pedido desde CSV/Excel"):
+            archivo_pedido = st.file_uploader(
+                "Archivo con columnas referencia y cantidad:",
+                type=['csv', 'xlsx', 'xls'],
+                key="archivo_pedido"
+            )
+            if archivo_pedido is not None:
+                resultado_pedido = st.session_state.generador.importar_pedido(
+                    archivo_pedido,
+                    ubicacion=ubicacion,
+                    incluir_iva=incluir_iva
+                )
+                
+                if 'productos' not in resultado_pedido:
+                    st.error(f"❌ {resultado_pedido['mensaje']}: {resultado_pedido.get('error', '')}")
+                else:
+                    st.info(f"📊 {resultado_pedido['mensaje']}")
+                    for clave, titulo in [
+                        ('no_encontradas', 'Referencias no encontradas'),
+                        ('sin_precio', 'Productos sin precio'),
+                        ('cantidades_invalidas', 'Cantidades inválidas')
+                    ]:
+                        if resultado_pedido[clave]:
+                            st.warning(f"⚠️ {titulo}: {len(resultado_pedido[clave])}")
+                            st.dataframe(pd.DataFrame(resultado_pedido[clave]), use_container_width=True)
+                    
+                    if resultado_pedido['exito'] and st.button("🛒 Agregar pedido a la Cotización", key="agregar_pedido"):
+                        if 'productos_cotizacion' not in st.session_state:
+                            st.session_state.productos_cotizacion = []
+                        st.session_state.productos_cotizacion.extend(resultado_pedido['productos'])
+                        st.rerun()
         
         # Realizar búsqueda
+        # Historial de cotizaciones guardadas
+        with st.expander("🗂️ Historial de cotizaciones"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                nit_historial = st.text_input("🆔 NIT/Cédula:", key="historial_nit")
+            with col2:
+                referencia_historial = st.text_input("📋 Referencia cotizada:", key="historial_referencia")
+            with col3:
+                anio_historial = st.number_input("📅 Año:", min_value=2000, max_value=2100, value=datetime.now().year, key="historial_anio")
+            
+            if nit_historial or referencia_historial:
+                repositorio = st.session_state.generador.repositorio
+                historial = repositorio.buscar(
+                    nit=nit_historial,
+                    referencia=referencia_historial,
+                    desde=datetime(int(anio_historial), 1, 1),
+                    hasta=datetime(int(anio_historial), 12, 31)
+                )
+                if historial['total']:
+                    st.dataframe(
+                        pd.DataFrame(historial['resultados']),
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config={
+                            "numero": "📄 Número",
+                            "fecha": "📅 Fecha",
+                            "cliente_nombre": "👤 Cliente",
+                            "cliente_nit": "🆔 NIT/Cédula",
+                            "cliente_empresa": "🏢 Empresa",
+                            "ubicacion": "📍 Sede",
+                            "lineas": "📦 Líneas",
+                            "total": st.column_config.NumberColumn("💵 Total", format="$ %d")
+                        }
+                    )
+                    numero_historial = st.selectbox(
+                        "Cotización a descargar:",
+                        options=[fila['numero'] for fila in historial['resultados']],
+                        key="historial_numero"
+                    )
+                    cotizacion_historial = repositorio.obtener(numero_historial)
+                    if cotizacion_historial is not None:
+                        st.download_button(
+                            label="📄 Descargar PDF",
+                            data=st.session_state.generador.generar_pdf_cotizacion(cotizacion_historial, datos_empresa_sesion()).getvalue(),
+                            file_name=nombre_archivo_pdf(cotizacion_historial),
+                            mime="application/pdf",
+                            key="historial_pdf_descarga"
+                        )
+                else:
+                    st.info(f"No hay cotizaciones guardadas para esa búsqueda en {int(anio_historial)}")
+        
         if termino_busqueda:
             with st.spinner('🔍 Buscando productos...'):
                 # Determinar filtro de inmunización basado en checkboxes
@@ -935,12 +3893,20 @@ def main():
                 else:
                     solo_inmunizada_valor = None
                 
+                # La página vuelve al inicio cuando cambia la búsqueda o sus filtros
+                firma_busqueda = (termino_busqueda, solo_inmunizada_valor, busqueda_difusa)
+                if st.session_state.get('firma_busqueda') != firma_busqueda:
+                    st.session_state.firma_busqueda = firma_busqueda
+                    st.session_state.desplazamiento_busqueda = 0
+                
                 resultados = st.session_state.generador.buscar_productos(
-                    termino_busqueda, 
-                    ubicacion=ubicacion, 
+                    termino_busqueda,
+                    ubicacion=ubicacion,
                     incluir_iva=incluir_iva,
-                    limite=20,
-                    solo_inmunizada=solo_inmunizada_valor
+                    limite=RESULTADOS_POR_PAGINA,
+                    solo_inmunizada=solo_inmunizada_valor,
+                    difuso=busqueda_difusa,
+                    desplazamiento=st.session_state.desplazamiento_busqueda
                 )
             
             if resultados['exito']:
@@ -951,10 +3917,25 @@ def main():
                 elif solo_sin_inmunizar and not solo_inmunizada:
                     filtro_info = " (Solo productos sin inmunizar)"
                 
-                st.markdown(f"### 📦 Productos encontrados ({resultados['total']}){filtro_info}")
+                st.markdown(f"### 📦 Productos encontrados ({resultados['total_coincidencias']}){filtro_info}")
+                
+                # Paginación de resultados
+                inicio = resultados['desplazamiento']
+                if resultados['anterior'] is not None or resultados['siguiente'] is not None:
+                    col_ant, col_info, col_sig = st.columns([1, 2, 1])
+                    with col_ant:
+                        if resultados['anterior'] is not None and st.button("⬅️ Anterior", key="pagina_anterior", use_container_width=True):
+                            st.session_state.desplazamiento_busqueda = resultados['anterior']
+                            st.rerun()
+                    with col_info:
+                        st.caption(f"Mostrando {inicio + 1}–{inicio + resultados['total']} de {resultados['total_coincidencias']}")
+                    with col_sig:
+                        if resultados['siguiente'] is not None and st.button("Siguiente ➡️", key="pagina_siguiente", use_container_width=True):
+                            st.session_state.desplazamiento_busqueda = resultados['siguiente']
+                            st.rerun()
                 
                 # Mostrar productos en tarjetas
-                for i, producto in enumerate(resultados['resultados']):
+                for i, producto in enumerate(resultados['resultados'], start=inicio):
                     with st.expander(f"🌲 {producto['descripcion']} - {producto['precio']}"):
                         col1, col2, col3 = st.columns(3)
                         
@@ -972,10 +3953,10 @@ def main():
                             st.write(f"**💰 Precio:** {producto['precio']}")
                             # Comparación de precios
                             st.write("**💲 Comparación de precios:**")
-                            st.write(f"Caldas s/IVA: {st.session_state.generador.formatear_precio(producto['precios']['caldas_sin_iva'])}")
-                            st.write(f"Caldas c/IVA: {st.session_state.generador.formatear_precio(producto['precios']['caldas_con_iva'])}")
-                            st.write(f"Chagualo s/IVA: {st.session_state.generador.formatear_precio(producto['precios']['chagualo_sin_iva'])}")
-                            st.write(f"Chagualo c/IVA: {st.session_state.generador.formatear_precio(producto['precios']['chagualo_con_iva'])}")
+                            st.write(f"Caldas s/IVA: {producto['precios_formateados']['caldas_sin_iva']}")
+                            st.write(f"Caldas c/IVA: {producto['precios_formateados']['caldas_con_iva']}")
+                            st.write(f"Chagualo s/IVA: {producto['precios_formateados']['chagualo_sin_iva']}")
+                            st.write(f"Chagualo c/IVA: {producto['precios_formateados']['chagualo_con_iva']}")
                         
                         # Botón para agregar a cotización
                         col_qty, col_btn = st.columns([1, 2])
@@ -1050,6 +4031,7 @@ def main():
             
             # Generar cotización
             st.markdown("---")
+            renderizador_pdf = obtener_renderizador_pdf()
             if st.button("📄 Generar Cotización", type="primary", use_container_width=True):
                 if nombre_cliente:
                     datos_cliente = {
@@ -1073,184 +4055,210 @@ def main():
                         opciones
                     )
                     
-                    # Mostrar cotización
                     st.success("✅ Cotización generada exitosamente!")
                     
-                    # Guardar cotización en session_state para descargar PDF
-                    st.session_state.ultima_cotizacion = cotizacion
-                    
-                    # Generar PDF automáticamente al crear cotización
-                    try:
-                        datos_empresa_pdf = None
-                        if any(key.startswith('empresa_') for key in st.session_state.keys()):
-                            datos_empresa_pdf = {
-                                'nombre': st.session_state.get('empresa_nombre', 'Construinmuniza'),
-                                'nit': st.session_state.get('empresa_nit', '900.XXX.XXX-X'),
-                                'direccion': st.session_state.get('empresa_direccion', 'Calle XX # XX - XX'),
-                                'telefono': st.session_state.get('empresa_telefono', 'XXX-XXXX'),
-                                'ciudad': st.session_state.get('empresa_ciudad', 'Medellín'),
-                                'email': st.session_state.get('empresa_email', 'ventas@construinmuniza.com')
-                            }
-                        
-                        pdf_buffer = st.session_state.generador.generar_pdf_cotizacion(cotizacion, datos_empresa_pdf)
-                        st.session_state.pdf_generado = pdf_buffer.getvalue()
-                        st.session_state.nombre_archivo_pdf = f"Cotizacion_Construinmuniza_{cotizacion['numero_cotizacion']}.pdf"
-                    except Exception as e:
-                        st.error(f"❌ Error al generar PDF: {str(e)}")
-                        st.session_state.pdf_generado = None
-                    
-                    # Botones de acción
-                    col1, col2, col3 = st.columns(3)
+                    # Guardar en el historial persistente
+                    guardado = st.session_state.generador.guardar_cotizacion(cotizacion)
+                    if not guardado['exito']:
+                        st.warning(f"⚠️ {guardado['mensaje']}")
                     
-                    with col1:
-                        # Botón de descarga directo
-                        if st.session_state.get('pdf_generado') is not None:
-                            st.download_button(
-                                label="📄 Descargar PDF",
-                                data=st.session_state.pdf_generado,
-                                file_name=st.session_state.nombre_archivo_pdf,
-                                mime="application/pdf",
-                                type="primary",
-                                use_container_width=True
-                            )
-                        else:
-                            st.error("❌ No se pudo generar el PDF")
+                    # Guardar cotización en session_state y preparar el PDF en segundo plano
+                    st.session_state.ultima_cotizacion = cotizacion
+                    st.session_state.clave_pdf = renderizador_pdf.solicitar(cotizacion, datos_empresa_sesion())
+                    st.session_state.nombre_archivo_pdf = nombre_archivo_pdf(cotizacion)
                     
-                    with col2:
-                        if st.button("🆕 Nueva Cotización", use_container_width=True):
-                            st.session_state.productos_cotizacion = []
-                            if 'pdf_generado' in st.session_state:
-                                del st.session_state.pdf_generado
-                            if 'ultima_cotizacion' in st.session_state:
-                                del st.session_state.ultima_cotizacion
+                    # Recordar la cotización para volver a descargarla más tarde
+                    historial = st.session_state.setdefault('historial_pdf', [])
+                    historial.insert(0, {
+                        'numero_cotizacion': cotizacion['numero_cotizacion'],
+                        'cliente': cotizacion['cliente']['nombre'],
+                        'total': cotizacion['resumen']['total'],
+                        'clave': st.session_state.clave_pdf
+                    })
+                    del historial[MAX_HISTORIAL_PDF:]
+                else:
+                    st.error("❌ Por favor, ingresa al menos el nombre del cliente.")
+            
+            # La cotización se muestra en cada recarga mientras exista, no solo al pulsar el botón
+            if st.session_state.get('ultima_cotizacion') is not None:
+                cotizacion = st.session_state.ultima_cotizacion
+                
+                # Estado del PDF: si no hay trabajo (p. ej. tras reiniciar el servidor) se vuelve a pedir
+                estado_pdf = renderizador_pdf.estado(st.session_state.get('clave_pdf'))
+                if estado_pdf['estado'] == 'desconocido':
+                    st.session_state.clave_pdf = renderizador_pdf.solicitar(cotizacion, datos_empresa_sesion())
+                    st.session_state.nombre_archivo_pdf = nombre_archivo_pdf(cotizacion)
+                    estado_pdf = renderizador_pdf.estado(st.session_state.clave_pdf)
+                
+                # Botones de acción
+                col1, col2, col3 = st.columns(3)
+                
+                with col1:
+                    if estado_pdf['estado'] == 'listo':
+                        st.download_button(
+                            label="📄 Descargar PDF",
+                            data=estado_pdf['pdf'],
+                            file_name=st.session_state.nombre_archivo_pdf,
+                            mime="application/pdf",
+                            type="primary",
+                            use_container_width=True
+                        )
+                    elif estado_pdf['estado'] == 'pendiente':
+                        st.info("⏳ Preparando PDF...")
+                    else:
+                        st.error(f"❌ Error al generar PDF: {estado_pdf['error']}")
+                        if st.button("🔄 Reintentar PDF", use_container_width=True):
+                            st.session_state.clave_pdf = renderizador_pdf.solicitar(cotizacion, datos_empresa_sesion())
                             st.rerun()
+                
+                with col2:
+                    if st.button("🆕 Nueva Cotización", use_container_width=True):
+                        st.session_state.productos_cotizacion = []
+                        st.session_state.pop('clave_pdf', None)
+                        if 'ultima_cotizacion' in st.session_state:
+                            del st.session_state.ultima_cotizacion
+                        st.rerun()
+                
+                with col3:
+                    # Configurar datos de empresa para PDF
+                    if st.button("⚙️ Configurar Empresa", use_container_width=True):
+                        st.session_state.mostrar_config_empresa = True
+                
+                # Configuración de empresa (modal)
+                if st.session_state.get('mostrar_config_empresa', False):
+                    st.markdown("---")
+                    st.markdown("### 🏢 Configuración de Empresa para PDF")
                     
-                    with col3:
-                        # Configurar datos de empresa para PDF
-                        if st.button("⚙️ Configurar Empresa", use_container_width=True):
-                            st.session_state.mostrar_config_empresa = True
-                    
-                    # Configuración de empresa (modal)
-                    if st.session_state.get('mostrar_config_empresa', False):
-                        st.markdown("---")
-                        st.markdown("### 🏢 Configuración de Empresa para PDF")
-                        
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            nombre_empresa = st.text_input("🏢 Nombre de la empresa:", 
-                                                         value=st.session_state.get('empresa_nombre', 'Construinmuniza'))
-                            nit_empresa = st.text_input("📄 NIT:", 
-                                                       value=st.session_state.get('empresa_nit', '900.XXX.XXX-X'))
-                            direccion_empresa = st.text_input("📍 Dirección:", 
-                                                             value=st.session_state.get('empresa_direccion', 'Calle XX # XX - XX'))
-                        
-                        with col2:
-                            telefono_empresa = st.text_input("📱 Teléfono:", 
-                                                           value=st.session_state.get('empresa_telefono', 'XXX-XXXX'))
-                            ciudad_empresa = st.text_input("🏙️ Ciudad:", 
-                                                         value=st.session_state.get('empresa_ciudad', 'Medellín'))
-                            email_empresa = st.text_input("📧 Email:", 
-                                                        value=st.session_state.get('empresa_email', 'ventas@construinmuniza.com'))
-                        
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            if st.button("💾 Guardar Configuración", use_container_width=True):
-                                st.session_state.empresa_nombre = nombre_empresa
-                                st.session_state.empresa_nit = nit_empresa
-                                st.session_state.empresa_direccion = direccion_empresa
-                                st.session_state.empresa_telefono = telefono_empresa
-                                st.session_state.empresa_ciudad = ciudad_empresa
-                                st.session_state.empresa_email = email_empresa
-                                st.session_state.mostrar_config_empresa = False
-                                
-                                # Regenerar PDF con nuevos datos de empresa
-                                if 'ultima_cotizacion' in st.session_state:
-                                    try:
-                                        datos_empresa_pdf = {
-                                            'nombre': nombre_empresa,
-                                            'nit': nit_empresa,
-                                            'direccion': direccion_empresa,
-                                            'telefono': telefono_empresa,
-                                            'ciudad': ciudad_empresa,
-                                            'email': email_empresa
-                                        }
-                                        pdf_buffer = st.session_state.generador.generar_pdf_cotizacion(
-                                            st.session_state.ultima_cotizacion, 
-                                            datos_empresa_pdf
-                                        )
-                                        st.session_state.pdf_generado = pdf_buffer.getvalue()
-                                    except:
-                                        pass
-                                
-                                st.success("✅ Configuración guardada")
-                                st.rerun()
-                        
-                        with col2:
-                            if st.button("❌ Cancelar", use_container_width=True):
-                                st.session_state.mostrar_config_empresa = False
-                                st.rerun()
-                        
-                        st.markdown("---")
-                    
-                    # Información de la cotización
-                    st.markdown(f"### 📄 Cotización {cotizacion['numero_cotizacion']}")
+                    col1, col2 = st.columns(2)
                     
-                    col1, col2, col3 = st.columns(3)
                     with col1:
-                        st.info(f"**📅 Fecha:** {cotizacion['fecha']}\n\n**⏰ Vencimiento:** {cotizacion['fecha_vencimiento']}")
+                        nombre_empresa = st.text_input("🏢 Nombre de la empresa:", 
+                                                     value=st.session_state.get('empresa_nombre', 'Construinmuniza'))
+                        nit_empresa = st.text_input("📄 NIT:", 
+                                                   value=st.session_state.get('empresa_nit', '900.XXX.XXX-X'))
+                        direccion_empresa = st.text_input("📍 Dirección:", 
+                                                         value=st.session_state.get('empresa_direccion', 'Calle XX # XX - XX'))
                     
                     with col2:
-                        st.info(f"**👤 Cliente:** {cotizacion['cliente']['nombre']}\n\n**🆔 NIT/Cédula:** {cotizacion['cliente'].get('nit_cedula', 'N/A')}\n\n**🏢 Empresa:** {cotizacion['cliente']['empresa']}")
-                    
-                    with col3:
-                        st.info(f"**📍 Ubicación:** {cotizacion['ubicacion']}\n\n**💰 IVA incluido:** {'Sí' if cotizacion['incluye_iva'] else 'No'}")
+                        telefono_empresa = st.text_input("📱 Teléfono:", 
+                                                       value=st.session_state.get('empresa_telefono', 'XXX-XXXX'))
+                        ciudad_empresa = st.text_input("🏙️ Ciudad:", 
+                                                     value=st.session_state.get('empresa_ciudad', 'Medellín'))
+                        email_empresa = st.text_input("📧 Email:", 
+                                                    value=st.session_state.get('empresa_email', 'ventas@construinmuniza.com'))
                     
-                    # Detalles de productos
-                    st.markdown("### 📦 Productos Cotizados")
-                    df_cotizacion = pd.DataFrame(cotizacion['items'])
-                    st.dataframe(df_cotizacion[['referencia', 'descripcion', 'tipo_madera', 'cantidad', 'precio_unitario', 'total']], 
-                               use_container_width=True,
-                               column_config={
-                                   "referencia": "📋 Referencia",
-                                   "descripcion": "🌲 Descripción",
-                                   "tipo_madera": "🌲 Tipo",
-                                   "cantidad": "📦 Cantidad",
-                                   "precio_unitario": "💰 Precio Unitario",
-                                   "total": "💵 Total"
-                               })
-                    
-                    # Resumen financiero
-                    st.markdown("### 💰 Resumen Financiero")
-                    col1, col2, col3 = st.columns(3)
+                    col1, col2 = st.columns(2)
                     
                     with col1:
-                        st.markdown(f'<div class="metric-container"><h3>{cotizacion["resumen"]["subtotal"]}</h3><p>Subtotal</p></div>', unsafe_allow_html=True)
+                        if st.button("💾 Guardar Configuración", use_container_width=True):
+                            st.session_state.empresa_nombre = nombre_empresa
+                            st.session_state.empresa_nit = nit_empresa
+                            st.session_state.empresa_direccion = direccion_empresa
+                            st.session_state.empresa_telefono = telefono_empresa
+                            st.session_state.empresa_ciudad = ciudad_empresa
+                            st.session_state.empresa_email = email_empresa
+                            st.session_state.mostrar_config_empresa = False
+                            
+                            # Regenerar PDF con nuevos datos de empresa (en segundo plano; gratis si no cambiaron)
+                            st.session_state.clave_pdf = renderizador_pdf.solicitar(cotizacion, datos_empresa_sesion())
+                            for entrada in st.session_state.get('historial_pdf', []):
+                                if entrada['numero_cotizacion'] == cotizacion['numero_cotizacion']:
+                                    entrada['clave'] = st.session_state.clave_pdf
+                            
+                            st.success("✅ Configuración guardada")
+                            st.rerun()
                     
                     with col2:
-                        if cotizacion['resumen']['descuento']:
-                            st.markdown(f'<div class="metric-container"><h3>{cotizacion["resumen"]["descuento"]}</h3><p>Descuento</p></div>', unsafe_allow_html=True)
-                    
-                    with col3:
-                        st.markdown(f'<div class="metric-container" style="background-color: #E8F5E8; border: 2px solid #1B5E20;"><h2 style="color: #1B5E20;">{cotizacion["resumen"]["total"]}</h2><p><strong>TOTAL</strong></p></div>', unsafe_allow_html=True)
-                    
-                    # Condiciones
-                    with st.expander("📋 Condiciones Generales de Construinmuniza"):
-                        for condicion in cotizacion['condiciones']:
-                            st.write(f"🔸 {condicion}")
+                        if st.button("❌ Cancelar", use_container_width=True):
+                            st.session_state.mostrar_config_empresa = False
+                            st.rerun()
                     
-                    # Botón para limpiar cotización
                     st.markdown("---")
-                    if st.button("🗑️ Limpiar Cotización Completa", key="limpiar_final"):
-                        st.session_state.productos_cotizacion = []
-                        if 'pdf_generado' in st.session_state:
-                            del st.session_state.pdf_generado
-                        if 'ultima_cotizacion' in st.session_state:
-                            del st.session_state.ultima_cotizacion
-                        st.rerun()
-                else:
-                    st.error("❌ Por favor, ingresa al menos el nombre del cliente.")
+                
+                # Información de la cotización
+                st.markdown(f"### 📄 Cotización {cotizacion['numero_cotizacion']}")
+                
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.info(f"**📅 Fecha:** {cotizacion['fecha']}\n\n**⏰ Vencimiento:** {cotizacion['fecha_vencimiento']}")
+                
+                with col2:
+                    st.info(f"**👤 Cliente:** {cotizacion['cliente']['nombre']}\n\n**🆔 NIT/Cédula:** {cotizacion['cliente'].get('nit_cedula', 'N/A')}\n\n**🏢 Empresa:** {cotizacion['cliente']['empresa']}")
+                
+                with col3:
+                    st.info(f"**📍 Ubicación:** {cotizacion['ubicacion']}\n\n**💰 IVA incluido:** {'Sí' if cotizacion['incluye_iva'] else 'No'}")
+                
+                # Detalles de productos
+                st.markdown("### 📦 Productos Cotizados")
+                df_cotizacion = pd.DataFrame(cotizacion['items'])
+                st.dataframe(df_cotizacion[['referencia', 'descripcion', 'tipo_madera', 'cantidad', 'precio_unitario', 'total']], 
+                           use_container_width=True,
+                           column_config={
+                               "referencia": "📋 Referencia",
+                               "descripcion": "🌲 Descripción",
+                               "tipo_madera": "🌲 Tipo",
+                               "cantidad": "📦 Cantidad",
+                               "precio_unitario": "💰 Precio Unitario",
+                               "total": "💵 Total"
+                           })
+                
+                # Resumen financiero
+                st.markdown("### 💰 Resumen Financiero")
+                col1, col2, col3 = st.columns(3)
+                
+                with col1:
+                    st.markdown(f'<div class="metric-container"><h3>{cotizacion["resumen"]["subtotal"]}</h3><p>Subtotal</p></div>', unsafe_allow_html=True)
+                
+                with col2:
+                    if cotizacion['resumen']['descuento']:
+                        st.markdown(f'<div class="metric-container"><h3>{cotizacion["resumen"]["descuento"]}</h3><p>Descuento</p></div>', unsafe_allow_html=True)
+                
+                with col3:
+                    st.markdown(f'<div class="metric-container" style="background-color: #E8F5E8; border: 2px solid #1B5E20;"><h2 style="color: #1B5E20;">{cotizacion["resumen"]["total"]}</h2><p><strong>TOTAL</strong></p></div>', unsafe_allow_html=True)
+                
+                # Condiciones
+                with st.expander("📋 Condiciones Generales de Construinmuniza"):
+                    for condicion in cotizacion['condiciones']:
+                        st.write(f"🔸 {condicion}")
+                
+                # Botón para limpiar cotización
+                st.markdown("---")
+                if st.button("🗑️ Limpiar Cotización Completa", key="limpiar_final"):
+                    st.session_state.productos_cotizacion = []
+                    st.session_state.pop('clave_pdf', None)
+                    if 'ultima_cotizacion' in st.session_state:
+                        del st.session_state.ultima_cotizacion
+                    st.rerun()
+                
+                # Cotizaciones anteriores de esta sesión (los PDF salen de la caché en disco)
+                anteriores = [
+                    entrada for entrada in st.session_state.get('historial_pdf', [])
+                    if entrada['numero_cotizacion'] != cotizacion['numero_cotizacion']
+                ]
+                if anteriores:
+                    with st.expander(f"📚 Cotizaciones anteriores ({len(anteriores)})"):
+                        for entrada in anteriores:
+                            col1, col2 = st.columns([3, 1])
+                            with col1:
+                                st.write(f"**{entrada['numero_cotizacion']}** · {entrada['cliente']} · {entrada['total']}")
+                            with col2:
+                                contenido = renderizador_pdf.cache.leer(entrada['clave'])
+                                if contenido is not None:
+                                    st.download_button(
+                                        label="📄 PDF",
+                                        data=contenido,
+                                        file_name=nombre_archivo_pdf(entrada),
+                                        mime="application/pdf",
+                                        key=f"pdf_anterior_{entrada['clave']}",
+                                        use_container_width=True
+                                    )
+                                else:
+                                    st.caption("PDF no disponible")
+                
+                # La página ya se mostró completa; mientras el PDF se prepara se vuelve a consultar
+                if estado_pdf['estado'] == 'pendiente':
+                    time.sleep(INTERVALO_PDF)
+                    st.rerun()
 
 if __name__ == "__main__":
     main()
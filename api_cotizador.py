@@ -0,0 +1,278 @@
+"""API HTTP/JSON del cotizador Construinmuniza.
+
+Expone la búsqueda de productos, la consulta por referencias, el cálculo de
+cotizaciones y la generación de PDF sobre un único GeneradorCotizacionesMadera
+por proceso, así que todas las peticiones comparten el catálogo ya cargado en
+memoria (y sus índices y cachés).
+    
+    python api_cotizador.py --puerto 8000 --procesos 4
+    uvicorn --factory api_cotizador:aplicacion_por_defecto --workers 4
+
+Rutas:
+    GET  /salud
+    GET  /buscar?q=...&sede=caldas&iva=1&limite=10&desplazamiento=0&difuso=0&inmunizada=
+    POST /referencias           {"referencias": [...], "sede": "caldas", "iva": true}
+    POST /cotizaciones          {"cliente": {...}, "items": [{"referencia": ..., "cantidad": ...}], ...}
+    POST /cotizaciones/pdf      mismo cuerpo, o {"numero_cotizacion": ...} de una guardada
+    GET  /cotizaciones/{numero}
+"""
+import argparse
+import json
+from contextlib import asynccontextmanager
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from Cotizador import (
+    DATOS_EMPRESA_POR_DEFECTO, GeneradorCotizacionesMadera, RepositorioCotizaciones, VigilanteCatalogo, leer_booleano,
+    leer_sede, nombre_archivo_pdf
+)
+
+class ErrorSolicitud(Exception):
+    """Parámetros inválidos en la petición (se responde 400)"""
+
+def _a_json(valor):
+    """Tipos de numpy/pandas que json no sabe serializar"""
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, np.ndarray):
+        return valor.tolist()
+    return str(valor)
+
+class RespuestaJSON(JSONResponse):
+    def render(self, content):
+        return json.dumps(content, ensure_ascii=False, default=_a_json).encode('utf-8')
+
+def _booleano(valor, defecto, nombre='valor'):
+    try:
+        return leer_booleano(valor, defecto)
+    except ValueError:
+        raise ErrorSolicitud(f"'{nombre}' debe ser verdadero o falso")
+
+def _entero(valor, defecto, minimo=0, maximo=None, nombre='valor'):
+    if valor is None or valor == '':
+        return defecto
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        raise ErrorSolicitud(f"'{nombre}' debe ser un número entero")
+    if numero < minimo or (maximo is not None and numero > maximo):
+        raise ErrorSolicitud(f"'{nombre}' fuera de rango")
+    return numero
+
+def _sede(valor):
+    try:
+        return leer_sede(valor)
+    except ValueError:
+        raise ErrorSolicitud("'sede' debe ser 'caldas' o 'chagualo'")
+
+def _opciones(datos):
+    """Opciones de generar_cotizacion a partir del cuerpo de la petición"""
+    try:
+        descuento = float(datos.get('descuento', 0) or 0)
+    except (TypeError, ValueError):
+        raise ErrorSolicitud("'descuento' debe ser numérico")
+    if not 0 <= descuento <= 100:
+        raise ErrorSolicitud("'descuento' debe estar entre 0 y 100")
+    return {
+        'ubicacion': _sede(datos.get('sede')),
+        'incluir_iva': _booleano(datos.get('iva'), True, 'iva'),
+        'descuento': descuento,
+        'validez_dias': _entero(datos.get('validez_dias'), 30, minimo=1, maximo=3650, nombre='validez_dias')
+    }
+
+def _empresa(valor):
+    """Datos de empresa del PDF sobre los de la plantilla (solo campos conocidos, de texto)"""
+    if valor is None:
+        return None
+    if not isinstance(valor, dict):
+        raise ErrorSolicitud("'empresa' debe ser un objeto JSON")
+    desconocidos = sorted(set(valor) - set(DATOS_EMPRESA_POR_DEFECTO))
+    if desconocidos:
+        raise ErrorSolicitud(f"Campos de 'empresa' desconocidos: {', '.join(map(str, desconocidos))}")
+    if not all(isinstance(texto, str) for texto in valor.values()):
+        raise ErrorSolicitud("Los campos de 'empresa' deben ser texto")
+    return dict(DATOS_EMPRESA_POR_DEFECTO, **valor)
+
+async def _cuerpo_json(request):
+    try:
+        datos = await request.json()
+    except ValueError:
+        raise ErrorSolicitud('El cuerpo debe ser JSON válido')
+    if not isinstance(datos, dict):
+        raise ErrorSolicitud('El cuerpo debe ser un objeto JSON')
+    return datos
+
+def crear_aplicacion(generador=None, repositorio=None, guardar=True, vigilar_catalogo=True):
+    """Aplicación ASGI sobre un generador con el catálogo ya cargado (o que se carga al arrancar).
+    
+    Si hay repositorio (el indicado o el del generador recibido), las
+    cotizaciones se numeran con él y, con guardar=True, quedan en el historial
+    como las de la interfaz. Con vigilar_catalogo=True
+    las versiones nuevas del listado se cargan en segundo plano y las
+    peticiones pasan a usarlas sin reiniciar el proceso.
+    """
+    if generador is None:
+        generador = GeneradorCotizacionesMadera(repositorio=repositorio)
+    elif repositorio is not None:
+        generador.repositorio = repositorio
+    
+    @asynccontextmanager
+    async def ciclo_de_vida(aplicacion):
+        # El catálogo se carga una vez al arrancar el proceso
+        if generador.productos is None:
+            resultado = await run_in_threadpool(generador.cargar_excel_automatico)
+            if not resultado['exito']:
+                raise RuntimeError(resultado['mensaje'])
+        vigilante = None
+        if vigilar_catalogo:
+            vigilante = VigilanteCatalogo(al_publicar=lambda snapshot: generador.actualizar_catalogo()).iniciar()
+        yield
+        if vigilante is not None:
+            vigilante.detener()
+    
+    async def salud(request):
+        estado = await run_in_threadpool(generador.estado_catalogo) or {}
+        return RespuestaJSON({
+            'exito': True,
+            'version_catalogo': estado.get('version_catalogo'),
+            'total_productos': estado.get('total_productos'),
+            'cache_busquedas': estado.get('cache_busquedas')
+        })
+    
+    async def buscar(request):
+        parametros = request.query_params
+        termino = (parametros.get('q') or '').strip()
+        if not termino:
+            raise ErrorSolicitud("Falta el parámetro 'q'")
+        inmunizada = parametros.get('inmunizada')
+        # La búsqueda recorre el índice: va al pool de hilos para no frenar el bucle de eventos
+        resultado = await run_in_threadpool(
+            generador.buscar_productos,
+            termino,
+            ubicacion=_sede(parametros.get('sede')),
+            incluir_iva=_booleano(parametros.get('iva'), True, 'iva'),
+            limite=_entero(parametros.get('limite'), 10, minimo=1, maximo=200, nombre='limite'),
+            solo_inmunizada=None if inmunizada in (None, '') else _booleano(inmunizada, None, 'inmunizada'),
+            difuso=_booleano(parametros.get('difuso'), False, 'difuso'),
+            desplazamiento=_entero(parametros.get('desplazamiento'), 0, nombre='desplazamiento')
+        )
+        if resultado['exito']:
+            resultado = dict(resultado, resultados=list(resultado['resultados']))
+        return RespuestaJSON(resultado)
+    
+    async def referencias(request):
+        datos = await _cuerpo_json(request)
+        lista = datos.get('referencias')
+        if not isinstance(lista, list):
+            raise ErrorSolicitud("'referencias' debe ser una lista")
+        return RespuestaJSON(await run_in_threadpool(
+            generador.buscar_por_referencia,
+            [str(referencia) for referencia in lista],
+            ubicacion=_sede(datos.get('sede')),
+            incluir_iva=_booleano(datos.get('iva'), True, 'iva')
+        ))
+    
+    def calcular_cotizacion(datos):
+        items = datos.get('items')
+        if not isinstance(items, list) or not items:
+            raise ErrorSolicitud("'items' debe ser una lista no vacía de {referencia, cantidad}")
+        cliente = datos.get('cliente') or {}
+        if not isinstance(cliente, dict) or not cliente.get('nombre'):
+            raise ErrorSolicitud("Falta 'cliente.nombre'")
+        opciones = _opciones(datos)
+        
+        pedido = pd.DataFrame(
+            [(item.get('referencia'), item.get('cantidad', 1)) if isinstance(item, dict) else (item, 1) for item in items],
+            columns=['referencia', 'cantidad']
+        )
+        resultado = generador.cotizar_pedido(pedido, cliente, opciones)
+        cotizacion = resultado.pop('cotizacion')
+        if cotizacion is not None and guardar and generador.repositorio is not None and _booleano(datos.get('guardar'), True, 'guardar'):
+            generador.guardar_cotizacion(cotizacion)
+        return cotizacion, resultado
+    
+    async def cotizaciones(request):
+        datos = await _cuerpo_json(request)
+        cotizacion, resultado = await run_in_threadpool(calcular_cotizacion, datos)
+        if cotizacion is None:
+            return RespuestaJSON(resultado, status_code=422)
+        resultado['cotizacion'] = cotizacion
+        return RespuestaJSON(resultado)
+    
+    async def cotizacion_pdf(request):
+        datos = await _cuerpo_json(request)
+        # Se valida antes de calcular: una petición inválida no consume número ni queda guardada
+        datos_empresa = _empresa(datos.get('empresa'))
+        if datos.get('numero_cotizacion'):
+            if generador.repositorio is None:
+                raise ErrorSolicitud('No hay repositorio de cotizaciones configurado')
+            cotizacion = await run_in_threadpool(generador.repositorio.obtener, datos['numero_cotizacion'])
+            if cotizacion is None:
+                return RespuestaJSON({'exito': False, 'mensaje': 'Cotización no encontrada'}, status_code=404)
+        else:
+            cotizacion, resultado = await run_in_threadpool(calcular_cotizacion, datos)
+            if cotizacion is None:
+                return RespuestaJSON(resultado, status_code=422)
+        
+        pdf = await run_in_threadpool(generador.generar_pdf_cotizacion, cotizacion, datos_empresa)
+        return Response(
+            pdf.getvalue(),
+            media_type='application/pdf',
+            headers={
+                'Content-Disposition': f'attachment; filename="{nombre_archivo_pdf(cotizacion)}"',
+                'X-Numero-Cotizacion': cotizacion['numero_cotizacion']
+            }
+        )
+    
+    async def cotizacion_guardada(request):
+        if generador.repositorio is None:
+            raise ErrorSolicitud('No hay repositorio de cotizaciones configurado')
+        cotizacion = await run_in_threadpool(generador.repositorio.obtener, request.path_params['numero'])
+        if cotizacion is None:
+            return RespuestaJSON({'exito': False, 'mensaje': 'Cotización no encontrada'}, status_code=404)
+        return RespuestaJSON({'exito': True, 'cotizacion': cotizacion})
+    
+    async def error_solicitud(request, error):
+        return RespuestaJSON({'exito': False, 'mensaje': str(error)}, status_code=400)
+    
+    aplicacion = Starlette(
+        routes=[
+            Route('/salud', salud),
+            Route('/buscar', buscar),
+            Route('/referencias', referencias, methods=['POST']),
+            Route('/cotizaciones', cotizaciones, methods=['POST']),
+            Route('/cotizaciones/pdf', cotizacion_pdf, methods=['POST']),
+            Route('/cotizaciones/{numero}', cotizacion_guardada)
+        ],
+        exception_handlers={ErrorSolicitud: error_solicitud},
+        lifespan=ciclo_de_vida
+    )
+    aplicacion.state.generador = generador
+    return aplicacion
+
+def aplicacion_por_defecto():
+    """Aplicación con el historial en cotizaciones.db (fábrica para uvicorn --factory)"""
+    # Numeración por bloques: cada proceso reserva varios números por transacción
+    return crear_aplicacion(repositorio=RepositorioCotizaciones(tamano_bloque=20))
+
+def main():
+    import uvicorn
+    
+    parser = argparse.ArgumentParser(description='API HTTP/JSON del cotizador Construinmuniza')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--procesos', type=int, default=1, help='procesos de uvicorn (cada uno con su catálogo)')
+    args = parser.parse_args()
+    
+    uvicorn.run(
+        'api_cotizador:aplicacion_por_defecto', factory=True,
+        host=args.host, port=args.puerto, workers=args.procesos, log_level='warning'
+    )
+
+if __name__ == "__main__":
+    main()
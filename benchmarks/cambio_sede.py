@@ -0,0 +1,60 @@
+"""Tiempo de recalcular una cotización extensa al cambiar de sede o de IVA.
+
+Arma cotizaciones sintéticas (repitiendo el catálogo) y mide generar_cotizacion
+en cada combinación de sede e IVA, y comparar_sedes, que calcula las cuatro de
+una vez sobre la matriz de precios. Con 1.000 líneas cada cambio debe quedar
+por debajo de LIMITE_MS.
+
+    python benchmarks/cambio_sede.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Cotizador import GeneradorCotizacionesMadera, POSICION_SEDE
+
+TAMANOS = [100, 1000, 5000]
+
+# Tiempo máximo por cambio de sede con 1.000 líneas
+LIMITE_MS = 50
+
+CLIENTE = {'nombre': 'Cliente de prueba', 'empresa': 'Benchmark'}
+
+def medir(funcion, repeticiones=5):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+def main():
+    generador = GeneradorCotizacionesMadera()
+    resultado = generador.cargar_excel_automatico()
+    if not resultado['exito']:
+        print(resultado['mensaje'])
+        return 1
+    productos = generador.formatear_filas(range(len(generador.productos)))
+
+    print(f"{'líneas':>8} {'cotización ms':>14} {'comparar ms':>12}")
+    tiempos = {}
+    for lineas in TAMANOS:
+        items = [dict(productos[i % len(productos)], cantidad=1 + i % 7) for i in range(lineas)]
+        cotizacion = max(
+            medir(lambda: generador.generar_cotizacion(
+                items, CLIENTE, {'ubicacion': ubicacion, 'incluir_iva': iva, 'descuento': 5}
+            ))
+            for ubicacion in POSICION_SEDE for iva in (True, False)
+        )
+        comparar = medir(lambda: generador.comparar_sedes(items, True, 5))
+        tiempos[lineas] = cotizacion
+        print(f"{lineas:>8} {cotizacion * 1e3:>14.1f} {comparar * 1e3:>12.1f}")
+
+    print(f"\nCambio de sede con 1000 líneas: {tiempos[1000] * 1e3:.1f} ms (límite {LIMITE_MS} ms)")
+    return 0 if tiempos[1000] * 1e3 <= LIMITE_MS else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
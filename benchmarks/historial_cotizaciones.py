@@ -0,0 +1,84 @@
+"""Consultas del historial de cotizaciones sobre 100.000 cotizaciones.
+
+Llena una base temporal con cotizaciones sintéticas (2.000 clientes, tres años
+de fechas, 5 líneas cada una) y mide las búsquedas por NIT y por referencia
+dentro de un año, que deben responder en milisegundos gracias a los índices.
+    
+    python benchmarks/historial_cotizaciones.py [cantidad]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Cotizador import RepositorioCotizaciones
+
+CLIENTES = 2000
+REFERENCIAS = 400
+LINEAS = 5
+LOTE = 5000
+
+def cotizacion_sintetica(azar, indice):
+    fecha = datetime(2023, 1, 1) + timedelta(days=azar.randrange(3 * 365))
+    items = []
+    for _ in range(LINEAS):
+        cantidad = azar.randint(1, 20)
+        precio = azar.randrange(5000, 200000, 100)
+        items.append({
+            'referencia': f"REF{azar.randrange(REFERENCIAS):04d}",
+            'descripcion': 'PRODUCTO DE PRUEBA',
+            'cantidad': cantidad,
+            'precio_unitario_numerico': precio,
+            'total_numerico': cantidad * precio
+        })
+    total = sum(item['total_numerico'] for item in items)
+    return {
+        'numero_cotizacion': f"COT-CONST-{fecha.strftime('%Y%m')}-{indice:06d}",
+        'fecha': fecha.strftime('%d/%m/%Y'),
+        'fecha_vencimiento': (fecha + timedelta(days=30)).strftime('%d/%m/%Y'),
+        'cliente': {'nombre': f"Cliente {indice % CLIENTES}", 'nit_cedula': f"900.{indice % CLIENTES:03d}.000-1"},
+        'ubicacion': 'Caldas',
+        'incluye_iva': True,
+        'items': items,
+        'resumen': {'subtotal_numerico': total, 'descuento_numerico': 0, 'total_numerico': total}
+    }
+
+def medir(funcion, repeticiones=20):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    azar = random.Random(42)
+    with tempfile.TemporaryDirectory() as directorio:
+        repositorio = RepositorioCotizaciones(os.path.join(directorio, 'cotizaciones.db'))
+        
+        inicio = time.perf_counter()
+        for desde in range(0, cantidad, LOTE):
+            repositorio.guardar_varias(
+                cotizacion_sintetica(azar, i) for i in range(desde, min(desde + LOTE, cantidad))
+            )
+        print(f"{repositorio.contar()} cotizaciones guardadas en {time.perf_counter() - inicio:.1f} s")
+        
+        numero = repositorio.buscar(limite=1)['resultados'][0]['numero']
+        consultas = {
+            'NIT en un año': lambda: repositorio.buscar(nit='900123000-1', desde=datetime(2024, 1, 1), hasta=datetime(2024, 12, 31)),
+            'referencia en un año': lambda: repositorio.buscar(referencia='REF0042', desde=datetime(2024, 1, 1), hasta=datetime(2024, 12, 31)),
+            'NIT y referencia': lambda: repositorio.buscar(nit='900123000-1', referencia='REF0042'),
+            'obtener por número': lambda: repositorio.obtener(numero)
+        }
+        for nombre, consulta in consultas.items():
+            segundos, resultado = medir(consulta)
+            filas = resultado['total'] if isinstance(resultado, dict) and 'total' in resultado else int(resultado is not None)
+            print(f"{nombre:>22}: {segundos * 1000:7.2f} ms ({filas} filas)")
+
+if __name__ == "__main__":
+    main()
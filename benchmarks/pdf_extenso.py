@@ -0,0 +1,72 @@
+"""Tiempo de maquetación del PDF para cotizaciones extensas.
+
+Genera cotizaciones sintéticas de distinto número de líneas (repitiendo el
+catálogo) y mide PlantillaPDF.construir. En modo por hojas el tiempo por línea
+debe mantenerse aproximadamente constante hasta 5.000 líneas; con --comparar
+también se mide la tabla simple (una sola Table) hasta 1.000 líneas.
+    
+    python benchmarks/pdf_extenso.py [--comparar]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Cotizador import GeneradorCotizacionesMadera, PlantillaPDF
+
+TAMANOS = [250, 500, 1000, 2500, 5000]
+TAMANOS_SIMPLE = [100, 250, 500, 1000]
+
+# Tolerancia del tiempo por línea entre el tamaño mayor y el menor
+TOLERANCIA_LINEAL = 2.0
+
+def cotizacion_sintetica(generador, productos, lineas):
+    items = [dict(productos[i % len(productos)], cantidad=1 + i % 7) for i in range(lineas)]
+    return generador.generar_cotizacion(
+        items,
+        {'nombre': 'Cliente de prueba', 'empresa': 'Benchmark'},
+        {'ubicacion': 'caldas', 'incluir_iva': True, 'descuento': 0, 'validez_dias': 30}
+    )
+
+def medir(plantilla, cotizacion, repeticiones=1):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        plantilla.construir(cotizacion)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+def main():
+    generador = GeneradorCotizacionesMadera()
+    resultado = generador.cargar_excel_automatico()
+    if not resultado['exito']:
+        print(resultado['mensaje'])
+        return 1
+    productos = generador.formatear_filas(range(len(generador.productos)))
+    
+    plantilla = PlantillaPDF()
+    medir(plantilla, cotizacion_sintetica(generador, productos, 100))  # calentamiento
+    
+    print(f"{'líneas':>8} {'segundos':>10} {'µs/línea':>10}")
+    por_linea = []
+    for lineas in TAMANOS:
+        segundos = medir(plantilla, cotizacion_sintetica(generador, productos, lineas))
+        por_linea.append(segundos / lineas)
+        print(f"{lineas:>8} {segundos:>10.3f} {segundos / lineas * 1e6:>10.0f}")
+    
+    if '--comparar' in sys.argv:
+        simple = PlantillaPDF()
+        simple.LINEAS_MODO_EXTENSO = float('inf')
+        print("\nTabla simple:")
+        for lineas in TAMANOS_SIMPLE:
+            segundos = medir(simple, cotizacion_sintetica(generador, productos, lineas))
+            print(f"{lineas:>8} {segundos:>10.3f} {segundos / lineas * 1e6:>10.0f}")
+    
+    razon = por_linea[-1] / por_linea[0]
+    print(f"\nTiempo por línea {TAMANOS[-1]} vs {TAMANOS[0]}: {razon:.2f}x (límite {TOLERANCIA_LINEAL}x)")
+    return 0 if razon <= TOLERANCIA_LINEAL else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""Tiempo de importación de Cotizador medido con `python -X importtime`.
+
+Importa el módulo en un intérprete nuevo varias veces, toma la mejor medición
+y muestra los módulos que más tardan. Falla (código 1) si la importación supera
+el presupuesto o si carga alguno de los módulos que deben quedar diferidos
+hasta el primer uso (ReportLab, multiprocessing).
+    
+    python benchmarks/tiempo_importacion.py [--presupuesto-ms 900] [--repeticiones 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que no deben cargarse al importar Cotizador
+DIFERIDOS = ('reportlab', 'multiprocessing', 'PIL')
+
+def medir():
+    """(microsegundos acumulados por módulo, en orden) de una importación en frío"""
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import Cotizador'],
+        cwd=RAIZ, capture_output=True, text=True, check=True
+    )
+    modulos = {}
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        _, acumulado, nombre = linea[len('import time:'):].split('|')
+        modulos[nombre.strip()] = int(acumulado)
+    return modulos
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--presupuesto-ms', type=float, default=900)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+    
+    mediciones = [medir() for _ in range(args.repeticiones)]
+    mejor = min(mediciones, key=lambda modulos: modulos['Cotizador'])
+    total_ms = mejor['Cotizador'] / 1000
+    
+    # Módulos de primer nivel (los que importa Cotizador directamente o por primera vez)
+    principales = sorted(
+        ((nombre, tiempo) for nombre, tiempo in mejor.items() if '.' not in nombre and nombre != 'Cotizador'),
+        key=lambda par: -par[1]
+    )
+    print(f"{'módulo':<24} {'ms':>8}")
+    for nombre, tiempo in principales[:args.top]:
+        print(f"{nombre:<24} {tiempo / 1000:>8.1f}")
+    print(f"{'Cotizador (total)':<24} {total_ms:>8.1f}   presupuesto {args.presupuesto_ms:.0f} ms")
+    
+    cargados = sorted({nombre.split('.')[0] for nombre in mejor} & set(DIFERIDOS))
+    if cargados:
+        print(f"❌ Módulos que debían diferirse: {', '.join(cargados)}")
+    if total_ms > args.presupuesto_ms:
+        print(f"❌ La importación ({total_ms:.0f} ms) supera el presupuesto")
+    return 1 if cargados or total_ms > args.presupuesto_ms else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""Cotización por lotes desde la línea de comandos.
+
+Lee pedidos de archivos CSV o JSON lines, genera una cotización por pedido con
+GeneradorCotizacionesMadera y escribe las cotizaciones como JSON lines y,
+opcionalmente, sus PDF (en paralelo con varios procesos). Al final muestra un
+resumen con el rendimiento y los pedidos que fallaron.
+
+CSV: una fila por línea de pedido, agrupadas por la columna 'pedido', con
+columnas de referencia y cantidad y los datos del cliente (cliente, nit,
+empresa, telefono, email) tomados de la primera fila de cada pedido.
+
+JSON lines: un pedido por línea, con el mismo formato de la API:
+    {"pedido": "P-1", "cliente": {"nombre": ...}, "items": [{"referencia": ..., "cantidad": ...}],
+     "sede": "caldas", "iva": true, "descuento": 0, "validez_dias": 30}
+    
+    python cli_cotizador.py pedidos.csv --sede chagualo --descuento 5 --json cotizaciones.jsonl --zip pdfs.zip
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from Cotizador import (
+    ARCHIVO_COTIZACIONES, COLUMNAS_PEDIDO, GeneradorCotizacionesMadera, RepositorioCotizaciones, leer_booleano, leer_sede,
+    plegar_texto
+)
+
+# Columnas del CSV de pedidos -> nombres aceptados en el encabezado
+COLUMNAS_LOTE = dict(COLUMNAS_PEDIDO, **{
+    'pedido': ['pedido', 'orden', 'id pedido', 'id_pedido', 'order'],
+    'nombre': ['cliente', 'nombre', 'nombre cliente'],
+    'nit_cedula': ['nit', 'cedula', 'nit_cedula', 'nit/cedula', 'documento'],
+    'empresa': ['empresa'],
+    'telefono': ['telefono', 'celular'],
+    'email': ['email', 'correo']
+})
+
+CAMPOS_CLIENTE = ['nombre', 'nit_cedula', 'empresa', 'telefono', 'email']
+
+# Cotizaciones que se guardan en el historial por transacción
+LOTE_GUARDADO = 500
+
+# Pedidos que se resuelven juntos contra el catálogo
+PEDIDOS_POR_BLOQUE = 500
+
+def _leer_csv(ruta):
+    df = pd.read_csv(ruta, sep=None, engine='python', dtype=str, keep_default_na=False)
+    columnas = {plegar_texto(col).strip(): col for col in df.columns}
+    seleccion = {}
+    for destino, alias in COLUMNAS_LOTE.items():
+        encontrada = next((columnas[a] for a in alias if a in columnas), None)
+        if encontrada is not None:
+            seleccion[destino] = encontrada
+    faltantes = [c for c in ('pedido', 'referencia', 'cantidad') if c not in seleccion]
+    if faltantes:
+        raise ValueError(f"{ruta}: faltan las columnas {', '.join(faltantes)}")
+    
+    # Filas agrupadas por pedido (en orden de aparición) sin crear un DataFrame por pedido
+    codigos, pedidos = pd.factorize(df[seleccion['pedido']])
+    orden = np.argsort(codigos, kind='stable')
+    limites = np.searchsorted(codigos[orden], np.arange(len(pedidos) + 1))
+    referencias = df[seleccion['referencia']].to_numpy()[orden].tolist()
+    cantidades = df[seleccion['cantidad']].to_numpy()[orden].tolist()
+    clientes = {
+        campo: df[seleccion[campo]].to_numpy()[orden].tolist()
+        for campo in CAMPOS_CLIENTE if campo in seleccion
+    }
+    for codigo, pedido in enumerate(pedidos.tolist()):
+        inicio, fin = limites[codigo], limites[codigo + 1]
+        yield {
+            'pedido': pedido,
+            'cliente': {campo: clientes[campo][inicio] if campo in clientes else '' for campo in CAMPOS_CLIENTE},
+            'referencias': referencias[inicio:fin],
+            'cantidades': cantidades[inicio:fin],
+            'opciones': {}
+        }
+
+def _leer_jsonl(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        for numero_linea, linea in enumerate(f, start=1):
+            if not linea.strip():
+                continue
+            identificador = f"{os.path.basename(ruta)}:{numero_linea}"
+            try:
+                datos = json.loads(linea)
+                items = [i if isinstance(i, dict) else {'referencia': i} for i in datos['items']]
+                referencias = [i.get('referencia') for i in items]
+                cantidades = [i.get('cantidad', 1) for i in items]
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                yield {'pedido': identificador, 'error': f'Línea inválida: {e}'}
+                continue
+            opciones = {}
+            if 'sede' in datos:
+                opciones['ubicacion'] = datos['sede']
+            if 'iva' in datos:
+                opciones['incluir_iva'] = datos['iva']
+            for campo in ('descuento', 'validez_dias'):
+                if campo in datos:
+                    opciones[campo] = datos[campo]
+            yield {
+                'pedido': datos.get('pedido', identificador),
+                'cliente': datos.get('cliente') or {},
+                'referencias': referencias,
+                'cantidades': cantidades,
+                'opciones': opciones
+            }
+
+def leer_pedidos(ruta):
+    """Pedidos de un archivo CSV o JSON lines, uno a la vez"""
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension in ('.jsonl', '.ndjson', '.json'):
+        return _leer_jsonl(ruta)
+    return _leer_csv(ruta)
+
+def validar_opciones(opciones):
+    """Opciones de un pedido con tipos correctos, o ValueError"""
+    ubicacion = leer_sede(opciones.get('ubicacion'))
+    incluir_iva = leer_booleano(opciones.get('incluir_iva'), True)
+    descuento = float(opciones.get('descuento', 0))
+    if not 0 <= descuento <= 100:
+        raise ValueError(f"descuento fuera de rango: {descuento}")
+    validez = int(opciones.get('validez_dias', 30))
+    if not 1 <= validez <= 3650:
+        raise ValueError(f"validez inválida: {validez}")
+    return dict(opciones, ubicacion=ubicacion, incluir_iva=incluir_iva, descuento=descuento, validez_dias=validez)
+
+def cotizar_bloque(generador, pedidos):
+    """Cotizar un bloque de pedidos (ya validados) resolviendo sus líneas de una sola vez.
+    
+    Las líneas de todos los pedidos con la misma sede e IVA se cruzan contra
+    el catálogo en una sola llamada a resolver_pedido y luego se reparten por
+    pedido. Devuelve, en el orden de entrada, el mismo diccionario que
+    cotizar_pedido para cada pedido.
+    """
+    resultados = [None] * len(pedidos)
+    grupos = {}
+    for posicion, pedido in enumerate(pedidos):
+        clave = (pedido['opciones']['ubicacion'], pedido['opciones']['incluir_iva'])
+        grupos.setdefault(clave, []).append(posicion)
+    
+    for (ubicacion, incluir_iva), posiciones in grupos.items():
+        # Línea global (1..n) -> pedido del bloque al que pertenece
+        dueno = []
+        referencias = []
+        cantidades = []
+        for posicion in posiciones:
+            dueno.extend([posicion] * len(pedidos[posicion]['referencias']))
+            referencias.extend(pedidos[posicion]['referencias'])
+            cantidades.extend(pedidos[posicion]['cantidades'])
+        inicio_pedido = {}
+        for linea, posicion in enumerate(dueno, start=1):
+            inicio_pedido.setdefault(posicion, linea)
+        
+        resuelto = generador.resolver_pedido(
+            pd.DataFrame({'referencia': referencias, 'cantidad': cantidades}, dtype=object),
+            ubicacion, incluir_iva
+        )
+        productos = {posicion: [] for posicion in posiciones}
+        reportes = {posicion: {'no_encontradas': [], 'sin_precio': [], 'cantidades_invalidas': []} for posicion in posiciones}
+        for producto in resuelto.get('productos', []):
+            posicion = dueno[producto['linea'] - 1]
+            producto['linea'] -= inicio_pedido[posicion] - 1
+            productos[posicion].append(producto)
+        for tipo in ('no_encontradas', 'sin_precio', 'cantidades_invalidas'):
+            for reporte in resuelto.get(tipo, []):
+                posicion = dueno[reporte['linea'] - 1]
+                reportes[posicion][tipo].append(dict(reporte, linea=reporte['linea'] - inicio_pedido[posicion] + 1))
+        
+        for posicion in posiciones:
+            pedido = pedidos[posicion]
+            total_lineas = len(pedido['referencias'])
+            resultado = dict(
+                reportes[posicion],
+                exito=bool(productos[posicion]),
+                cotizacion=None,
+                mensaje=f"{len(productos[posicion])} de {total_lineas} líneas del pedido listas para cotizar"
+            )
+            if productos[posicion]:
+                resultado['cotizacion'] = generador.generar_cotizacion(productos[posicion], pedido['cliente'], pedido['opciones'])
+            resultados[posicion] = resultado
+    return resultados
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description='Cotización por lotes a partir de archivos de pedidos')
+    parser.add_argument('pedidos', nargs='+', help='archivos de pedidos (.csv o .jsonl)')
+    parser.add_argument('--sede', choices=['caldas', 'chagualo'], default='caldas')
+    parser.add_argument('--sin-iva', dest='iva', action='store_false', help='precios sin IVA')
+    parser.add_argument('--descuento', type=float, default=0, help='porcentaje de descuento (0-100)')
+    parser.add_argument('--validez', type=int, default=30, help='días de validez de la cotización')
+    parser.add_argument('--json', help="archivo JSON lines de salida ('-' para la salida estándar)")
+    parser.add_argument('--pdf-dir', help='directorio donde escribir los PDF')
+    parser.add_argument('--zip', help='archivo ZIP donde escribir los PDF')
+    parser.add_argument('--procesos', type=int, default=None, help='procesos para los PDF (por defecto, uno por CPU)')
+    parser.add_argument('--empresa', help='archivo JSON con los datos de la empresa para el PDF')
+    parser.add_argument('--db', default=ARCHIVO_COTIZACIONES, help='base de cotizaciones (numeración e historial)')
+    parser.add_argument('--no-guardar', dest='guardar', action='store_false', help='no guardar las cotizaciones en el historial')
+    return parser
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    opciones_base = {
+        'ubicacion': args.sede,
+        'incluir_iva': args.iva,
+        'descuento': args.descuento,
+        'validez_dias': args.validez
+    }
+    datos_empresa = None
+    if args.empresa:
+        with open(args.empresa, encoding='utf-8') as f:
+            datos_empresa = json.load(f)
+    
+    def informar(mensaje):
+        print(mensaje, file=sys.stderr, flush=True)
+    
+    # Numeración por bloques: una transacción cada 100 cotizaciones
+    generador = GeneradorCotizacionesMadera(repositorio=RepositorioCotizaciones(args.db, tamano_bloque=100))
+    resultado = generador.cargar_excel_automatico()
+    if not resultado['exito']:
+        informar(f"❌ {resultado['mensaje']}")
+        return 2
+    
+    salida = None
+    if args.json == '-':
+        salida = sys.stdout
+    elif args.json:
+        salida = open(args.json, 'w', encoding='utf-8')
+    
+    inicio = time.perf_counter()
+    total_pedidos = 0
+    cotizaciones = []
+    por_guardar = []
+    fallidos = []
+    lineas_omitidas = 0
+    
+    def procesar(bloque):
+        nonlocal por_guardar, lineas_omitidas
+        for pedido, resultado in zip(bloque, cotizar_bloque(generador, bloque)):
+            if not resultado['exito']:
+                fallidos.append({'pedido': pedido['pedido'], 'mensaje': resultado['mensaje']})
+                continue
+            omitidas = resultado['no_encontradas'] + resultado['sin_precio'] + resultado['cantidades_invalidas']
+            lineas_omitidas += len(omitidas)
+            
+            cotizacion = resultado['cotizacion']
+            cotizaciones.append(cotizacion)
+            if salida is not None:
+                salida.write(json.dumps(
+                    {'pedido': pedido['pedido'], 'cotizacion': cotizacion, 'lineas_omitidas': omitidas},
+                    ensure_ascii=False, default=str
+                ) + '\n')
+            if args.guardar:
+                por_guardar.append(cotizacion)
+                if len(por_guardar) >= LOTE_GUARDADO:
+                    generador.repositorio.guardar_varias(por_guardar)
+                    por_guardar = []
+    
+    try:
+        bloque = []
+        for ruta in args.pedidos:
+            try:
+                for pedido in leer_pedidos(ruta):
+                    total_pedidos += 1
+                    if 'error' in pedido:
+                        fallidos.append({'pedido': pedido['pedido'], 'mensaje': pedido['error']})
+                        continue
+                    try:
+                        pedido['opciones'] = validar_opciones(dict(opciones_base, **pedido['opciones']))
+                    except (TypeError, ValueError) as e:
+                        fallidos.append({'pedido': pedido['pedido'], 'mensaje': str(e)})
+                        continue
+                    if not pedido['cliente'].get('nombre'):
+                        pedido['cliente'] = dict(pedido['cliente'], nombre=str(pedido['pedido']))
+                    bloque.append(pedido)
+                    if len(bloque) >= PEDIDOS_POR_BLOQUE:
+                        procesar(bloque)
+                        bloque = []
+            except (OSError, ValueError) as e:
+                fallidos.append({'pedido': ruta, 'mensaje': f'No se pudo leer el archivo: {e}'})
+        if bloque:
+            procesar(bloque)
+        if por_guardar:
+            generador.repositorio.guardar_varias(por_guardar)
+    finally:
+        if salida is not None and salida is not sys.stdout:
+            salida.close()
+    tiempo_cotizacion = time.perf_counter() - inicio
+    
+    errores_pdf = []
+    tiempo_pdf = 0.0
+    if cotizaciones and (args.pdf_dir or args.zip):
+        inicio = time.perf_counter()
+        resultado_pdf = generador.generar_pdfs_lote(
+            cotizaciones,
+            datos_empresa,
+            max_procesos=args.procesos,
+            destino_zip=args.zip,
+            destino_directorio=args.pdf_dir if not args.zip else None
+        )
+        errores_pdf = resultado_pdf['errores']
+        tiempo_pdf = time.perf_counter() - inicio
+    
+    # Resumen
+    informar(f"📋 Pedidos leídos: {total_pedidos}")
+    informar(
+        f"✅ Cotizaciones: {len(cotizaciones)} en {tiempo_cotizacion:.2f} s "
+        f"({len(cotizaciones) / tiempo_cotizacion if tiempo_cotizacion else 0:.0f}/s)"
+    )
+    if lineas_omitidas:
+        informar(f"⚠️ Líneas omitidas (referencia desconocida, sin precio o cantidad inválida): {lineas_omitidas}")
+    if args.pdf_dir or args.zip:
+        generados = len(cotizaciones) - len(errores_pdf)
+        informar(
+            f"📄 PDF: {generados} en {tiempo_pdf:.2f} s "
+            f"({generados / tiempo_pdf if tiempo_pdf else 0:.1f}/s) -> {args.zip or args.pdf_dir}"
+        )
+    for fallido in fallidos:
+        informar(f"❌ Pedido {fallido['pedido']}: {fallido['mensaje']}")
+    for error in errores_pdf:
+        informar(f"❌ PDF {error['numero_cotizacion']}: {error['error']}")
+    
+    return 1 if fallidos or errores_pdf else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Datos de prueba compartidos: un catálogo sintético pequeño y el listado real."""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from Cotizador import (  # noqa: E402
+    ARCHIVO_CATALOGO,
+    FUENTES_CATALOGO,
+    GeneradorCotizacionesMadera,
+    compactar_catalogo,
+    leer_fuentes_catalogo
+)
+
+COLUMNAS = [
+    'TIPO MADERA', 'PRODUCTO', 'Referencia', 'DESCRIPCION', 'ACABADO DE LA MADERA', 'USO', 'GARANTIA',
+    'PRECIO CALDAS', 'PRECIO CALDAS CON IVA',
+    'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL', 'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL IVA INCLUIDO'
+]
+
+FILAS = [
+    ('ASERRADA INMUNIZADA', 'ALFARDA', 'ALF-001', 'ALFARDA 3 M 4X4 CM', 'CEPILLADO INMUNIZADA',
+     'CONSTRUCCION', '20 AÑOS CONTRS PUDRICION Y COMEJEN', 10000, 11900, 10500, 12495),
+    ('ASERRADA SIN INMUNIZAR', 'TABLAS, TABLILLAS, TABLONES', 'TAB-002', 'TABLA PINOCHO 2X4 (PINO)', 'RUSTICO',
+     'CONSTRUCCION', 'SIN GARANTIA', 5000, 5950, 5000, 5950),
+    ('CILINDRADA INMUNIZADA', 'ESTACON CILINDRICO', 'EST-003', 'ESTACÓN CILÍNDRICO 2.5 M', 'CILINDRADA',
+     'CERCOS Y CULTIVOS', '20 AÑOS CONTRS PUDRICION Y COMEJEN', 8000, 8400, 8200, 8610),
+    ('CILINDRADA INMUNIZADA', 'ESTACON CILINDRICO', 'EST-004', 'ESTACÓN CILÍNDRICO 3 M', 'CILINDRADA',
+     'CERCOS Y CULTIVOS', '20 AÑOS CONTRS PUDRICION Y COMEJEN', 9000, 9450, 9300, 9765),
+    ('ASERRADA INMUNIZADA', 'ESTACON CALIBRADO', 'VAR-005', 'VARETA 3 M', 'CALIBRADA',
+     'CERCOS Y CULTIVOS', '20 AÑOS CONTRS PUDRICION Y COMEJEN', 3524.21, 4193.81, 0, 0),
+    ('ASERRADA SIN INMUNIZAR', 'ALFARDA', ' alf-006 ', 'ALFARDA RÚSTICA 4 M', 'RUSTICO',
+     'CONSTRUCCION', 'SIN GARANTIA', 7000, 8330, 7100, 8449),
+]
+
+@pytest.fixture
+def productos():
+    """Catálogo sintético de seis productos, con tildes, precios con centavos y un precio en 0"""
+    return compactar_catalogo(pd.DataFrame(FILAS, columns=COLUMNAS))
+
+@pytest.fixture
+def generador(productos):
+    """Generador sobre el catálogo sintético, sin pasar por el almacén compartido"""
+    generador = GeneradorCotizacionesMadera()
+    generador.productos = productos
+    return generador
+
+@pytest.fixture(scope='session')
+def catalogo_real():
+    """Listado real de la empresa (principal + lista .xls), leído sin escribir snapshot"""
+    if not os.path.exists(os.path.join(RAIZ, ARCHIVO_CATALOGO)):
+        pytest.skip('No está el listado de precios')
+    fuentes = [type(fuente)(os.path.join(RAIZ, fuente.ruta), fuente.nombre) for fuente in FUENTES_CATALOGO]
+    productos, _, _, _ = leer_fuentes_catalogo(fuentes)
+    return productos
@@ -0,0 +1,133 @@
+"""API HTTP: validación de opciones y respuestas de cada ruta."""
+import asyncio
+import json
+from urllib.parse import urlencode
+
+import pytest
+
+pytest.importorskip('starlette')
+
+import Cotizador  # noqa: E402
+from Cotizador import CachePDF, RepositorioCotizaciones  # noqa: E402
+from api_cotizador import ErrorSolicitud, _empresa, _opciones, crear_aplicacion  # noqa: E402
+
+def test_validez_por_defecto():
+    assert _opciones({})['validez_dias'] == 30
+
+@pytest.mark.parametrize('validez', [0, 3651, 10**9])
+def test_validez_fuera_de_rango(validez):
+    with pytest.raises(ErrorSolicitud):
+        _opciones({'validez_dias': validez})
+
+def test_validez_maxima():
+    assert _opciones({'validez_dias': 3650})['validez_dias'] == 3650
+
+def test_iva_y_sede_como_texto():
+    opciones = _opciones({'iva': 'false', 'sede': ' Chagualo'})
+    assert (opciones['ubicacion'], opciones['incluir_iva']) == ('chagualo', False)
+    with pytest.raises(ErrorSolicitud):
+        _opciones({'iva': 'quizas'})
+
+def test_empresa_completa_los_datos_por_defecto():
+    empresa = _empresa({'nombre': 'X'})
+    assert empresa['nombre'] == 'X'
+    assert empresa['nit'] == Cotizador.DATOS_EMPRESA_POR_DEFECTO['nit']
+    assert _empresa(None) is None
+
+class Cliente:
+    """Llama a la aplicación ASGI directamente, sin servidor ni cliente HTTP"""
+    
+    def __init__(self, aplicacion):
+        self.aplicacion = aplicacion
+    
+    def pedir(self, metodo, ruta, parametros=None, cuerpo=None):
+        contenido = b'' if cuerpo is None else json.dumps(cuerpo).encode('utf-8')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': metodo,
+            'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode('utf-8'), 'root_path': '',
+            'query_string': urlencode(parametros or {}).encode('ascii'),
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(contenido)).encode())],
+            'server': ('prueba', 80), 'client': ('prueba', 1234)
+        }
+        mensajes = []
+        
+        async def recibir():
+            return {'type': 'http.request', 'body': contenido, 'more_body': False}
+        
+        async def enviar(mensaje):
+            mensajes.append(mensaje)
+        
+        asyncio.run(self.aplicacion(scope, recibir, enviar))
+        inicio = mensajes[0]
+        encabezados = {clave.decode('latin-1'): valor.decode('latin-1') for clave, valor in inicio['headers']}
+        cuerpo = b''.join(m.get('body', b'') for m in mensajes[1:])
+        return inicio['status'], encabezados, cuerpo
+    
+    def json(self, metodo, ruta, parametros=None, cuerpo=None):
+        estado, _, contenido = self.pedir(metodo, ruta, parametros, cuerpo)
+        return estado, json.loads(contenido)
+
+@pytest.fixture
+def repositorio(tmp_path):
+    return RepositorioCotizaciones(str(tmp_path / 'cotizaciones.db'))
+
+@pytest.fixture
+def cliente(monkeypatch, tmp_path, generador, repositorio):
+    monkeypatch.setattr(Cotizador, 'CACHE_PDF', CachePDF(str(tmp_path / 'pdf')))
+    return Cliente(crear_aplicacion(generador=generador, repositorio=repositorio, vigilar_catalogo=False))
+
+PEDIDO = {'cliente': {'nombre': 'B'}, 'items': [{'referencia': 'ALF-001', 'cantidad': 2}]}
+
+def test_salud(cliente):
+    estado, respuesta = cliente.json('GET', '/salud')
+    assert estado == 200
+    assert respuesta['total_productos'] == 6
+
+def test_buscar(cliente):
+    estado, respuesta = cliente.json('GET', '/buscar', {'q': 'alfarda', 'sede': 'Chagualo', 'iva': '0'})
+    assert estado == 200
+    assert [r['referencia'] for r in respuesta['resultados']] == ['ALF-001', ' alf-006 ']
+    assert respuesta['resultados'][0]['precio_numerico'] == 10500
+
+@pytest.mark.parametrize('parametros', [
+    {'q': 'alfarda', 'limite': 'diez'}, {'q': 'alfarda', 'limite': 0}, {'q': 'alfarda', 'sede': 'bogota'}, {}
+])
+def test_buscar_parametros_invalidos(cliente, parametros):
+    estado, respuesta = cliente.json('GET', '/buscar', parametros)
+    assert estado == 400
+    assert respuesta['exito'] is False
+
+def test_cotizacion_con_referencia_desconocida(cliente):
+    estado, respuesta = cliente.json('POST', '/cotizaciones', cuerpo=dict(PEDIDO, items=[{'referencia': 'NO-EXISTE'}]))
+    assert estado == 422
+    assert [l['referencia'] for l in respuesta['no_encontradas']] == ['NO-EXISTE']
+
+def test_cotizacion_se_guarda_y_se_consulta(cliente):
+    estado, respuesta = cliente.json('POST', '/cotizaciones', cuerpo=PEDIDO)
+    assert estado == 200
+    numero = respuesta['cotizacion']['numero_cotizacion']
+    estado, guardada = cliente.json('GET', f'/cotizaciones/{numero}')
+    assert estado == 200
+    assert guardada['cotizacion']['resumen']['total_numerico'] == 23800
+
+def test_cotizacion_pdf(cliente):
+    estado, encabezados, contenido = cliente.pedir('POST', '/cotizaciones/pdf', cuerpo=dict(PEDIDO, empresa={'nombre': 'X & <Y>'}))
+    assert estado == 200
+    assert contenido.startswith(b'%PDF')
+    numero = encabezados['x-numero-cotizacion']
+    assert numero.startswith('COT-CONST-')
+    assert encabezados['content-type'] == 'application/pdf'
+    # La cotización guardada se puede volver a pedir por número
+    estado, _, otra_vez = cliente.pedir('POST', '/cotizaciones/pdf', cuerpo={'numero_cotizacion': numero})
+    assert estado == 200 and otra_vez.startswith(b'%PDF')
+
+def test_cotizacion_inexistente(cliente):
+    assert cliente.json('GET', '/cotizaciones/COT-CONST-209901-000001')[0] == 404
+    assert cliente.json('POST', '/cotizaciones/pdf', cuerpo={'numero_cotizacion': 'NO-EXISTE'})[0] == 404
+
+@pytest.mark.parametrize('empresa', [{'nombre': 'X', 'color': 'rojo'}, {'nit': 123}, 'X', ['nombre']])
+def test_empresa_invalida_no_consume_numero(cliente, repositorio, empresa):
+    estado, respuesta = cliente.json('POST', '/cotizaciones/pdf', cuerpo=dict(PEDIDO, empresa=empresa))
+    assert estado == 400
+    assert 'empresa' in respuesta['mensaje']
+    assert repositorio.siguiente_numero().endswith('-000001')
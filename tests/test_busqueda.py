@@ -0,0 +1,95 @@
+"""Búsqueda por índice invertido y búsqueda difusa."""
+import numpy as np
+import pytest
+
+from Cotizador import COLUMNAS_BUSQUEDA, GeneradorCotizacionesMadera, IndiceBusqueda, tokenizar
+
+def filas_por_recorrido(productos, consulta):
+    """Búsqueda por fuerza bruta: filas en que cada término es prefijo de algún token"""
+    terminos = set(tokenizar(consulta))
+    columnas = [col for col in COLUMNAS_BUSQUEDA if col in productos.columns]
+    filas = []
+    for fila, valores in enumerate(productos[columnas].astype(object).fillna('').itertuples(index=False)):
+        tokens = {token for valor in valores for token in tokenizar(valor)}
+        if all(any(token.startswith(termino) for token in tokens) for termino in terminos):
+            filas.append(fila)
+    return filas
+
+def consultas_de_prueba(productos, cantidad=60, semilla=7):
+    """Consultas de una y dos palabras (completas o prefijos) tomadas del propio catálogo"""
+    rng = np.random.default_rng(semilla)
+    descripciones = productos['DESCRIPCION'].astype(str).tolist()
+    consultas = []
+    for _ in range(cantidad):
+        tokens = tokenizar(descripciones[rng.integers(len(descripciones))])
+        if not tokens:
+            continue
+        elegidos = rng.choice(tokens, size=min(len(tokens), rng.integers(1, 3)), replace=False)
+        consultas.append(' '.join(token[:max(1, rng.integers(1, len(token) + 1))] for token in elegidos))
+    return consultas
+
+def test_indice_igual_a_recorrido_completo(catalogo_real):
+    indice = IndiceBusqueda(catalogo_real)
+    for consulta in consultas_de_prueba(catalogo_real) + ['alfarda 3', 'pino', 'inmunizada 10', 'zzz']:
+        assert indice.buscar(consulta).tolist() == filas_por_recorrido(catalogo_real, consulta), consulta
+
+def test_buscar_productos_igual_a_recorrido_con_filtro(catalogo_real):
+    generador = GeneradorCotizacionesMadera()
+    generador.productos = catalogo_real
+    sin_inmunizar = catalogo_real['TIPO MADERA'].astype(str).str.contains('SIN INMUNIZAR', case=False).to_numpy()
+    for consulta in ['alfarda', 'tabla', 'estacon 2']:
+        esperadas = filas_por_recorrido(catalogo_real, consulta)
+        for solo_inmunizada, filtro in [(None, lambda f: True), (True, lambda f: not sin_inmunizar[f]), (False, lambda f: sin_inmunizar[f])]:
+            resultado = generador.buscar_productos(consulta, limite=10_000, solo_inmunizada=solo_inmunizada)
+            referencias = [r['referencia'] for r in resultado['resultados']] if resultado['exito'] else []
+            assert referencias == catalogo_real['Referencia'].iloc[[f for f in esperadas if filtro(f)]].tolist()
+
+def test_tildes_y_mayusculas_no_importan(generador):
+    con_tilde = generador.buscar_productos('ESTACÓN cilíndrico')
+    sin_tilde = generador.buscar_productos('estacon cilindrico')
+    assert [r['referencia'] for r in con_tilde['resultados']] == ['EST-003', 'EST-004']
+    assert [r['referencia'] for r in sin_tilde['resultados']] == ['EST-003', 'EST-004']
+
+def test_caracteres_de_regex_no_fallan(generador):
+    resultado = generador.buscar_productos('2x4 (pino)')
+    assert [r['referencia'] for r in resultado['resultados']] == ['TAB-002']
+    assert generador.buscar_productos('[(*+?')['exito'] is False
+
+def test_sin_tokens_coincidentes_busca_literal_en_descripcion(generador):
+    # "nocho" no es prefijo de ningún token, pero aparece dentro de "PINOCHO"
+    resultado = generador.buscar_productos('nocho')
+    assert [r['referencia'] for r in resultado['resultados']] == ['TAB-002']
+
+def test_paginacion(generador):
+    primera = generador.buscar_productos('m', limite=2)
+    segunda = generador.buscar_productos('m', limite=2, desplazamiento=primera['siguiente'])
+    assert primera['total_coincidencias'] == segunda['total_coincidencias'] == 5
+    assert {r['referencia'] for r in primera['resultados']}.isdisjoint(r['referencia'] for r in segunda['resultados'])
+    assert segunda['anterior'] == 0
+
+@pytest.mark.parametrize('consulta, esperada', [
+    ('estacon', 'EST-003'),
+    ('alfardas', 'ALF-001'),
+    ('rustico', ' alf-006 '),
+    ('vareta 3m', 'VAR-005'),
+    ('estcon', 'EST-003'),
+])
+def test_difusa_tolera_errores(generador, consulta, esperada):
+    resultado = generador.buscar_productos(consulta, difuso=True)
+    assert esperada in [r['referencia'] for r in resultado['resultados']]
+
+def test_difusa_referencia_exacta_primero(generador):
+    resultado = generador.buscar_productos('var-005', difuso=True)
+    assert resultado['resultados'][0]['referencia'] == 'VAR-005'
+
+def test_difusa_incluye_las_coincidencias_exactas(catalogo_real):
+    generador = GeneradorCotizacionesMadera()
+    generador.productos = catalogo_real
+    for consulta in consultas_de_prueba(catalogo_real, cantidad=20, semilla=3):
+        exactas = set(filas_por_recorrido(catalogo_real, consulta))
+        difusas = generador.obtener_snapshot().indice_difuso.buscar(consulta)
+        assert exactas <= set(difusas.tolist()), consulta
+
+def test_difusa_respeta_filtro_de_inmunizacion(generador):
+    resultado = generador.buscar_productos('alfarda', difuso=True, solo_inmunizada=True)
+    assert [r['referencia'] for r in resultado['resultados']] == ['ALF-001']
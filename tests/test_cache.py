@@ -0,0 +1,162 @@
+"""Caché LRU de búsquedas y caché en disco de PDF: expulsión, vencimiento, contadores e invalidación."""
+import copy
+import os
+
+import pytest
+
+import Cotizador
+from Cotizador import CACHE_BUSQUEDAS, CachePDF, CacheLRU, PlantillaPDF
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+    
+    def __call__(self):
+        return self.ahora
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(Cotizador.time, 'monotonic', reloj)
+    return reloj
+
+def test_expulsa_la_menos_usada():
+    cache = CacheLRU(maximo=2)
+    cache.obtener('a', lambda: 1)
+    cache.obtener('b', lambda: 2)
+    cache.obtener('a', lambda: 0)
+    cache.obtener('c', lambda: 3)
+    assert cache.obtener('a', lambda: 'recalculado') == 1
+    assert cache.obtener('b', lambda: 'recalculado') == 'recalculado'
+    assert cache.estadisticas()['entradas'] == 2
+
+def test_vencimiento(reloj):
+    cache = CacheLRU(ttl=10)
+    assert cache.obtener('a', lambda: 1) == 1
+    reloj.ahora += 9.9
+    assert cache.obtener('a', lambda: 2) == 1
+    reloj.ahora += 0.1
+    assert cache.obtener('a', lambda: 2) == 2
+
+def test_contadores():
+    cache = CacheLRU()
+    for _ in range(3):
+        cache.obtener('a', lambda: 1)
+    cache.obtener('b', lambda: 1)
+    estadisticas = cache.estadisticas()
+    assert (estadisticas['aciertos'], estadisticas['fallos']) == (2, 2)
+    assert estadisticas['tasa_aciertos'] == 0.5
+
+def test_limpiar():
+    cache = CacheLRU()
+    cache.obtener('a', lambda: 1)
+    cache.limpiar()
+    assert cache.obtener('a', lambda: 2) == 2
+
+def test_migrar_copia_bajo_la_clave_nueva_sin_renovar_el_vencimiento(reloj):
+    cache = CacheLRU(ttl=10)
+    cache.obtener(('v1', 'pino'), lambda: 'resultado v1')
+    cache.obtener(('v1', 'roble'), lambda: 'otro')
+    reloj.ahora += 5
+    migradas = cache.migrar(lambda clave, valor: (('v2',) + clave[1:], valor + ' migrado') if clave[1] == 'pino' else None)
+    assert migradas == 1
+    assert cache.obtener(('v2', 'pino'), lambda: 'recalculado') == 'resultado v1 migrado'
+    assert cache.obtener(('v1', 'pino'), lambda: 'recalculado') == 'resultado v1'
+    reloj.ahora += 5
+    assert cache.obtener(('v2', 'pino'), lambda: 'recalculado') == 'recalculado'
+
+def test_busqueda_repetida_sale_de_la_cache(generador):
+    primera = generador.buscar_productos('alfarda')
+    antes = CACHE_BUSQUEDAS.estadisticas()['aciertos']
+    segunda = generador.buscar_productos('  ALFARDA ')
+    assert segunda is primera
+    assert CACHE_BUSQUEDAS.estadisticas()['aciertos'] == antes + 1
+
+@pytest.mark.parametrize('opciones', [
+    {'ubicacion': 'chagualo'},
+    {'incluir_iva': False},
+    {'solo_inmunizada': True},
+    {'difuso': True},
+    {'limite': 1},
+])
+def test_la_clave_distingue_las_opciones(generador, opciones):
+    base = generador.buscar_productos('alfarda')
+    assert generador.buscar_productos('alfarda', **opciones) is not base
+
+def test_otra_version_del_catalogo_no_usa_resultados_anteriores(generador, productos):
+    anterior = generador.buscar_productos('alfarda')
+    nuevos = productos.copy()
+    nuevos['PRECIO CALDAS CON IVA'] = nuevos['PRECIO CALDAS CON IVA'] + 100
+    generador.productos = nuevos
+    actual = generador.buscar_productos('alfarda')
+    assert actual is not anterior
+    assert actual['resultados'][0]['precio_numerico'] == anterior['resultados'][0]['precio_numerico'] + 100
+
+@pytest.fixture
+def cache_pdf(tmp_path):
+    logo = tmp_path / 'logo.png'
+    logo.write_bytes(b'logo')
+    return CachePDF(str(tmp_path / 'pdf'), maximo_bytes=250, logo_path=str(logo))
+
+@pytest.fixture
+def cotizacion(generador):
+    items = [dict(p, cantidad=2) for p in generador.buscar_por_referencia(['ALF-001', 'EST-003'])['resultados']]
+    return generador.generar_cotizacion(items, {'nombre': 'Cliente', 'nit_cedula': '900123'}, {'numero_cotizacion': 'COT-1'})
+
+def test_pdf_misma_cotizacion_sale_de_disco(cache_pdf, cotizacion):
+    generados = []
+    def generar():
+        generados.append(1)
+        return b'%PDF-1'
+    assert cache_pdf.obtener(cotizacion, None, generar) == b'%PDF-1'
+    # Otra copia con el mismo contenido (y las claves en otro orden) da la misma clave
+    copia = dict(reversed(list(copy.deepcopy(cotizacion).items())))
+    assert cache_pdf.obtener(copia, None, generar) == b'%PDF-1'
+    assert len(generados) == 1
+    estadisticas = cache_pdf.estadisticas()
+    assert (estadisticas['aciertos'], estadisticas['fallos'], estadisticas['entradas']) == (1, 1, 1)
+
+@pytest.mark.parametrize('cambiar', [
+    lambda c: c['cliente'].update(nombre='Otro cliente'),
+    lambda c: c['items'][0].update(cantidad=3),
+    lambda c: c['resumen'].update(total_numerico=c['resumen']['total_numerico'] + 1),
+    lambda c: c.update(numero_cotizacion='COT-2'),
+    lambda c: c.update(fecha_vencimiento='01/01/2099'),
+])
+def test_pdf_cualquier_campo_cambia_la_clave(cache_pdf, cotizacion, cambiar):
+    clave = cache_pdf.clave(cotizacion)
+    cambiada = copy.deepcopy(cotizacion)
+    cambiar(cambiada)
+    assert cache_pdf.clave(cambiada) != clave
+    assert cache_pdf.clave(cotizacion) == clave
+
+def test_pdf_clave_incluye_empresa_plantilla_y_logo(monkeypatch, cache_pdf, cotizacion):
+    clave = cache_pdf.clave(cotizacion)
+    assert cache_pdf.clave(cotizacion, dict(Cotizador.DATOS_EMPRESA_POR_DEFECTO)) == clave
+    assert cache_pdf.clave(cotizacion, dict(Cotizador.DATOS_EMPRESA_POR_DEFECTO, nombre='Otra')) != clave
+    with open(cache_pdf.logo_path, 'ab') as logo:
+        logo.write(b'nuevo')
+    assert cache_pdf.clave(cotizacion) != clave
+    clave = cache_pdf.clave(cotizacion)
+    monkeypatch.setattr(PlantillaPDF, 'VERSION', PlantillaPDF.VERSION + 1)
+    assert cache_pdf.clave(cotizacion) != clave
+
+def test_pdf_expulsa_los_menos_usados_sin_pasar_el_limite(cache_pdf):
+    for numero, clave in enumerate('abc'):
+        cache_pdf.guardar(clave, bytes(100))
+        # Fechas de uso explícitas: dos escrituras seguidas podrían quedar con la misma
+        os.utime(cache_pdf._ruta(clave), ns=(10**18 + numero, 10**18 + numero))
+        assert cache_pdf.estadisticas()['bytes'] <= cache_pdf.maximo_bytes
+    # El límite (250) admite dos PDF de 100 bytes: se fue el más antiguo
+    assert [cache_pdf.leer(clave) is not None for clave in 'abc'] == [False, True, True]
+    
+    # Leer 'b' lo marca como usado: el siguiente en salir es 'c'
+    os.utime(cache_pdf._ruta('c'), ns=(10**18 + 5, 10**18 + 5))
+    assert cache_pdf.leer('b') is not None
+    cache_pdf.guardar('d', bytes(100))
+    assert [cache_pdf.leer(clave) is not None for clave in 'bcd'] == [True, False, True]
+    assert cache_pdf.estadisticas()['bytes'] == 200
+    
+    # Un PDF más grande que el límite no se queda en disco
+    cache_pdf.guardar('e', bytes(300))
+    assert cache_pdf.estadisticas()['bytes'] <= cache_pdf.maximo_bytes
@@ -0,0 +1,151 @@
+"""Diferencias entre versiones del catálogo y su aplicación incremental."""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from conftest import COLUMNAS, FILAS
+from Cotizador import AlmacenCatalogo, FuenteCatalogo, SnapshotCatalogo, compactar_catalogo, diferencias_catalogo
+from test_busqueda import consultas_de_prueba
+
+def catalogo(filas=FILAS):
+    return compactar_catalogo(pd.DataFrame(filas, columns=COLUMNAS))
+
+def con_cambios(filas, **cambios):
+    """Copia de las filas con cambios {índice: {columna: valor}}"""
+    filas = [list(fila) for fila in filas]
+    for indice, valores in cambios.items():
+        for columna, valor in valores.items():
+            filas[int(indice[1:])][COLUMNAS.index(columna)] = valor
+    return [tuple(fila) for fila in filas]
+
+def test_solo_precios():
+    nuevas = con_cambios(FILAS, f0={'PRECIO CALDAS': 10100}, f4={'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL': 3600})
+    diferencias = diferencias_catalogo(catalogo(), catalogo(nuevas))
+    assert diferencias['misma_estructura']
+    assert diferencias['agregadas'].size == diferencias['eliminadas'].size == diferencias['texto_cambiado'].size == 0
+    assert diferencias['cambios_precio'] == [
+        {'referencia': 'ALF-001', 'columna': 'PRECIO CALDAS', 'anterior': 10000.0, 'nuevo': 10100.0},
+        {'referencia': 'VAR-005', 'columna': 'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL', 'anterior': 0.0, 'nuevo': 3600.0},
+    ]
+
+def test_texto_cambiado():
+    diferencias = diferencias_catalogo(catalogo(), catalogo(con_cambios(FILAS, f2={'DESCRIPCION': 'ESTACÓN 2.4 M'})))
+    assert diferencias['texto_cambiado'].tolist() == [2]
+    assert not diferencias['misma_estructura']
+    assert diferencias['cambios_precio'] == []
+
+def test_filas_agregadas_y_eliminadas():
+    nuevas = [FILAS[0], FILAS[2], FILAS[3], FILAS[4], FILAS[5], ('X', 'X', 'NUE-007', 'NUEVO', '', '', '', 1, 1, 1, 1)]
+    diferencias = diferencias_catalogo(catalogo(), catalogo(nuevas))
+    assert diferencias['agregadas'].tolist() == [5]
+    assert diferencias['eliminadas'].tolist() == [1]
+    assert diferencias['mapa'].tolist() == [0, -1, 1, 2, 3, 4]
+    assert diferencias['orden_conservado']
+
+def test_referencias_repetidas_no_son_incrementales():
+    diferencias = diferencias_catalogo(catalogo(), catalogo(FILAS + [FILAS[0]]))
+    assert not diferencias['incremental']
+
+def test_orden_cambiado():
+    diferencias = diferencias_catalogo(catalogo(), catalogo(FILAS[::-1]))
+    assert diferencias['incremental'] and not diferencias['orden_conservado']
+    assert diferencias['agregadas'].size == diferencias['eliminadas'].size == 0
+
+def version_modificada(productos, semilla=11):
+    """Copia del catálogo con filas eliminadas, agregadas, textos y precios cambiados"""
+    rng = np.random.default_rng(semilla)
+    df = pd.DataFrame({col: productos[col].tolist() for col in productos.columns})
+    eliminadas = rng.choice(len(df), size=10, replace=False)
+    texto = rng.choice(len(df), size=5, replace=False)
+    precio = rng.choice(len(df), size=20, replace=False)
+    df.loc[texto, 'DESCRIPCION'] = [f'PRODUCTO RENOMBRADO {i} ZZTOP' for i in range(5)]
+    df.loc[precio, 'PRECIO CALDAS CON IVA'] = df.loc[precio, 'PRECIO CALDAS CON IVA'] + 100
+    df = df.drop(index=np.setdiff1d(eliminadas, texto)).reset_index(drop=True)
+    nuevas = df.iloc[:5].copy()
+    nuevas['Referencia'] = [f'NUEVA-{i}' for i in range(5)]
+    nuevas['DESCRIPCION'] = [f'VIGA NUEVA {i} M' for i in range(5)]
+    posicion = len(df) // 2
+    df = pd.concat([df.iloc[:posicion], nuevas, df.iloc[posicion:]], ignore_index=True)
+    return compactar_catalogo(df)
+
+def test_indices_derivados_iguales_a_reconstruidos(catalogo_real):
+    anterior = SnapshotCatalogo(catalogo_real, None, None, 'a' * 64).precalentar(difuso=True)
+    productos = version_modificada(catalogo_real)
+    diferencias = diferencias_catalogo(catalogo_real, productos)
+    assert diferencias['incremental'] and diferencias['orden_conservado'] and not diferencias['misma_estructura']
+    
+    derivado = anterior.derivar(productos, diferencias, None, None, 'b' * 64)
+    completo = SnapshotCatalogo(productos, None, None, 'c' * 64)
+    assert derivado._indice_busqueda is not None and derivado._indice_busqueda is not anterior._indice_busqueda
+    assert derivado.indice_referencias == completo.indice_referencias
+    consultas = consultas_de_prueba(productos, cantidad=80) + ['renombrado zztop', 'viga nueva', 'nueva-3', 'alfarda']
+    for consulta in consultas:
+        assert derivado.indice_busqueda.buscar(consulta).tolist() == completo.indice_busqueda.buscar(consulta).tolist(), consulta
+        assert set(derivado.indice_difuso.buscar(consulta).tolist()) == set(completo.indice_difuso.buscar(consulta).tolist()), consulta
+
+def test_solo_precios_comparte_los_indices(catalogo_real):
+    anterior = SnapshotCatalogo(catalogo_real, None, None, 'a' * 64).precalentar()
+    productos = catalogo_real.copy()
+    productos['PRECIO CALDAS'] = productos['PRECIO CALDAS'] + 1
+    derivado = anterior.derivar(productos, diferencias_catalogo(catalogo_real, productos), None, None, 'b' * 64)
+    assert derivado.indice_busqueda is anterior.indice_busqueda
+    assert derivado.indice_referencias is anterior.indice_referencias
+    assert np.array_equal(derivado.precios[:, 0, 0], anterior.precios[:, 0, 0] + 1)
+
+def escribir_listado(ruta, filas, segundos):
+    pd.DataFrame(filas, columns=COLUMNAS).to_excel(ruta, index=False)
+    # Fecha de modificación explícita: dos escrituras seguidas podrían quedar con la misma
+    os.utime(ruta, ns=(segundos * 10**9, segundos * 10**9))
+
+def test_almacen_aplica_la_version_nueva_y_audita(tmp_path):
+    ruta = str(tmp_path / 'listado.xlsx')
+    auditoria = tmp_path / 'auditoria.jsonl'
+    fuentes = [FuenteCatalogo(ruta)]
+    almacen = AlmacenCatalogo(ruta_auditoria=str(auditoria))
+    escribir_listado(ruta, FILAS, 1_700_000_000)
+    primera = almacen.obtener(fuentes=fuentes).precalentar()
+    assert primera.diferencias is None
+    assert almacen.obtener(fuentes=fuentes) is primera
+    
+    nuevas = con_cambios(FILAS, f0={'PRECIO CALDAS CON IVA': 12000})[:-1]
+    escribir_listado(ruta, nuevas, 1_700_000_100)
+    segunda = almacen.obtener(fuentes=fuentes)
+    assert segunda is not primera
+    assert almacen.vigente(ruta) is segunda
+    assert segunda.diferencias['eliminadas'].tolist() == [5]
+    assert segunda.indice_busqueda.buscar('alfarda').tolist() == [0]
+    assert segunda.productos['PRECIO CALDAS CON IVA'].iat[0] == 12000
+    
+    lineas = [json.loads(linea) for linea in auditoria.read_text(encoding='utf-8').splitlines()]
+    assert [(l['tipo'], l['referencia']) for l in lineas] == [('precio', 'ALF-001'), ('eliminada', 'alf-006')]
+    assert lineas[0]['anterior'] == 11900 and lineas[0]['nuevo'] == 12000
+    assert {(l['version_anterior'], l['version']) for l in lineas} == {(primera.version, segunda.version)}
+
+def test_cada_cambio_se_audita_una_vez_entre_almacenes(tmp_path):
+    ruta = str(tmp_path / 'listado.xlsx')
+    auditoria = tmp_path / 'auditoria.jsonl'
+    fuentes = [FuenteCatalogo(ruta)]
+    # Dos procesos con su propio almacén sobre el mismo listado y el mismo registro
+    almacenes = [AlmacenCatalogo(ruta_auditoria=str(auditoria)) for _ in range(2)]
+    escribir_listado(ruta, FILAS, 1_700_000_000)
+    primeras = [almacen.obtener(fuentes=fuentes) for almacen in almacenes]
+    
+    nuevas = con_cambios(FILAS, f0={'PRECIO CALDAS': 10100}, f2={'PRECIO CALDAS': 4000})
+    escribir_listado(ruta, nuevas, 1_700_000_100)
+    segundas = [almacen.obtener(fuentes=fuentes) for almacen in almacenes]
+    assert segundas[0] is not segundas[1]
+    assert segundas[0].version == segundas[1].version != primeras[0].version
+    
+    lineas = [json.loads(linea) for linea in auditoria.read_text(encoding='utf-8').splitlines()]
+    assert sorted((l['referencia'], l['columna']) for l in lineas) == [('ALF-001', 'PRECIO CALDAS'), ('EST-003', 'PRECIO CALDAS')]
+
+def test_misma_huella_conserva_la_version(tmp_path):
+    ruta = str(tmp_path / 'listado.xlsx')
+    fuentes = [FuenteCatalogo(ruta)]
+    almacen = AlmacenCatalogo(ruta_auditoria=None)
+    escribir_listado(ruta, FILAS, 1_700_000_000)
+    primera = almacen.obtener(fuentes=fuentes)
+    os.utime(ruta, ns=(1_700_000_500 * 10**9,) * 2)
+    assert almacen.obtener(fuentes=fuentes) is primera
@@ -0,0 +1,71 @@
+"""Cotización por lotes: lectura de pedidos, cotización por bloques y PDF."""
+import zipfile
+
+import pytest
+
+from Cotizador import generar_pdfs_lote
+from cli_cotizador import cotizar_bloque, leer_pedidos, validar_opciones
+
+OPCIONES = {'ubicacion': 'caldas', 'incluir_iva': True, 'descuento': 0, 'validez_dias': 30}
+
+def pedidos_de(tmp_path, contenido, nombre='pedidos.csv'):
+    ruta = tmp_path / nombre
+    ruta.write_text(contenido, encoding='utf-8')
+    pedidos = list(leer_pedidos(str(ruta)))
+    for pedido in pedidos:
+        pedido['opciones'] = validar_opciones(dict(OPCIONES, **pedido['opciones']))
+    return pedidos
+
+def test_pdf_de_cliente_con_marcado(tmp_path, generador):
+    pedidos = pedidos_de(tmp_path, (
+        'pedido,cliente,empresa,referencia,cantidad\n'
+        'P-1,Cliente <b>Pruebas,Maderas <i> & Cia,ALF-001,2\n'
+        'P-1,,,EST-003,1\n'
+        'P-2,Otro & <Cliente>,,TAB-002,5\n'
+    ))
+    resultados = cotizar_bloque(generador, pedidos)
+    assert [r['exito'] for r in resultados] == [True, True]
+    assert resultados[0]['cotizacion']['cliente']['nombre'] == 'Cliente <b>Pruebas'
+    
+    destino = tmp_path / 'pdfs.zip'
+    cotizaciones = [r['cotizacion'] for r in resultados]
+    for numero, cotizacion in enumerate(cotizaciones, start=1):
+        cotizacion['numero_cotizacion'] = f'COT-{numero}'
+    resultado = generar_pdfs_lote(cotizaciones, max_procesos=2, destino_zip=str(destino))
+    assert resultado['errores'] == []
+    with zipfile.ZipFile(destino) as archivo:
+        assert len(archivo.namelist()) == 2
+        assert all(archivo.read(nombre).startswith(b'%PDF') for nombre in archivo.namelist())
+
+def test_cotizar_bloque_reparte_lineas_por_pedido(tmp_path, generador):
+    pedidos = pedidos_de(tmp_path, (
+        'pedido,referencia,cantidad\n'
+        'A,ALF-001,1\n'
+        'B,NO-EXISTE,1\n'
+        'A,EST-004,3\n'
+        'B,TAB-002,2\n'
+    ))
+    resultados = cotizar_bloque(generador, pedidos)
+    assert [[i['referencia'] for i in r['cotizacion']['items']] for r in resultados] == [['ALF-001', 'EST-004'], ['TAB-002']]
+    assert [l['linea'] for l in resultados[1]['no_encontradas']] == [1]
+
+def test_iva_y_sede_de_pedidos_jsonl(tmp_path, generador):
+    pedidos = pedidos_de(tmp_path, (
+        '{"pedido": "J-1", "items": [{"referencia": "ALF-001", "cantidad": 2}], "iva": "false", "sede": " Chagualo "}\n'
+        '{"pedido": "J-2", "items": ["ALF-001"], "iva": 0}\n'
+    ), 'pedidos.jsonl')
+    assert [p['opciones']['ubicacion'] for p in pedidos] == ['chagualo', 'caldas']
+    assert [p['opciones']['incluir_iva'] for p in pedidos] == [False, False]
+    resultados = cotizar_bloque(generador, pedidos)
+    assert [r['cotizacion']['items'][0]['precio_unitario_numerico'] for r in resultados] == [10500, 10000]
+
+@pytest.mark.parametrize('opciones', [
+    {'ubicacion': 'bogota'},
+    {'incluir_iva': 'quizas'},
+    {'descuento': 101},
+    {'validez_dias': 0},
+    {'validez_dias': 3651},
+])
+def test_opciones_invalidas(opciones):
+    with pytest.raises(ValueError):
+        validar_opciones(dict(OPCIONES, **opciones))
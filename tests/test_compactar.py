@@ -0,0 +1,66 @@
+"""Catálogo compacto: mismos valores con categorías, float32 exactos y referencias internadas."""
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import COLUMNAS, FILAS
+from Cotizador import COLUMNAS_PRECIO, compactar_catalogo, reporte_memoria_catalogo
+
+def catalogo_sin_compactar(repeticiones=1):
+    """Catálogo de prueba como queda después de limpiar_catalogo (precios en float64)"""
+    df = pd.DataFrame(FILAS * repeticiones, columns=COLUMNAS)
+    return df.astype(dict.fromkeys(COLUMNAS_PRECIO, 'float64'))
+
+@pytest.mark.parametrize('repeticiones', [1, 20])
+def test_vuelve_a_los_tipos_originales_sin_cambios(repeticiones):
+    original = catalogo_sin_compactar(repeticiones)
+    compacto = compactar_catalogo(original)
+    pd.testing.assert_frame_equal(compacto.astype(original.dtypes.to_dict()), original)
+    # El DataFrame recibido no se modifica
+    assert (original.dtypes == 'float64').sum() == len(COLUMNAS_PRECIO)
+
+def test_float32_solo_si_es_exacto():
+    compacto = compactar_catalogo(catalogo_sin_compactar())
+    # Caldas tiene centavos (3524.21, 4193.81) que float32 no representa exactos
+    assert compacto[COLUMNAS_PRECIO].dtypes.astype(str).tolist() == ['float64', 'float64', 'float32', 'float32']
+    for col in COLUMNAS_PRECIO:
+        assert np.array_equal(compacto[col].to_numpy(dtype='float64'), catalogo_sin_compactar()[col].to_numpy())
+
+def test_categorias_con_los_mismos_valores():
+    original = catalogo_sin_compactar(20)
+    compacto = compactar_catalogo(original)
+    categoricas = [col for col in COLUMNAS if isinstance(compacto[col].dtype, pd.CategoricalDtype)]
+    assert 'TIPO MADERA' in categoricas and 'Referencia' not in categoricas
+    for col in categoricas:
+        assert sorted(compacto[col].cat.categories) == sorted(original[col].unique())
+        assert compacto[col].astype(str).tolist() == original[col].tolist()
+    # Con seis filas distintas la descripción no se repite lo suficiente para ser categoría
+    assert not isinstance(compactar_catalogo(catalogo_sin_compactar())['DESCRIPCION'].dtype, pd.CategoricalDtype)
+
+def test_referencias_internadas():
+    internadas = [sys.intern(fila[COLUMNAS.index('Referencia')]) for fila in FILAS]
+    original = catalogo_sin_compactar()
+    # Cadenas armadas en ejecución: iguales a las internadas pero otros objetos
+    original['Referencia'] = pd.Series([''.join(list(r)) for r in internadas], dtype=object)
+    assert not any(r is i for r, i in zip(original['Referencia'], internadas))
+    compacto = compactar_catalogo(original)
+    assert compacto['Referencia'].dtype == object
+    assert all(r is i for r, i in zip(compacto['Referencia'], internadas))
+
+def test_reporte_de_memoria():
+    original = catalogo_sin_compactar(20)
+    reporte = reporte_memoria_catalogo(compactar_catalogo(original))
+    columnas = reporte['columnas']
+    # "Antes" es lo que ocupa cada columna en el catálogo sin compactar
+    assert {col: c['bytes_antes'] for col, c in columnas.items()} == original.memory_usage(index=False, deep=True).to_dict()
+    assert reporte['bytes_antes'] == sum(c['bytes_antes'] for c in columnas.values())
+    assert reporte['bytes_despues'] == sum(c['bytes_despues'] for c in columnas.values())
+    assert 0 < reporte['ahorro'] == 1 - reporte['bytes_despues'] / reporte['bytes_antes']
+    
+    assert columnas['PRECIO CALDAS']['bytes_despues'] == columnas['PRECIO CALDAS']['bytes_antes']
+    precio = columnas['PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL']
+    assert (precio['tipo'], precio['bytes_despues'] * 2) == ('float32', precio['bytes_antes'])
+    assert columnas['TIPO MADERA']['tipo'] == 'category'
+    assert columnas['TIPO MADERA']['bytes_despues'] < columnas['TIPO MADERA']['bytes_antes']
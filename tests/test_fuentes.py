@@ -0,0 +1,86 @@
+"""Combinación de varias fuentes de precios en un solo catálogo."""
+import pandas as pd
+
+from Cotizador import FuenteCatalogo, combinar_fuentes_catalogo, leer_fuentes_catalogo
+
+CALDAS = ['PRECIO CALDAS', 'PRECIO CALDAS CON IVA']
+CHAGUALO = ['PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL', 'PRECIO CHAGUALO, GIRARDOTA, SAN CRISTOBAL IVA INCLUIDO']
+
+# Listado principal: solo precios de Caldas y la columna USO
+PRINCIPAL = pd.DataFrame({
+    'Referencia': ['ALF-001', 'TAB-002', 'EST-003'],
+    'DESCRIPCION': ['ALFARDA 3 M', '', 'ESTACÓN 2.5 M'],
+    'USO': ['CONSTRUCCION', 'CONSTRUCCION', 'CERCOS'],
+    CALDAS[0]: [10000.0, 0.0, 8000.0],
+    CALDAS[1]: [11900.0, 0.0, 8400.0],
+})
+
+# Lista secundaria: trae además Chagualo, una referencia nueva y otra columna
+SECUNDARIA = pd.DataFrame({
+    'Referencia': [' alf-001 ', 'TAB-002', 'VAR-005'],
+    'DESCRIPCION': ['OTRA DESCRIPCION', 'TABLA 2X4', 'VARETA 3 M'],
+    'GARANTIA': ['20 AÑOS', '', 'SIN GARANTIA'],
+    CALDAS[0]: [9800.0, 5000.0, 3500.0],
+    CALDAS[1]: [11662.0, 5950.0, 4165.0],
+    CHAGUALO[0]: [10500.0, 0.0, 3600.0],
+    CHAGUALO[1]: [12495.0, 0.0, 4284.0],
+})
+
+def combinar(*tablas):
+    return combinar_fuentes_catalogo([(f'fuente{i}', df.copy()) for i, df in enumerate(tablas, start=1)])
+
+def precios(df, referencia, columnas):
+    fila = df.index[df['Referencia'].str.strip().str.upper() == referencia][0]
+    return df.loc[fila, columnas].tolist()
+
+def test_precedencia_y_referencias_nuevas():
+    df, _, resumen = combinar(PRINCIPAL, SECUNDARIA)
+    # Las filas de la primera fuente van primero y en su orden
+    assert df['Referencia'].tolist() == ['ALF-001', 'TAB-002', 'EST-003', 'VAR-005']
+    assert df['DESCRIPCION'].tolist() == ['ALFARDA 3 M', 'TABLA 2X4', 'ESTACÓN 2.5 M', 'VARETA 3 M']
+    # Caldas: manda la principal; donde no tiene precio se completa con la secundaria
+    assert precios(df, 'ALF-001', CALDAS) == [10000, 11900]
+    assert precios(df, 'TAB-002', CALDAS) == [5000, 5950]
+    # Completadas: descripción de TAB-002, garantía de ALF-001 y los precios de Caldas de TAB-002 y de Chagualo de ALF-001
+    assert resumen == {
+        'fuente1': {'filas': 3, 'agregadas': 3, 'completadas': 0},
+        'fuente2': {'filas': 3, 'agregadas': 1, 'completadas': 4},
+    }
+
+def test_columnas_de_una_sola_fuente():
+    df, conflictos, _ = combinar(PRINCIPAL, SECUNDARIA)
+    # Precios de Chagualo que la principal no tenía: salen de la secundaria o quedan en 0
+    assert precios(df, 'ALF-001', CHAGUALO) == [10500, 12495]
+    assert precios(df, 'EST-003', CHAGUALO) == [0, 0]
+    assert precios(df, 'VAR-005', CHAGUALO) == [3600, 4284]
+    # Textos que solo trae una de las dos fuentes
+    assert df['USO'].tolist() == ['CONSTRUCCION', 'CONSTRUCCION', 'CERCOS', '']
+    assert df['GARANTIA'].tolist() == ['20 AÑOS', '', '', 'SIN GARANTIA']
+    assert [c['columna'] for c in conflictos] == [CALDAS[0]]
+
+def test_conflictos_de_precio():
+    tercera = pd.DataFrame({
+        'Referencia': ['ALF-001', 'VAR-005'],
+        CHAGUALO[0]: [11000.0, 3600.4],
+        CHAGUALO[1]: [13090.0, 4284.5],
+    })
+    _, conflictos, _ = combinar(PRINCIPAL, SECUNDARIA, tercera)
+    # Diferencias de centavos no son conflicto; el grupo de Chagualo tiene como origen la secundaria
+    assert conflictos == [
+        {'referencia': 'ALF-001', 'columna': CALDAS[0], 'fuente': 'fuente1', 'valor': 10000.0,
+         'fuente_descartada': 'fuente2', 'valor_descartado': 9800.0},
+        {'referencia': 'ALF-001', 'columna': CHAGUALO[0], 'fuente': 'fuente2', 'valor': 10500.0,
+         'fuente_descartada': 'fuente3', 'valor_descartado': 11000.0},
+    ]
+
+def test_leer_fuentes_en_archivos(tmp_path):
+    fuentes = []
+    for nombre, df in (('principal', PRINCIPAL), ('secundaria', SECUNDARIA)):
+        ruta = tmp_path / f'{nombre}.xlsx'
+        df.to_excel(ruta, index=False)
+        fuentes.append(FuenteCatalogo(str(ruta)))
+    df, precios_invalidos, conflictos, resumen = leer_fuentes_catalogo(fuentes)
+    assert len(df) == 4 and list(resumen) == ['principal', 'secundaria']
+    assert precios(df, 'VAR-005', CALDAS + CHAGUALO) == [3500, 4165, 3600, 4284]
+    assert [(c['fuente'], c['fuente_descartada']) for c in conflictos] == [('principal', 'secundaria')]
+    assert precios_invalidos == []
@@ -0,0 +1,105 @@
+"""Numeración de cotizaciones: números únicos y crecientes entre hilos, instancias y procesos."""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from Cotizador import AsignadorNumeros, RepositorioCotizaciones
+
+FECHA = datetime(2025, 9, 15)
+
+def secuencia(numero):
+    return int(numero.rsplit('-', 1)[1])
+
+def pedir_numeros(ruta, cantidad, tamano_bloque):
+    """Tarea de un proceso: su propio asignador sobre la base compartida"""
+    asignador = AsignadorNumeros(ruta, tamano_bloque)
+    return [asignador.siguiente(FECHA) for _ in range(cantidad)]
+
+@pytest.fixture
+def ruta(tmp_path):
+    return str(tmp_path / 'cotizaciones.db')
+
+@pytest.fixture(scope='module')
+def procesos():
+    """Procesos nuevos (spawn), como instancias independientes de la aplicación.
+    
+    Un hijo de fork heredaría las conexiones SQLite abiertas del padre, y SQLite
+    no admite usarlas al otro lado del fork.
+    """
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context('spawn')) as pool:
+        yield pool
+
+def test_formato_y_sufijo_sin_vuelta():
+    assert AsignadorNumeros.formatear('202509', 7) == 'COT-CONST-202509-000007'
+    assert AsignadorNumeros.formatear('202509', 1234567) == 'COT-CONST-202509-1234567'
+
+def test_cada_mes_tiene_su_secuencia(ruta):
+    asignador = AsignadorNumeros(ruta)
+    assert asignador.siguiente(FECHA) == 'COT-CONST-202509-000001'
+    assert asignador.siguiente(FECHA) == 'COT-CONST-202509-000002'
+    assert asignador.siguiente(datetime(2025, 10, 1)) == 'COT-CONST-202510-000001'
+
+def test_reservar_bloque(ruta):
+    asignador = AsignadorNumeros(ruta)
+    assert asignador.reservar_bloque(5, FECHA) == ('202509', 1, 5)
+    assert asignador.reservar_bloque(3, FECHA) == ('202509', 6, 8)
+    assert asignador.numeros(2, FECHA) == ['COT-CONST-202509-000009', 'COT-CONST-202509-000010']
+    with pytest.raises(ValueError):
+        asignador.reservar_bloque(0, FECHA)
+
+@pytest.mark.parametrize('tamano_bloque', [1, 7])
+def test_hilos_sin_repetidos(ruta, tamano_bloque):
+    asignador = AsignadorNumeros(ruta, tamano_bloque)
+    por_hilo = [[] for _ in range(8)]
+    inicio = threading.Barrier(len(por_hilo))
+    
+    def trabajar(numeros):
+        inicio.wait()
+        for _ in range(50):
+            numeros.append(asignador.siguiente(FECHA))
+    
+    hilos = [threading.Thread(target=trabajar, args=(numeros,)) for numeros in por_hilo]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    
+    todos = [secuencia(numero) for numeros in por_hilo for numero in numeros]
+    assert len(set(todos)) == 400
+    for numeros in por_hilo:
+        assert numeros == sorted(numeros, key=secuencia)
+    if tamano_bloque == 1:
+        assert sorted(todos) == list(range(1, 401))
+
+def test_instancias_con_bloques_no_se_pisan(ruta):
+    # Dos asignadores sobre la misma base hacen de dos procesos
+    a = AsignadorNumeros(ruta, tamano_bloque=10)
+    b = AsignadorNumeros(ruta, tamano_bloque=10)
+    de_a, de_b = [], []
+    for _ in range(25):
+        de_a.append(secuencia(a.siguiente(FECHA)))
+        de_b.append(secuencia(b.siguiente(FECHA)))
+    assert set(de_a).isdisjoint(de_b)
+    assert de_a == sorted(de_a) and de_b == sorted(de_b)
+    assert de_a[:10] == list(range(1, 11))
+    assert de_b[:10] == list(range(11, 21))
+
+@pytest.mark.parametrize('tamano_bloque', [1, 5])
+def test_procesos_sin_repetidos(procesos, ruta, tamano_bloque):
+    AsignadorNumeros(ruta)  # crea el esquema antes de que arranquen los procesos
+    resultados = list(procesos.map(pedir_numeros, [ruta] * 4, [100] * 4, [tamano_bloque] * 4))
+    todos = [secuencia(numero) for numeros in resultados for numero in numeros]
+    assert len(set(todos)) == 400
+    for numeros in resultados:
+        assert numeros == sorted(numeros, key=secuencia)
+    if tamano_bloque == 1:
+        assert sorted(todos) == list(range(1, 401))
+
+def test_repositorio_comparte_la_secuencia(ruta):
+    repositorio = RepositorioCotizaciones(ruta)
+    assert repositorio.siguiente_numero(FECHA) == 'COT-CONST-202509-000001'
+    assert AsignadorNumeros(ruta).siguiente(FECHA) == 'COT-CONST-202509-000002'
+    assert repositorio.siguiente_numero(FECHA) == 'COT-CONST-202509-000003'
@@ -0,0 +1,70 @@
+"""PDF de la cotización: datos del usuario con caracteres de marcado y cotizaciones extensas."""
+import itertools
+import re
+
+from Cotizador import PlantillaPDF, obtener_plantilla_pdf
+
+CLIENTE_CON_MARCADO = {
+    'nombre': 'Cliente <b>Pruebas',
+    'nit_cedula': '900 & 1',
+    'empresa': 'Maderas <i> & Cia',
+    'telefono': '<3',
+    'email': 'a@b.co'
+}
+
+def cotizacion_de_prueba(generador, cliente=None):
+    productos = generador.buscar_por_referencia(['ALF-001', 'TAB-002'])['resultados']
+    productos = [dict(producto, cantidad=2) for producto in productos]
+    return generador.generar_cotizacion(productos, cliente or CLIENTE_CON_MARCADO, {'numero_cotizacion': 'COT-<1>'})
+
+def texto_de(flowable):
+    return ' '.join(celda.getPlainText() for fila in flowable._cellvalues for celda in fila if hasattr(celda, 'getPlainText'))
+
+def test_cliente_con_marcado_se_imprime_literal(generador):
+    cotizacion = cotizacion_de_prueba(generador)
+    texto = texto_de(obtener_plantilla_pdf().bloque_cliente(cotizacion))
+    assert 'Cliente <b>Pruebas' in texto
+    assert 'Maderas <i> & Cia' in texto
+    assert '900 & 1' in texto
+
+def test_empresa_con_marcado_se_imprime_literal():
+    plantilla = obtener_plantilla_pdf()
+    empresa = {'nombre': 'Madera & <Hijos>', 'nit': '1', 'direccion': 'Calle <5>', 'telefono': '2', 'ciudad': 'Caldas'}
+    texto = texto_de(plantilla.encabezado(empresa, 'COT-1'))
+    assert 'Madera & <Hijos>' in texto
+    assert 'Calle <5>' in texto
+
+def test_construir_pdf_con_marcado(generador):
+    cotizacion = cotizacion_de_prueba(generador)
+    cotizacion['condiciones'] = ['Pago < 30 días & sin <b>recargo']
+    empresa = {'nombre': 'Madera & <Hijos>', 'nit': '1', 'direccion': 'Calle <5>', 'telefono': '2', 'ciudad': 'Caldas'}
+    pdf = PlantillaPDF().construir(cotizacion, empresa).getvalue()
+    assert pdf.startswith(b'%PDF')
+
+def cotizacion_extensa(generador, lineas=200):
+    productos = generador.buscar_por_referencia(['ALF-001', 'TAB-002', 'EST-003', 'EST-004', 'VAR-005'])['resultados']
+    items = [dict(productos[i % len(productos)], cantidad=1 + i % 7) for i in range(lineas)]
+    return generador.generar_cotizacion(items, {'nombre': 'Cliente'}, {'numero_cotizacion': 'COT-1'})
+
+def test_extensa_una_sola_tabla_que_ajusta_el_texto(generador):
+    cotizacion = cotizacion_extensa(generador, lineas=3)
+    cotizacion['items'][0]['descripcion'] = 'ALFARDA ' * 12
+    tabla = obtener_plantilla_pdf().tabla_productos_extensa(cotizacion['items'])
+    descripcion = tabla._cellvalues[1][1]
+    assert '\n' in descripcion
+    assert descripcion.split() == cotizacion['items'][0]['descripcion'].split()
+    assert len(tabla._cellvalues) == 4
+    assert tabla.repeatRows == 1
+
+def test_extensa_subtotal_por_hoja_y_acumulado(monkeypatch, generador):
+    monkeypatch.setattr('reportlab.rl_config.pageCompression', 0)
+    cotizacion = cotizacion_extensa(generador)
+    pdf = PlantillaPDF().construir(cotizacion).getvalue()
+    pies = re.findall(rb'\(Subtotal hoja (\d+): \$ ([\d.]+) +Acumulado: \$ ([\d.]+)\) Tj', pdf)
+    hojas = [int(hoja) for hoja, _, _ in pies]
+    subtotales = [int(subtotal.replace(b'.', b'')) for _, subtotal, _ in pies]
+    acumulados = [int(acumulado.replace(b'.', b'')) for _, _, acumulado in pies]
+    assert len(hojas) > 2
+    assert hojas == list(range(1, len(hojas) + 1))
+    assert acumulados == list(itertools.accumulate(subtotales))
+    assert acumulados[-1] == cotizacion['resumen']['subtotal_numerico']
@@ -0,0 +1,80 @@
+"""Importación de pedidos desde CSV/Excel y su cruce con el catálogo."""
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+from Cotizador import leer_archivo_pedido
+
+def escribir(tmp_path, nombre, contenido):
+    ruta = tmp_path / nombre
+    ruta.write_text(contenido, encoding='utf-8')
+    return str(ruta)
+
+def test_csv_con_encabezados(tmp_path):
+    pedido = leer_archivo_pedido(escribir(tmp_path, 'pedido.csv', 'Referencia,Cantidad\nALF-001,3\nEST-003,10\n'))
+    assert pedido['referencia'].tolist() == ['ALF-001', 'EST-003']
+    assert pedido['cantidad'].tolist() == ['3', '10']
+
+def test_csv_con_alias_tildes_y_punto_y_coma(tmp_path):
+    pedido = leer_archivo_pedido(escribir(tmp_path, 'pedido.csv', 'Descripción;Unidades;Código\nAlfarda;3;ALF-001\n'))
+    assert pedido.to_dict('records') == [{'referencia': 'ALF-001', 'cantidad': '3'}]
+
+def test_csv_sin_encabezados_conserva_la_primera_linea(tmp_path):
+    pedido = leer_archivo_pedido(escribir(tmp_path, 'pedido.csv', 'ALF-001,3\nEST-003,10\n'))
+    assert pedido['referencia'].tolist() == ['ALF-001', 'EST-003']
+    assert pedido['cantidad'].tolist() == ['3', '10']
+
+def test_csv_sin_encabezados_de_una_linea(tmp_path):
+    pedido = leer_archivo_pedido(escribir(tmp_path, 'pedido.csv', 'ALF-001;3\n'))
+    assert pedido.to_dict('records') == [{'referencia': 'ALF-001', 'cantidad': '3'}]
+
+def test_encabezados_desconocidos_se_toman_por_posicion(tmp_path):
+    pedido = leer_archivo_pedido(escribir(tmp_path, 'pedido.csv', 'producto,pedidas\nALF-001,3\n'))
+    assert pedido.to_dict('records') == [{'referencia': 'ALF-001', 'cantidad': '3'}]
+
+def test_excel_con_y_sin_encabezados(tmp_path):
+    con = tmp_path / 'con.xlsx'
+    sin = tmp_path / 'sin.xlsx'
+    pd.DataFrame({'ref': ['ALF-001', 'EST-003'], 'cant': [3, 10]}).to_excel(con, index=False)
+    pd.DataFrame([['ALF-001', 3], ['EST-003', 10]]).to_excel(sin, index=False, header=False)
+    for ruta in (con, sin):
+        pedido = leer_archivo_pedido(str(ruta))
+        assert pedido['referencia'].tolist() == ['ALF-001', 'EST-003'], ruta
+        assert pedido['cantidad'].tolist() == ['3', '10'], ruta
+
+def test_archivo_subido_sin_encabezados():
+    archivo = BytesIO(b'ALF-001,3\nEST-003,10\n')
+    archivo.name = 'pedido.csv'
+    assert len(leer_archivo_pedido(archivo)) == 2
+
+def test_cantidad_con_coma_decimal_y_punto_y_coma(tmp_path):
+    pedido = leer_archivo_pedido(escribir(tmp_path, 'pedido.csv', 'referencia;cantidad\nALF-001;2,5\nEST-003;1\n'))
+    assert pedido['cantidad'].tolist() == ['2,5', '1']
+
+def test_una_sola_columna(tmp_path):
+    with pytest.raises(ValueError):
+        leer_archivo_pedido(escribir(tmp_path, 'pedido.csv', 'ALF-001\nEST-003\n'))
+
+def test_resolver_pedido_separa_las_lineas_con_problemas(generador):
+    pedido = pd.DataFrame({
+        'referencia': ['ALF-001', 'NO-EXISTE', 'est-004', 'VAR-005', 'ALF-001', None],
+        'cantidad': ['3', '1', '2,5', '4', 'cero', '1']
+    })
+    resuelto = generador.resolver_pedido(pedido, ubicacion='chagualo')
+    assert [(p['referencia'], p['cantidad'], p['linea']) for p in resuelto['productos']] == [
+        ('ALF-001', 3.0, 1), ('EST-004', 2.5, 3)
+    ]
+    assert [l['linea'] for l in resuelto['no_encontradas']] == [2]
+    # VAR-005 no tiene precio en Chagualo
+    assert [l['referencia'] for l in resuelto['sin_precio']] == ['VAR-005']
+    assert [(l['linea'], l['valor']) for l in resuelto['cantidades_invalidas']] == [(5, 'cero')]
+    assert resuelto['mensaje'] == '2 de 6 líneas del pedido listas para cotizar'
+
+def test_cantidades_enteras_quedan_enteras(generador):
+    resuelto = generador.resolver_pedido(pd.DataFrame({'referencia': ['ALF-001', 'EST-003'], 'cantidad': ['3', '10']}))
+    assert [type(p['cantidad']) for p in resuelto['productos']] == [int, int]
+
+def test_pedido_de_archivo_sin_encabezados_cuenta_todas_las_lineas(tmp_path, generador):
+    resuelto = generador.importar_pedido(escribir(tmp_path, 'pedido.csv', 'ALF-001,3\nEST-003,10\n'))
+    assert resuelto['mensaje'] == '2 de 2 líneas del pedido listas para cotizar'
@@ -0,0 +1,53 @@
+"""Limpieza de precios: la versión por columna coincide con la de celda por celda."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from Cotizador import limpiar_catalogo, limpiar_columna_precio, limpiar_precio
+
+VALORES = [
+    # Separadores de miles y signo pesos
+    '1,234,567', '12,500.50', '$ 12,500', '$12.500', '$1,234.5', ' 8400 ', '1.234.567',
+    # En blanco y vacíos
+    '', '   ', None, np.nan,
+    # Texto
+    'abc', 'N/A', 'CONSULTAR', '12 abc 3', '.', ',',
+    # Negativos
+    '-5000', '-$ 1,200.75', -3500, -0.5,
+    # Números ya leídos por Excel
+    0, 8400, 3524.21, 1e-5, 1e17, np.inf,
+]
+
+@pytest.mark.parametrize('valor', VALORES)
+def test_igual_que_celda_por_celda(valor):
+    limpio, _ = limpiar_columna_precio(pd.Series([valor], dtype=object))
+    assert limpio.iat[0] == limpiar_precio(valor)
+
+def test_columna_mixta_y_columna_numerica():
+    serie = pd.Series(VALORES, dtype=object, index=range(10, 10 + len(VALORES)), name='PRECIO CALDAS')
+    limpio, _ = limpiar_columna_precio(serie)
+    assert limpio.tolist() == [limpiar_precio(valor) for valor in VALORES]
+    assert limpio.index.equals(serie.index) and limpio.name == 'PRECIO CALDAS'
+    
+    numeros = pd.Series([-3500, 0, 8400.0, 3524.21, np.nan, 1e-5, 1e17, np.inf])
+    limpio, fallidas = limpiar_columna_precio(numeros)
+    assert limpio.tolist() == [limpiar_precio(valor) for valor in numeros]
+    # Solo el infinito cuenta como precio no interpretable
+    assert fallidas.tolist() == [False] * 7 + [True]
+
+def test_precios_invalidos_se_reportan():
+    df = pd.DataFrame({
+        'Referencia': [' ALF-001 ', 'TAB-002', 'EST-003', 'EST-004'],
+        'DESCRIPCION': ['ALFARDA', 'TABLA', 'ESTACÓN', 'ESTACÓN'],
+        'PRECIO CALDAS': ['$ 10,000', 'CONSULTAR', '', '1.234.567'],
+        'PRECIO CALDAS CON IVA': [11900, 5950, None, 'N/A'],
+    })
+    limpio, precios_invalidos = limpiar_catalogo(df)
+    # En blanco queda en 0 sin reportarse; el texto no interpretable queda en 0 y se reporta
+    assert limpio['PRECIO CALDAS'].tolist() == [10000, 0, 0, 0]
+    assert limpio['PRECIO CALDAS CON IVA'].tolist() == [11900, 5950, 0, 0]
+    assert precios_invalidos == [
+        {'fila': 1, 'referencia': 'TAB-002', 'columna': 'PRECIO CALDAS', 'valor': 'CONSULTAR'},
+        {'fila': 3, 'referencia': 'EST-004', 'columna': 'PRECIO CALDAS', 'valor': '1.234.567'},
+        {'fila': 3, 'referencia': 'EST-004', 'columna': 'PRECIO CALDAS CON IVA', 'valor': 'N/A'},
+    ]
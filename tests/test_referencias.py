@@ -0,0 +1,37 @@
+"""Consulta de productos por referencia."""
+from Cotizador import GeneradorCotizacionesMadera
+
+def test_varias_referencias_en_una_llamada(generador):
+    resultado = generador.buscar_por_referencia(['EST-004', 'ALF-001', 'NO-EXISTE'])
+    assert resultado['exito'] is True
+    assert [r['referencia'] for r in resultado['resultados']] == ['EST-004', 'ALF-001']
+    assert resultado['no_encontradas'] == ['NO-EXISTE']
+    assert resultado['total'] == 2
+
+def test_referencia_sin_importar_espacios_ni_mayusculas(generador):
+    resultado = generador.buscar_por_referencia(['  est-003', 'ALF-006'])
+    assert [r['referencia'] for r in resultado['resultados']] == ['EST-003', ' alf-006 ']
+    assert resultado['no_encontradas'] == []
+
+def test_precio_segun_sede_e_iva(generador):
+    caldas = generador.buscar_por_referencia(['ALF-001'])['resultados'][0]
+    chagualo = generador.buscar_por_referencia(['ALF-001'], ubicacion='chagualo', incluir_iva=False)['resultados'][0]
+    assert caldas['precio_numerico'] == 11900
+    assert chagualo['precio_numerico'] == 10500
+    assert chagualo['precio'] == '$ 10.500'
+    assert caldas['precios'] == chagualo['precios']
+
+def test_referencia_repetida_en_el_catalogo_gana_la_primera(productos, generador):
+    productos.loc[len(productos)] = productos.iloc[0].tolist()
+    productos.loc[len(productos) - 1, 'DESCRIPCION'] = 'DUPLICADA'
+    resultado = generador.buscar_por_referencia(['ALF-001'])
+    assert resultado['resultados'][0]['descripcion'] == 'ALFARDA 3 M 4X4 CM'
+
+def test_ninguna_encontrada(generador):
+    resultado = generador.buscar_por_referencia(['X', 'Y'])
+    assert resultado['exito'] is False
+    assert resultado['resultados'] == []
+    assert resultado['no_encontradas'] == ['X', 'Y']
+
+def test_sin_catalogo():
+    assert GeneradorCotizacionesMadera().buscar_por_referencia(['ALF-001'])['exito'] is False
@@ -0,0 +1,73 @@
+"""Historial de cotizaciones: filtros por cliente, referencia, fechas y límite."""
+from datetime import date, datetime
+
+import pytest
+
+from Cotizador import RepositorioCotizaciones, _fecha_iso
+
+# (número, fecha, NIT del cliente, referencias cotizadas)
+COTIZACIONES = [
+    ('COT-1', '05/01/2025', '900.123.456-7', ['ALF-001']),
+    ('COT-2', '20/02/2025', '900123456-7', ['EST-003', 'TAB-002']),
+    ('COT-3', '20/02/2025', '71.555.222', ['ALF-001', 'EST-004']),
+    ('COT-4', '01/12/2025', '71555222', ['TAB-002']),
+]
+
+@pytest.fixture
+def repositorio(tmp_path, generador):
+    repositorio = RepositorioCotizaciones(str(tmp_path / 'cotizaciones.db'))
+    cotizaciones = []
+    for numero, fecha, nit, referencias in COTIZACIONES:
+        items = generador.buscar_por_referencia(referencias)['resultados']
+        cotizacion = generador.generar_cotizacion(
+            [dict(item, cantidad=1) for item in items], {'nombre': f'Cliente {numero}', 'nit_cedula': nit},
+            {'numero_cotizacion': numero}
+        )
+        cotizaciones.append(dict(cotizacion, fecha=fecha, fecha_vencimiento=fecha))
+    repositorio.guardar_varias(cotizaciones)
+    return repositorio
+
+def numeros(resultado):
+    return [fila['numero'] for fila in resultado['resultados']]
+
+@pytest.mark.parametrize('fecha', ['20/02/2025', '2025-02-20', ' 2025-02-20T08:30:00 ', date(2025, 2, 20), datetime(2025, 2, 20, 17)])
+def test_fecha_iso(fecha):
+    assert _fecha_iso(fecha) == '2025-02-20'
+
+@pytest.mark.parametrize('fecha', ['20-02-2025', '2025/02/20', '31/02/2025', 'ayer'])
+def test_fecha_iso_invalida(fecha):
+    with pytest.raises(ValueError, match='dd/mm/aaaa o aaaa-mm-dd'):
+        _fecha_iso(fecha)
+
+def test_sin_filtros_mas_recientes_primero(repositorio):
+    resultado = repositorio.buscar()
+    assert numeros(resultado) == ['COT-4', 'COT-3', 'COT-2', 'COT-1']
+    assert resultado['total'] == 4
+    assert resultado['resultados'][0]['fecha'] == '2025-12-01'
+
+def test_por_cliente_con_nit_en_cualquier_formato(repositorio):
+    assert numeros(repositorio.buscar(nit='900123456-7')) == ['COT-2', 'COT-1']
+    assert numeros(repositorio.buscar(nit='71 555 222')) == ['COT-4', 'COT-3']
+    assert repositorio.buscar(nit='123')['total'] == 0
+
+def test_por_referencia(repositorio):
+    assert numeros(repositorio.buscar(referencia='alf-001')) == ['COT-3', 'COT-1']
+    assert numeros(repositorio.buscar(nit='71555222', referencia='TAB-002')) == ['COT-4']
+
+@pytest.mark.parametrize('desde, hasta', [
+    ('20/02/2025', '30/11/2025'),
+    ('2025-02-20', '2025-11-30'),
+    (date(2025, 2, 20), datetime(2025, 11, 30)),
+])
+def test_por_rango_de_fechas(repositorio, desde, hasta):
+    assert numeros(repositorio.buscar(desde=desde, hasta=hasta)) == ['COT-3', 'COT-2']
+    assert numeros(repositorio.buscar(desde=desde)) == ['COT-4', 'COT-3', 'COT-2']
+    assert numeros(repositorio.buscar(hasta=hasta)) == ['COT-3', 'COT-2', 'COT-1']
+
+def test_fecha_invalida_en_el_filtro(repositorio):
+    with pytest.raises(ValueError):
+        repositorio.buscar(desde='febrero')
+
+def test_limite(repositorio):
+    assert numeros(repositorio.buscar(limite=2)) == ['COT-4', 'COT-3']
+    assert numeros(repositorio.buscar(nit='900123456-7', limite=1)) == ['COT-2']
@@ -0,0 +1,96 @@
+"""Matriz de precios por sede e IVA y totales de la cotización en pesos enteros."""
+import numpy as np
+import pytest
+
+from Cotizador import POSICION_SEDE, matriz_precios, matriz_precios_items, redondear_pesos, totales_cotizacion
+
+def seleccion(generador, cantidades):
+    productos = generador.buscar_por_referencia(list(cantidades))['resultados']
+    return [dict(producto, cantidad=cantidades[producto['referencia']]) for producto in productos]
+
+def test_redondear_pesos():
+    valores = [0.5, 1.5, 2.4999999999, 3524.49, 3524.5, np.nan, 10572.63]
+    assert redondear_pesos(valores).tolist() == [1, 2, 3, 3524, 3525, 0, 10573]
+    assert redondear_pesos(valores).dtype == np.int64
+
+def test_matriz_precios_por_sede_e_iva(productos):
+    matriz = matriz_precios(productos)
+    assert matriz.shape == (6, 2, 2)
+    assert matriz[0].tolist() == [[10000, 11900], [10500, 12495]]
+    assert matriz[0, POSICION_SEDE['chagualo'], 1] == 12495
+
+def test_matriz_de_items_igual_a_la_del_catalogo(generador, productos):
+    items = seleccion(generador, {'EST-004': 1, 'ALF-001': 1})
+    assert np.array_equal(matriz_precios_items(items), matriz_precios(productos)[[3, 0]])
+    # Un item sin el detalle de precios usa su precio en todas las variantes
+    assert matriz_precios_items([{'precio_numerico': 7}]).tolist() == [[[7, 7], [7, 7]]]
+
+def test_precio_editado_gana_en_su_variante(generador):
+    items = seleccion(generador, {'ALF-001': 2})
+    items[0]['precio_numerico'] = 9000
+    assert matriz_precios_items(items).tolist() == [[[10000, 9000], [10500, 12495]]]
+    cotizacion = generador.generar_cotizacion(items, {'nombre': 'Cliente'}, {'numero_cotizacion': 'COT-1'})
+    assert cotizacion['items'][0]['precio_unitario_numerico'] == 9000
+    assert cotizacion['resumen']['total_numerico'] == 18000
+    # Las demás sedes siguen con el precio del catálogo
+    assert generador.comparar_sedes(items)['sedes']['chagualo']['total_numerico'] == 24990
+    
+    # Sin sede propia, el precio editado es el de la variante de la cotización
+    sin_sede = [{'precio_numerico': 5, 'precios': items[0]['precios']}]
+    assert matriz_precios_items(sin_sede, 'chagualo', False).tolist() == [[[10000, 11900], [5, 12495]]]
+
+def test_precios_incompletos_usan_el_precio_numerico():
+    items = [{'precio_numerico': 7, 'precios': {'chagualo_con_iva': 12}}, {'precios': {'caldas_sin_iva': 3}}]
+    assert matriz_precios_items(items).tolist() == [[[7, 7], [7, 12]], [[3, 0], [0, 0]]]
+
+def test_totales_suman_lineas_redondeadas():
+    precios = np.array([[[3524.21, 4193.81], [0, 0]], [[1000.5, 1190.5], [999.5, 1189.5]]])
+    totales = totales_cotizacion(precios, [3, 1], descuento=7.5)
+    assert totales['lineas'][:, 0, 0].tolist() == [10573, 1001]
+    assert np.array_equal(totales['subtotal'], totales['lineas'].sum(axis=0))
+    # 11.574 × 7,5 % = 868,05 y 13.772 × 7,5 % = 1.032,9
+    assert totales['descuento'].tolist() == [[868, 1033], [75, 89]]
+    assert np.array_equal(totales['total'], totales['subtotal'] - totales['descuento'])
+
+@pytest.mark.parametrize('ubicacion, incluir_iva', [('caldas', True), ('caldas', False), ('chagualo', True), ('chagualo', False)])
+def test_cotizacion_en_cada_sede(generador, productos, ubicacion, incluir_iva):
+    items = seleccion(generador, {'ALF-001': 2, 'EST-003': 3, 'TAB-002': 1})
+    cotizacion = generador.generar_cotizacion(items, {'nombre': 'Cliente'}, {
+        'ubicacion': ubicacion, 'incluir_iva': incluir_iva, 'descuento': 5, 'numero_cotizacion': 'COT-1'
+    })
+    precios = matriz_precios(productos)[[0, 2, 1], POSICION_SEDE[ubicacion], int(incluir_iva)]
+    assert [item['precio_unitario_numerico'] for item in cotizacion['items']] == precios.tolist()
+    assert [item['total_numerico'] for item in cotizacion['items']] == (precios * [2, 3, 1]).astype(int).tolist()
+    
+    resumen = cotizacion['resumen']
+    assert resumen['subtotal_numerico'] == sum(item['total_numerico'] for item in cotizacion['items'])
+    assert resumen['descuento_numerico'] == int(redondear_pesos(resumen['subtotal_numerico'] * 0.05))
+    assert resumen['total_numerico'] == resumen['subtotal_numerico'] - resumen['descuento_numerico']
+    assert all(type(resumen[campo]) is int for campo in ('subtotal_numerico', 'descuento_numerico', 'total_numerico'))
+    
+    comparacion = generador.comparar_sedes(items, incluir_iva=incluir_iva, descuento=5)
+    assert comparacion['sedes'][ubicacion]['total_numerico'] == resumen['total_numerico']
+
+def test_centavos_se_redondean_por_linea(generador):
+    items = seleccion(generador, {'VAR-005': 3})
+    cotizacion = generador.generar_cotizacion(items, {'nombre': 'Cliente'}, {'incluir_iva': False, 'numero_cotizacion': 'COT-1'})
+    # 3 × 3.524,21 = 10.572,63
+    assert cotizacion['items'][0]['total_numerico'] == 10573
+    assert cotizacion['resumen']['total'] == '$ 10.573'
+
+def test_comparar_sedes(generador):
+    items = seleccion(generador, {'ALF-001': 2, 'EST-003': 1})
+    con_iva = generador.comparar_sedes(items)
+    assert {sede: datos['total_numerico'] for sede, datos in con_iva['sedes'].items()} == {'caldas': 32200, 'chagualo': 33600}
+    assert con_iva['mas_economica'] == 'caldas'
+    assert con_iva['diferencia_numerica'] == 1400
+    assert con_iva['diferencia'] == '$ 1.400'
+    
+    sin_iva = generador.comparar_sedes(items, incluir_iva=False, descuento=10)
+    assert sin_iva['sedes']['caldas'] == {
+        'subtotal_numerico': 28000, 'descuento_numerico': 2800, 'total_numerico': 25200, 'total': '$ 25.200'
+    }
+    assert sin_iva['sedes']['chagualo']['total_numerico'] == 26280
+
+def test_comparar_sedes_sin_productos(generador):
+    assert generador.comparar_sedes([])['exito'] is False